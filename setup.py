@@ -89,6 +89,7 @@ setup(
     long_description='',
     packages=find_packages('src/python'),
     install_requires=[
+      "numpy",
       "z3-solver",
       "dask",
       "distributed"
@@ -12,10 +12,13 @@
 
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
+#include <pybind11/functional.h>
 #include <pybind11/cast.h>
+#include <pybind11/numpy.h>
 
 #include "domain.h"
 #include "tree.h"
+#include "compiled.h"
 #include "domtree.h"
 #include "graph.h"
 
@@ -38,6 +41,61 @@ encode_split(const DomTreeSplit& split)
     return py::make_tuple(i, split.split);
 }
 
+static
+std::vector<DomTreeSplit>
+decode_splits(const std::vector<std::tuple<size_t, Split>>& splits)
+{
+    std::vector<DomTreeSplit> result;
+    for (auto& [i, split] : splits)
+        result.push_back({i, split});
+    return result;
+}
+
+template <typename T>
+using CArrayT = py::array_t<T, py::array::c_style | py::array::forcecast>;
+
+template <typename M, typename T> // M is CompiledAddTree
+static
+py::array_t<double>
+addtree_predict(const M& at, CArrayT<T> X, int nthreads)
+{
+    py::buffer_info buf = X.request();
+    if (buf.ndim != 2)
+        throw std::runtime_error("AddTree.predict: expected a 2-D array");
+
+    size_t nrows = buf.shape[0];
+    size_t ncols = buf.shape[1];
+    py::array_t<double> out(nrows);
+    const T *data = static_cast<const T *>(buf.ptr);
+    double *out_data = out.mutable_data();
+    {
+        py::gil_scoped_release release;
+        at.predict(data, nrows, ncols, out_data, nthreads);
+    }
+    return out;
+}
+
+template <typename M, typename T>
+static
+py::array_t<NodeId>
+addtree_predict_leafs(const M& at, CArrayT<T> X, int nthreads)
+{
+    py::buffer_info buf = X.request();
+    if (buf.ndim != 2)
+        throw std::runtime_error("AddTree.predict_leafs: expected a 2-D array");
+
+    size_t nrows = buf.shape[0];
+    size_t ncols = buf.shape[1];
+    py::array_t<NodeId> out({nrows, at.size()});
+    const T *data = static_cast<const T *>(buf.ptr);
+    NodeId *out_data = out.mutable_data();
+    {
+        py::gil_scoped_release release;
+        at.predict_leafs(data, nrows, ncols, out_data, nthreads);
+    }
+    return out;
+}
+
 using TreeD = Tree<Split, FloatT>;
 using NodeRefD = TreeD::MRef;
 using DomTreeT = DomTree::DomTreeT;
@@ -113,7 +171,7 @@ PYBIND11_MODULE(pytreeck, m) {
         AddTree *at;
         size_t i;
         TreeD& get() { return at->operator[](i); }
-        const TreeD& get() const { return at->operator[](i); }
+        const TreeD& get() const { return static_cast<const AddTree *>(at)->operator[](i); }
     };
 
     py::class_<TreeRef>(m, "Tree")
@@ -145,26 +203,81 @@ PYBIND11_MODULE(pytreeck, m) {
         .def("num_leafs", &AddTree::num_leafs)
         .def("add_tree", [](AddTree& at) -> TreeRef { return TreeRef{&at, at.add_tree(TreeD())}; } )
         .def("__getitem__", [](AddTree& at, size_t i) -> TreeRef { return TreeRef{&at, i}; })
+        .def("add_tree_from_arrays", [](AddTree& at, CArrayT<FeatId> feat_ids,
+                    CArrayT<FloatT> values, CArrayT<NodeId> left,
+                    CArrayT<NodeId> right, CArrayT<bool> is_bool) {
+                size_t n = feat_ids.size();
+                if (feat_ids.ndim() != 1 || values.ndim() != 1 || left.ndim() != 1
+                        || right.ndim() != 1 || is_bool.ndim() != 1
+                        || values.size() != static_cast<py::ssize_t>(n)
+                        || left.size() != static_cast<py::ssize_t>(n)
+                        || right.size() != static_cast<py::ssize_t>(n)
+                        || is_bool.size() != static_cast<py::ssize_t>(n))
+                    throw std::runtime_error("expected 1-D node arrays of equal length");
+                return at.add_tree_from_arrays(n, feat_ids.data(), values.data(),
+                        left.data(), right.data(), is_bool.data());
+            }, py::arg("feat_ids"), py::arg("values"), py::arg("left"),
+               py::arg("right"), py::arg("is_bool"))
         .def("use_count", [](const std::shared_ptr<AddTree>& at) { return at.use_count(); })
         .def("get_splits", &AddTree::get_splits)
+        .def_property_readonly("feat_types", [](const AddTree& at) {
+                py::dict d;
+                for (auto [feat_id, type_index] : at.meta().feat_types)
+                    d[py::int_(feat_id)] = type_index == 0
+                        ? py::type::of<LtSplit>() : py::type::of<BoolSplit>();
+                return d;
+            })
+        .def_property_readonly("feat_ids", [](const AddTree& at) {
+                std::vector<FeatId> feat_ids;
+                for (auto [feat_id, type_index] : at.meta().feat_types)
+                    feat_ids.push_back(feat_id);
+                return feat_ids;
+            })
+        .def_property_readonly("leaf_counts", [](const AddTree& at) { return at.meta().leaf_counts; })
+        .def_property_readonly("min_leaf_values", [](const AddTree& at) { return at.meta().min_leaf_values; })
+        .def_property_readonly("max_leaf_values", [](const AddTree& at) { return at.meta().max_leaf_values; })
+        .def_property_readonly("model_id", &AddTree::model_id)
+        .def("register", [](std::shared_ptr<AddTree> at) { return AddTreeRegistry::add(at); })
+        .def_static("registered", &AddTreeRegistry::get)
+        .def_static("unregister", &AddTreeRegistry::remove)
+        .def_static("unregister_all", &AddTreeRegistry::clear)
+        .def("get_domains", [](const AddTree& at, CArrayT<NodeId> leaf_ids) {
+            py::buffer_info buf = leaf_ids.request();
+            if (buf.ndim != 2 || static_cast<size_t>(buf.shape[1]) != at.size())
+                throw std::runtime_error("expected (n_rows, n_trees) leaf_id matrix");
+
+            const NodeId *data = static_cast<const NodeId *>(buf.ptr);
+            std::vector<DomainsT> families;
+            families.reserve(buf.shape[0]);
+            for (py::ssize_t i = 0; i < buf.shape[0]; ++i)
+                families.push_back(at.get_domains(data + i * at.size()));
+            return families;
+        })
         .def("get_domains", [](const AddTree& at, std::vector<NodeId> leaf_ids) {
             if (at.size() != leaf_ids.size())
                 throw std::runtime_error("one leaf_id per tree in AddTree");
-
-            DomainsT domains;
-            for (size_t tree_index = 0; tree_index < at.size(); ++tree_index)
-            {
-                NodeId leaf_id = leaf_ids[tree_index];
-                const auto& tree = at[tree_index];
-                auto node = tree[leaf_id];
-                if (!node.is_leaf())
-                    throw std::runtime_error("leaf_id does not point to leaf");
-                node.get_domains(domains);
-            }
-            return domains;
+            return at.get_domains(leaf_ids.data());
         })
+        // get the compiled trees with the GIL held; keep them alive while it is released
+        .def("predict", [](const AddTree& at, CArrayT<double> X, int nthreads) {
+                return addtree_predict(*at.compiled(), X, nthreads);
+            }, py::arg("X"), py::arg("nthreads") = 1)
+        .def("predict", [](const AddTree& at, CArrayT<float> X, int nthreads) {
+                return addtree_predict(*at.compiled(), X, nthreads);
+            }, py::arg("X"), py::arg("nthreads") = 1)
+        .def("predict_leafs", [](const AddTree& at, CArrayT<double> X, int nthreads) {
+                return addtree_predict_leafs(*at.compiled(), X, nthreads);
+            }, py::arg("X"), py::arg("nthreads") = 1)
+        .def("predict_leafs", [](const AddTree& at, CArrayT<float> X, int nthreads) {
+                return addtree_predict_leafs(*at.compiled(), X, nthreads);
+            }, py::arg("X"), py::arg("nthreads") = 1)
+        .def("compile", [](const AddTree& at) { return CompiledAddTree(at); })
         .def("to_json", &AddTree::to_json)
         .def("from_json", AddTree::from_json)
+        .def("save_binary", [](const AddTree& at, const std::string& file) { at.to_binary_file(file.c_str()); })
+        .def_static("load_binary", [](const std::string& file, bool use_mmap) {
+                return AddTree::from_binary_file(file.c_str(), use_mmap);
+            }, py::arg("file"), py::arg("mmap") = true)
         .def("__str__", [](const AddTree& at) { return tostr(at); })
         .def(py::pickle(
             [](const AddTree& at) { // __getstate__
@@ -174,6 +287,16 @@ PYBIND11_MODULE(pytreeck, m) {
                 return AddTree::from_json(json);
             }));
 
+    py::class_<CompiledAddTree, std::shared_ptr<CompiledAddTree>>(m, "CompiledAddTree")
+        .def(py::init<const AddTree&>())
+        .def_readonly("base_score", &CompiledAddTree::base_score)
+        .def("__len__", &CompiledAddTree::size)
+        .def("num_nodes", &CompiledAddTree::num_nodes)
+        .def("predict", &addtree_predict<CompiledAddTree, double>, py::arg("X"), py::arg("nthreads") = 1)
+        .def("predict", &addtree_predict<CompiledAddTree, float>, py::arg("X"), py::arg("nthreads") = 1)
+        .def("predict_leafs", &addtree_predict_leafs<CompiledAddTree, double>, py::arg("X"), py::arg("nthreads") = 1)
+        .def("predict_leafs", &addtree_predict_leafs<CompiledAddTree, float>, py::arg("X"), py::arg("nthreads") = 1);
+
     py::class_<DomTree>(m, "DomTree")
         .def(py::init<>())
         .def(py::init<>([](std::shared_ptr<AddTree> v, DomainsT d) -> DomTree {
@@ -194,6 +317,10 @@ PYBIND11_MODULE(pytreeck, m) {
         .def("get_leaf", &DomTree::get_leaf)
         .def("apply_leaf", [](DomTree& dt, const DomTreeLeaf& leaf) {
             dt.apply_leaf(DomTreeLeaf { leaf });
+        })
+        .def("apply_leaf", [](DomTree& dt, const DomTreeLeaf& leaf,
+                    const std::vector<std::tuple<size_t, Split>>& splits) {
+            return dt.apply_leaf(DomTreeLeaf { leaf }, decode_splits(splits));
         });
 
     py::class_<DomTreeLeaf>(m, "DomTreeLeaf")
@@ -213,9 +340,49 @@ PYBIND11_MODULE(pytreeck, m) {
         .def("num_unreachable", &DomTreeLeaf::num_unreachable)
         .def("is_reachable", &DomTreeLeaf::is_reachable)
         .def("mark_unreachable", &DomTreeLeaf::mark_unreachable)
-        .def("find_best_split", &DomTreeLeaf::find_best_split)
-        .def("count_unreachable_leafs", &DomTreeLeaf::count_unreachable_leafs)
+        .def("mark_unreachable_outside", &DomTreeLeaf::mark_unreachable_outside)
+        .def("find_best_split", &DomTreeLeaf::find_best_split,
+                py::arg("nthreads") = 1, py::call_guard<py::gil_scoped_release>())
+        .def("count_unreachable_leafs", py::overload_cast<size_t, FeatId, Domain>(
+                    &DomTreeLeaf::count_unreachable_leafs, py::const_))
+        .def("count_unreachable_leafs", [](const DomTreeLeaf& l,
+                    const std::vector<std::tuple<size_t, Split>>& splits, int nthreads) {
+                auto s = decode_splits(splits);
+                py::gil_scoped_release release;
+                return l.count_unreachable_leafs(s, nthreads);
+            }, py::arg("splits"), py::arg("nthreads") = 1)
+        .def("get_split_candidates", [](const DomTreeLeaf& l) {
+                py::list result;
+                for (auto& [split, count] : l.get_split_candidates())
+                    result.append(py::make_tuple(split.instance_index, split.split, count));
+                return result;
+            })
+        .def("sum_tree_bounds_width", [](const DomTreeLeaf& l, size_t i) {
+                return l.sum_tree_bounds_width(i, -1, {});
+            })
+        .def("sum_tree_bounds_width", [](const DomTreeLeaf& l, size_t i, FeatId feat_id, Domain dom) {
+                return l.sum_tree_bounds_width(i, feat_id, dom);
+            })
+        .def("sum_tree_bounds_width", [](const DomTreeLeaf& l,
+                    const std::vector<std::tuple<size_t, Split>>& splits, int nthreads) {
+                auto s = decode_splits(splits);
+                py::gil_scoped_release release;
+                return l.sum_tree_bounds_width(s, nthreads);
+            }, py::arg("splits"), py::arg("nthreads") = 1)
+        .def("set_best_split", [](DomTreeLeaf& l, std::tuple<size_t, Split> split,
+                    int score, int balance) {
+                l.set_best_split({std::get<0>(split), std::get<1>(split)}, score, balance);
+            }, py::arg("split"), py::arg("score") = 0, py::arg("balance") = 0)
         .def("get_tree_bounds", &DomTreeLeaf::get_tree_bounds)
+        .def("to_smtlib", [](const DomTreeLeaf& l, size_t instance,
+                    const std::vector<size_t>& tree_indices, bool leaf_indicators,
+                    bool shared_splits) {
+                int leaf_count = 0;
+                std::string smtlib = l.to_smtlib(instance, tree_indices, leaf_count,
+                        leaf_indicators, shared_splits);
+                return py::make_tuple(smtlib, leaf_count);
+            }, py::arg("instance"), py::arg("tree_indices"),
+               py::arg("leaf_indicators") = false, py::arg("shared_splits") = false)
         .def("merge", &DomTreeLeaf::merge)
         .def(py::pickle(
             [](const DomTreeLeaf& l) -> py::bytes { // __getstate__
@@ -248,6 +415,9 @@ PYBIND11_MODULE(pytreeck, m) {
         .def(py::init<>([](std::shared_ptr<AddTree> at) {
             return KPartiteGraph(*at);
         }))
+        .def(py::init<>([](const DomTreeLeaf& leaf, size_t instance) {
+            return KPartiteGraph(leaf, instance);
+        }))
         .def("propagate_outputs", &KPartiteGraph::propagate_outputs)
         .def("merge", &KPartiteGraph::merge)
         .def("num_vertices", &KPartiteGraph::num_vertices)
@@ -261,11 +431,21 @@ PYBIND11_MODULE(pytreeck, m) {
         .def("step", &MaxKPartiteGraphFind::step)
         .def("steps", &MaxKPartiteGraphFind::steps)
         .def("nsteps", &MaxKPartiteGraphFind::nsteps)
+        .def("npushes", &MaxKPartiteGraphFind::npushes)
+        .def("npops", &MaxKPartiteGraphFind::npops)
+        .def("num_solutions", [](const MaxKPartiteGraphFind& g) { return g.solutions().size(); })
+        .def("pq_size", &MaxKPartiteGraphFind::pq_size)
+        .def("max_pq_size", &MaxKPartiteGraphFind::max_pq_size)
+        .def("set_callback", &MaxKPartiteGraphFind::set_callback, py::arg("f"), py::arg("every") = 1)
+        .def("set_pq_budget", &MaxKPartiteGraphFind::set_pq_budget)
+        .def("pq_budget", &MaxKPartiteGraphFind::pq_budget)
+        .def("npruned", &MaxKPartiteGraphFind::npruned)
+        .def("bounds", &MaxKPartiteGraphFind::bounds)
         .def("current_output_estimate", &MaxKPartiteGraphFind::current_output_estimate)
         .def("solutions", [](const MaxKPartiteGraphFind& g) {
-            std::vector<std::pair<FloatT, std::vector<std::pair<int, Domain>>>> solutions;
+            std::vector<std::pair<FloatT, std::vector<std::pair<FeatId, Domain>>>> solutions;
             for (const auto& s : g.solutions())
-                solutions.push_back({s.output, std::vector<std::pair<int, Domain>>(s.box.begin(), s.box.end())});
+                solutions.push_back({s.output, s.box.domains()});
             return solutions;
         });
 
@@ -276,11 +456,21 @@ PYBIND11_MODULE(pytreeck, m) {
         .def("step", &MinKPartiteGraphFind::step)
         .def("steps", &MinKPartiteGraphFind::steps)
         .def("nsteps", &MinKPartiteGraphFind::nsteps)
+        .def("npushes", &MinKPartiteGraphFind::npushes)
+        .def("npops", &MinKPartiteGraphFind::npops)
+        .def("num_solutions", [](const MinKPartiteGraphFind& g) { return g.solutions().size(); })
+        .def("pq_size", &MinKPartiteGraphFind::pq_size)
+        .def("max_pq_size", &MinKPartiteGraphFind::max_pq_size)
+        .def("set_callback", &MinKPartiteGraphFind::set_callback, py::arg("f"), py::arg("every") = 1)
+        .def("set_pq_budget", &MinKPartiteGraphFind::set_pq_budget)
+        .def("pq_budget", &MinKPartiteGraphFind::pq_budget)
+        .def("npruned", &MinKPartiteGraphFind::npruned)
+        .def("bounds", &MinKPartiteGraphFind::bounds)
         .def("current_output_estimate", &MinKPartiteGraphFind::current_output_estimate)
         .def("solutions", [](const MinKPartiteGraphFind& g) {
-            std::vector<std::pair<FloatT, std::vector<std::pair<int, Domain>>>> solutions;
+            std::vector<std::pair<FloatT, std::vector<std::pair<FeatId, Domain>>>> solutions;
             for (const auto& s : g.solutions())
-                solutions.push_back({s.output, std::vector<std::pair<int, Domain>>(s.box.begin(), s.box.end())});
+                solutions.push_back({s.output, s.box.domains()});
             return solutions;
         });
 
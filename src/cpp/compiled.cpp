@@ -0,0 +1,216 @@
+/*
+ * Copyright 2019 DTAI Research Group - KU Leuven.
+ * License: Apache License 2.0
+ * Author: Laurens Devos
+*/
+
+#include <algorithm>
+#include <sstream>
+#include <stack>
+#include <tuple>
+
+#include "util.h"
+#include "compiled.h"
+
+namespace treeck {
+
+    CompiledAddTree::CompiledAddTree(const AddTree& addtree)
+        : feat_ids_()
+        , values_()
+        , children_()
+        , roots_()
+        , max_feat_id_(LEAF)
+        , base_score(addtree.base_score)
+    {
+        size_t num_nodes = addtree.num_nodes();
+        feat_ids_.reserve(num_nodes);
+        values_.reserve(num_nodes);
+        children_.reserve(num_nodes);
+        roots_.reserve(addtree.size());
+
+        for (const AddTree::TreeT& tree : addtree.trees())
+            compile_tree(tree);
+    }
+
+    void
+    CompiledAddTree::compile_tree(const AddTree::TreeT& tree)
+    {
+        // (node in the AddTree, index of its slot in the arrays)
+        std::stack<std::tuple<AddTree::TreeT::CRef, NodeId>> stack;
+
+        NodeId root_index = feat_ids_.size();
+        roots_.push_back(root_index);
+        feat_ids_.push_back(LEAF);
+        values_.push_back(0.0);
+        children_.push_back(-1);
+        stack.push({tree.root(), root_index});
+
+        while (!stack.empty())
+        {
+            auto [node, index] = stack.top();
+            stack.pop();
+
+            if (node.is_leaf())
+            {
+                feat_ids_[index] = LEAF;
+                values_[index] = node.leaf_value();
+                children_[index] = node.id();
+                continue;
+            }
+
+            // reserve two adjacent slots for the children
+            NodeId left_index = feat_ids_.size();
+            for (int k = 0; k < 2; ++k)
+            {
+                feat_ids_.push_back(LEAF);
+                values_.push_back(0.0);
+                children_.push_back(-1);
+            }
+            children_[index] = left_index;
+
+            visit_split(
+                [this, index](const LtSplit& s) {
+                    feat_ids_[index] = s.feat_id;
+                    values_[index] = s.split_value;
+                    max_feat_id_ = std::max(max_feat_id_, s.feat_id);
+                },
+                [this, index](const BoolSplit& s) {
+                    feat_ids_[index] = encode_bool(s.feat_id);
+                    max_feat_id_ = std::max(max_feat_id_, s.feat_id);
+                },
+                node.get_split());
+
+            stack.push({node.right(), left_index + 1});
+            stack.push({node.left(), left_index});
+        }
+    }
+
+    size_t
+    CompiledAddTree::size() const
+    {
+        return roots_.size();
+    }
+
+    size_t
+    CompiledAddTree::num_nodes() const
+    {
+        return feat_ids_.size();
+    }
+
+    FeatId
+    CompiledAddTree::max_feat_id() const
+    {
+        return max_feat_id_;
+    }
+
+    void
+    CompiledAddTree::check_num_cols(size_t ncols) const
+    {
+        if (max_feat_id_ >= 0 && static_cast<size_t>(max_feat_id_) >= ncols)
+        {
+            std::stringstream ss;
+            ss << "CompiledAddTree::predict: feat_id " << max_feat_id_
+                << " out of bounds for " << ncols << " columns";
+            throw std::runtime_error(ss.str());
+        }
+    }
+
+    template <typename T>
+    size_t
+    CompiledAddTree::eval_leaf(size_t tree_index, const T *row) const
+    {
+        size_t i = roots_[tree_index];
+        while (true)
+        {
+            FeatId feat_id = feat_ids_[i];
+            bool go_left;
+            if (feat_id > LEAF)
+                go_left = static_cast<FloatT>(row[feat_id]) < values_[i]; // consistent with LtSplit::test
+            else if (feat_id == LEAF)
+                return i;
+            else
+                go_left = row[decode_bool(feat_id)] != 0; // consistent with BoolSplit::test
+            i = children_[i] + (go_left ? 0 : 1);
+        }
+    }
+
+    template <typename T>
+    void
+    CompiledAddTree::predict_block(const T *data, size_t ncols,
+            size_t row_begin, size_t row_end,
+            size_t tree_begin, size_t tree_end,
+            double *out) const
+    {
+        for (size_t i = row_begin; i < row_end; ++i)
+        {
+            const T *row = data + i * ncols;
+            double result = 0.0;
+            for (size_t j = tree_begin; j < tree_end; ++j)
+                result += values_[eval_leaf(j, row)];
+            out[i] += result;
+        }
+    }
+
+    template <typename T>
+    void
+    CompiledAddTree::predict(const T *data, size_t nrows, size_t ncols,
+            double *out, int nthreads) const
+    {
+        check_num_cols(ncols);
+        std::fill(out, out + nrows, static_cast<double>(base_score));
+
+        nthreads = util::num_threads(nthreads);
+
+        if (nthreads == 1)
+        {
+            predict_block(data, ncols, 0, nrows, 0, size(), out);
+        }
+        else if (nrows >= static_cast<size_t>(nthreads))
+        {
+            // enough rows: each thread evaluates all trees for a slice of the rows
+            util::parallel_for(nthreads, nrows,
+                [this, data, ncols, out](size_t begin, size_t end, size_t) {
+                    predict_block(data, ncols, begin, end, 0, size(), out);
+                });
+        }
+        else
+        {
+            // few rows, many trees: each thread sums a slice of the trees
+            std::vector<std::vector<double>> partial(nthreads,
+                    std::vector<double>(nrows, 0.0));
+            util::parallel_for(nthreads, size(),
+                [this, data, nrows, ncols, &partial](size_t begin, size_t end, size_t t) {
+                    predict_block(data, ncols, 0, nrows, begin, end, partial[t].data());
+                });
+            for (const auto& p : partial)
+                for (size_t i = 0; i < nrows; ++i)
+                    out[i] += p[i];
+        }
+    }
+
+    template <typename T>
+    void
+    CompiledAddTree::predict_leafs(const T *data, size_t nrows, size_t ncols,
+            NodeId *out, int nthreads) const
+    {
+        check_num_cols(ncols);
+
+        size_t ntrees = size();
+        util::parallel_for(nthreads, nrows,
+            [this, data, ncols, ntrees, out](size_t begin, size_t end, size_t) {
+                for (size_t i = begin; i < end; ++i)
+                {
+                    const T *row = data + i * ncols;
+                    NodeId *out_row = out + i * ntrees;
+                    for (size_t j = 0; j < ntrees; ++j)
+                        out_row[j] = children_[eval_leaf(j, row)];
+                }
+            });
+    }
+
+    template void CompiledAddTree::predict(const float *, size_t, size_t, double *, int) const;
+    template void CompiledAddTree::predict(const double *, size_t, size_t, double *, int) const;
+    template void CompiledAddTree::predict_leafs(const float *, size_t, size_t, NodeId *, int) const;
+    template void CompiledAddTree::predict_leafs(const double *, size_t, size_t, NodeId *, int) const;
+
+} /* namespace treeck */
@@ -0,0 +1,76 @@
+/*
+ * Copyright 2019 DTAI Research Group - KU Leuven.
+ * License: Apache License 2.0
+ * Author: Laurens Devos
+*/
+
+#ifndef TREECK_COMPILED_H
+#define TREECK_COMPILED_H
+
+#include <vector>
+
+#include "tree.h"
+
+namespace treeck {
+
+    /**
+     * Frozen, inference-only copy of an AddTree. The nodes of all trees are
+     * packed into three parallel arrays:
+     *
+     *  - feat_ids_: feature of the split; LEAF for leafs; BoolSplits are
+     *               stored as `encode_bool(feat_id)` (< LEAF)
+     *  - values_:   split value of LtSplits, leaf value of leafs
+     *  - children_: index of the left child (right = left + 1) of internal
+     *               nodes, original NodeId in the AddTree for leafs
+     *
+     * Nodes are 12 bytes, and the children of a node are adjacent.
+     */
+    class CompiledAddTree {
+    public:
+        static constexpr FeatId LEAF = -1;
+
+    private:
+        std::vector<FeatId> feat_ids_;
+        std::vector<FloatT> values_;
+        std::vector<NodeId> children_;
+        std::vector<NodeId> roots_;
+        FeatId max_feat_id_;
+
+        static constexpr FeatId encode_bool(FeatId feat_id) { return -feat_id - 2; }
+        static constexpr FeatId decode_bool(FeatId code) { return -code - 2; }
+
+        void compile_tree(const AddTree::TreeT& tree);
+        void check_num_cols(size_t ncols) const;
+
+        template <typename T>
+        size_t eval_leaf(size_t tree_index, const T *row) const; // index of leaf in arrays
+
+        template <typename T>
+        void predict_block(const T *data, size_t ncols,
+                size_t row_begin, size_t row_end,
+                size_t tree_begin, size_t tree_end,
+                double *out) const;
+
+    public:
+        FloatT base_score;
+
+        CompiledAddTree(const AddTree& addtree);
+
+        size_t size() const;
+        size_t num_nodes() const;
+        FeatId max_feat_id() const;
+
+        /** See AddTree::predict */
+        template <typename T>
+        void predict(const T *data, size_t nrows, size_t ncols, double *out,
+                int nthreads = 1) const;
+
+        /** See AddTree::predict_leafs */
+        template <typename T>
+        void predict_leafs(const T *data, size_t nrows, size_t ncols, NodeId *out,
+                int nthreads = 1) const;
+    };
+
+} /* namespace treeck */
+
+#endif /* TREECK_COMPILED_H */
@@ -4,9 +4,17 @@
  * Author: Laurens Devos
 */
 
+#include <algorithm>
+#include <bitset>
+#include <charconv>
+#include <cmath>
+#include <cstdio>
+#include <map>
+
 #include <cereal/archives/binary.hpp>
 #include <cereal/types/unordered_map.hpp>
 #include <cereal/types/unordered_set.hpp>
+#include <cereal/types/vector.hpp>
 #include <cereal/types/memory.hpp>
 #include <cereal/types/optional.hpp>
 
@@ -89,45 +97,19 @@ namespace treeck {
 
 
 
-    bool
-    operator==(const IsReachableKey& a, const IsReachableKey& b)
-    {
-        return a.tree_index == b.tree_index
-            && a.node_id == b.node_id;
-    }
-
-
-    template <typename Archive>
-    void
-    IsReachableKey::serialize(Archive& archive)
-    {
-        archive(CEREAL_NVP(tree_index), CEREAL_NVP(node_id));
-    }
-
-
-    size_t
-    IsReachableKeyHash::operator()(const IsReachableKey& k) const
-    {
-        // https://www.boost.org/doc/libs/1_34_0/doc/html/boost/hash_combine.html
-        size_t seed = 0x33434282;
-        seed ^= std::hash<size_t>()(k.tree_index) + 0x9e3779b9 + (seed << 6) + (seed >> 2);
-        seed ^= std::hash<NodeId>()(k.node_id)    + 0x9e3779b9 + (seed << 6) + (seed >> 2);
-        return seed;
-    }
-
-    template <typename Archive>
-    void
-    IsReachableKeyHash::serialize(Archive& archive) {}
-
-    IsReachable::IsReachable() : unreachable_() {}
-    IsReachable::IsReachable(const IsReachable& o) : unreachable_(o.unreachable_) {}
+    IsReachable::IsReachable() : unreachable_(), num_unreachable_(0) {}
+    IsReachable::IsReachable(const IsReachable& o)
+        : unreachable_(o.unreachable_)
+        , num_unreachable_(o.num_unreachable_) {}
     IsReachable::IsReachable(IsReachable&& o)
-        : unreachable_(std::move(o.unreachable_)) {}
+        : unreachable_(std::move(o.unreachable_))
+        , num_unreachable_(o.num_unreachable_) {}
 
     IsReachable&
     IsReachable::operator=(const IsReachable& other)
     {
         unreachable_ = other.unreachable_;
+        num_unreachable_ = other.num_unreachable_;
         return *this;
     }
 
@@ -135,40 +117,126 @@ namespace treeck {
     IsReachable::operator=(IsReachable&& other)
     {
         unreachable_ = std::move(other.unreachable_);
+        num_unreachable_ = other.num_unreachable_;
         return *this;
     }
 
+    IsReachable::TreeBitsT&
+    IsReachable::mut_trees(size_t num_trees)
+    {
+        if (!unreachable_)
+            unreachable_ = std::make_shared<TreeBitsT>();
+        else if (unreachable_.use_count() > 1)
+            unreachable_ = std::make_shared<TreeBitsT>(*unreachable_);
+
+        if (num_trees > unreachable_->size())
+            unreachable_->resize(num_trees);
+        return *unreachable_;
+    }
+
+    IsReachable::BitsT&
+    IsReachable::mut_bits(size_t tree_index, size_t num_words)
+    {
+        auto& bits = mut_trees(tree_index + 1)[tree_index];
+        if (!bits)
+            bits = std::make_shared<BitsT>();
+        else if (bits.use_count() > 1)
+            bits = std::make_shared<BitsT>(*bits);
+
+        if (num_words > bits->size())
+            bits->resize(num_words, 0);
+        return *bits;
+    }
+
     size_t
     IsReachable::num_unreachable() const
     {
-        return unreachable_.size();
+        return num_unreachable_;
     }
 
     bool
     IsReachable::is_reachable(size_t tree_index, NodeId node_id) const
     {
-        IsReachableKey k{static_cast<int>(tree_index), node_id};
-        return unreachable_.find(k) == unreachable_.end(); // not contains
+        if (!unreachable_ || tree_index >= unreachable_->size())
+            return true;
+        const auto& bits = (*unreachable_)[tree_index];
+        size_t word = static_cast<size_t>(node_id) / WORD_BITS;
+        if (!bits || word >= bits->size())
+            return true;
+        return (((*bits)[word] >> (node_id % WORD_BITS)) & 1) == 0;
     }
 
     void
     IsReachable::mark_unreachable(size_t tree_index, NodeId node_id)
     {
-        IsReachableKey k{static_cast<int>(tree_index), node_id};
-        unreachable_.insert(k);
+        if (!is_reachable(tree_index, node_id))
+            return; // don't unshare for nothing
+        size_t word = static_cast<size_t>(node_id) / WORD_BITS;
+        BitsT& bits = mut_bits(tree_index, word + 1);
+        bits[word] |= WordT(1) << (node_id % WORD_BITS);
+        ++num_unreachable_;
     }
 
     void
     IsReachable::combine(const IsReachable& other)
     {
-        unreachable_.insert(other.unreachable_.begin(), other.unreachable_.end());
+        if (!other.unreachable_ || unreachable_ == other.unreachable_)
+            return;
+
+        for (size_t t = 0; t < other.unreachable_->size(); ++t)
+        {
+            const auto& bits1 = (*other.unreachable_)[t];
+            if (!bits1) continue;
+
+            const BitsT *bits0 = nullptr;
+            if (unreachable_ && t < unreachable_->size())
+                bits0 = (*unreachable_)[t].get();
+            if (bits0 == bits1.get()) continue; // shared, nothing new
+
+            size_t num_new = 0;
+            for (size_t w = 0; w < bits1->size(); ++w)
+            {
+                WordT w0 = (bits0 && w < bits0->size()) ? (*bits0)[w] : 0;
+                num_new += std::bitset<64>((*bits1)[w] & ~w0).count();
+            }
+            if (num_new == 0) continue;
+
+            if (!bits0) // share other's bitset for this tree
+            {
+                mut_trees(t + 1)[t] = bits1;
+            }
+            else
+            {
+                BitsT& bits = mut_bits(t, bits1->size());
+                for (size_t w = 0; w < bits1->size(); ++w)
+                    bits[w] |= (*bits1)[w];
+            }
+            num_unreachable_ += num_new;
+        }
     }
 
     template <typename Archive>
     void
-    IsReachable::serialize(Archive& archive)
+    IsReachable::save(Archive& archive) const
     {
-        archive(cereal::make_nvp("unreachable", unreachable_));
+        std::vector<BitsT> unreachable;
+        if (unreachable_)
+            for (const auto& bits : *unreachable_)
+                unreachable.push_back(bits ? *bits : BitsT());
+        archive(cereal::make_nvp("unreachable", unreachable),
+                cereal::make_nvp("num_unreachable", num_unreachable_));
+    }
+
+    template <typename Archive>
+    void
+    IsReachable::load(Archive& archive)
+    {
+        std::vector<BitsT> unreachable;
+        archive(cereal::make_nvp("unreachable", unreachable),
+                cereal::make_nvp("num_unreachable", num_unreachable_));
+        unreachable_ = std::make_shared<TreeBitsT>();
+        for (auto& bits : unreachable)
+            unreachable_->push_back(std::make_shared<BitsT>(std::move(bits)));
     }
 
     template <typename Archive>
@@ -317,6 +385,41 @@ namespace treeck {
 
     void
     DomTree::apply_leaf(DomTreeLeaf&& leaf)
+    {
+        combine_leaf(leaf);
+
+        // split if leaf has best_split
+        if (leaf.best_split_)
+            split_leaf(leaf.domtree_leaf_id(), *leaf.best_split_);
+    }
+
+    std::vector<NodeId>
+    DomTree::apply_leaf(DomTreeLeaf&& leaf, const std::vector<DomTreeSplit>& splits)
+    {
+        combine_leaf(leaf);
+
+        std::vector<NodeId> parts { leaf.domtree_leaf_id() };
+        for (const DomTreeSplit& split : splits)
+        {
+            std::vector<NodeId> next;
+            for (NodeId id : parts)
+            {
+                if (divides(id, split))
+                {
+                    split_leaf(id, split);
+                    auto node = tree_[id];
+                    next.push_back(node.left().id());
+                    next.push_back(node.right().id());
+                }
+                else next.push_back(id);
+            }
+            parts = std::move(next);
+        }
+        return parts;
+    }
+
+    void
+    DomTree::combine_leaf(DomTreeLeaf& leaf)
     {
         if (leaf.num_instances() != num_instances())
             throw std::runtime_error("DomTree::apply_leaf: incompatible leaf");
@@ -331,54 +434,66 @@ namespace treeck {
 
             is_reachable0.combine(is_reachable1);
         }
+    }
 
-        // split if leaf has best_split
-        if (leaf.best_split_)
-        {
-            DomTreeSplit split = *leaf.best_split_;
-
-            auto node = tree_[leaf_id];
+    bool
+    DomTree::divides(NodeId domtree_leaf_id, const DomTreeSplit& split) const
+    {
+        DomainsT domains = get_domains(split.instance_index, domtree_leaf_id);
+        return visit_split(
+                [&domains](const LtSplit& s) {
+                    auto search = domains.find(s.feat_id);
+                    return search == domains.end()
+                        || std::get<RealDomain>(search->second).contains_strict(s.split_value);
+                },
+                [&domains](const BoolSplit& s) {
+                    auto search = domains.find(s.feat_id);
+                    return search == domains.end()
+                        || std::get<BoolDomain>(search->second).is_everything();
+                },
+                split.split);
+    }
 
-            if (!node.is_leaf())
-                throw std::runtime_error("DomTree::apply_leaf: split on non-leaf");
+    void
+    DomTree::split_leaf(NodeId leaf_id, const DomTreeSplit& split)
+    {
+        auto node = tree_[leaf_id];
 
-            node.split(*leaf.best_split_);
+        if (!node.is_leaf())
+            throw std::runtime_error("DomTree::apply_leaf: split on non-leaf");
 
-            // duplicate is_reachable for the new leafs
-            for (size_t i = 0; i < num_instances(); ++i)
-            {
-                auto& is_reachables0 = instances_.at(i).is_reachables;
-                DomTreeLeafInstance& inst1 = leaf.instances_.at(i);
+        node.split(split);
 
-                is_reachables0.erase(node.id()); // might be old! -> mark_unreachable
-                is_reachables0.emplace(node.left().id(), inst1.is_reachable); // copy once
-                is_reachables0.emplace(node.right().id(), std::move(inst1.is_reachable)); // reuse for right
-            }
-
-            Domain dom_l, dom_r;
-            FeatId feat_id;
-            visit_split(
-                [&dom_l, &dom_r, &feat_id](const LtSplit& s) {
-                    std::tie(dom_l, dom_r) = s.get_domains();
-                    feat_id = s.feat_id;
-                },
-                [&dom_l, &dom_r, &feat_id](const BoolSplit& s) {
-                    std::tie(dom_l, dom_r) = s.get_domains();
-                    feat_id = s.feat_id;
-                },
-                split.split
-            );
+        // duplicate is_reachable for the new leafs
+        for (size_t i = 0; i < num_instances(); ++i)
+        {
+            auto& is_reachables0 = instances_.at(i).is_reachables;
+            IsReachable is_reachable = std::move(is_reachables0.at(leaf_id));
 
-            // update is_reachable for instance (addtree) where the best split was found
-            // the split only affects the values of that instance (we don't
-            // know about the additional constraints here).
-            auto& is_reachables0 = instances_.at(split.instance_index).is_reachables;
-            auto& is_reachable_l = is_reachables0.at(node.left().id());
-            update_is_reachable(split.instance_index, node.left().id(), feat_id, dom_l);
-            auto& is_reachable_r = is_reachables0.at(node.right().id());
-            update_is_reachable(split.instance_index, node.right().id(), feat_id, dom_r);
+            is_reachables0.erase(leaf_id);
+            is_reachables0.emplace(node.left().id(), is_reachable); // copy once
+            is_reachables0.emplace(node.right().id(), std::move(is_reachable)); // reuse for right
         }
 
+        Domain dom_l, dom_r;
+        FeatId feat_id;
+        visit_split(
+            [&dom_l, &dom_r, &feat_id](const LtSplit& s) {
+                std::tie(dom_l, dom_r) = s.get_domains();
+                feat_id = s.feat_id;
+            },
+            [&dom_l, &dom_r, &feat_id](const BoolSplit& s) {
+                std::tie(dom_l, dom_r) = s.get_domains();
+                feat_id = s.feat_id;
+            },
+            split.split
+        );
+
+        // update is_reachable for instance (addtree) where the split was found
+        // the split only affects the values of that instance (we don't
+        // know about the additional constraints here).
+        update_is_reachable(split.instance_index, node.left().id(), feat_id, dom_l);
+        update_is_reachable(split.instance_index, node.right().id(), feat_id, dom_r);
     }
 
     void
@@ -489,8 +604,47 @@ namespace treeck {
         instances_.at(i).is_reachable.mark_unreachable(tree_index, node_id);
     }
 
+    int
+    DomTreeLeaf::mark_unreachable_outside(size_t i, size_t tree_index,
+            const DomainsT& domains)
+    {
+        DomTreeLeafInstance& inst = instances_.at(i);
+        const AddTree& addtree = *inst.addtree;
+        IsReachable& is_reachable = inst.is_reachable;
+        int count = 0;
+
+        auto f = [&is_reachable, &count](
+                size_t tree_index,
+                AddTree::TreeT::CRef node,
+                bool marked)
+        {
+            if (!is_reachable.is_reachable(tree_index, node.id()))
+                return false;
+            if (marked)
+            {
+                is_reachable.mark_unreachable(tree_index, node.id());
+                ++count;
+                return false;
+            }
+            return node.is_internal();
+        };
+
+        // a path leaves the box iff one of its splits does for some feature
+        for (auto&& [feat_id, dom] : domains)
+        {
+            bool is_everything = visit_domain(
+                    [](const RealDomain& d) { return d.is_everything(); },
+                    [](const BoolDomain& d) { return d.is_everything(); },
+                    dom);
+            if (is_everything) continue;
+            visit_addtree(addtree, is_reachable, tree_index, addtree[tree_index].root(),
+                    feat_id, dom, false, f);
+        }
+        return count;
+    }
+
     void
-    DomTreeLeaf::find_best_split()
+    DomTreeLeaf::find_best_split(int nthreads)
     {
         Split max_split;
         int max_score = 0, min_balance = 0;
@@ -498,7 +652,7 @@ namespace treeck {
         for (size_t i = 0; i < num_instances(); ++i)
         {
             bool has_improved = find_best_split_for_instance(i, max_split,
-                    max_score, min_balance);
+                    max_score, min_balance, nthreads);
             if (has_improved)
                 max_i = i;
         }
@@ -514,115 +668,498 @@ namespace treeck {
         }
     }
 
+    namespace inner {
+
+        /* For every reachable leaf, the bounds that the splits on its path
+         * impose on each feature. A leaf becomes unreachable when the
+         * domain of a feature is restricted to (-inf, v) iff its lower bound
+         * is >= v, and to [v, inf) iff its upper bound is <= v, so the
+         * unreachable leaf counts of count_unreachable_leafs follow from a
+         * binary search in the sorted bounds. */
+        struct SplitIndex {
+            std::unordered_map<FeatId, std::vector<FloatT>> lo; // leaf requires x >= lo
+            std::unordered_map<FeatId, std::vector<FloatT>> hi; // leaf requires x < hi
+            std::unordered_map<FeatId, int> bool_left; // leafs below left of BoolSplit
+            std::unordered_map<FeatId, int> bool_right; // leafs below right of BoolSplit
+        };
+
+        struct PathBound {
+            FeatId feat_id;
+            FloatT lo, hi; // LtSplit
+            bool left, right; // BoolSplit
+        };
+
+        static
+        void
+        build_split_index(AddTree::TreeT::CRef node, size_t tree_index,
+                const IsReachable& is_reachable, std::vector<PathBound>& path,
+                SplitIndex& index)
+        {
+            if (!is_reachable.is_reachable(tree_index, node.id()))
+                return;
+
+            if (node.is_leaf())
+            {
+                for (const PathBound& b : path)
+                {
+                    if (b.lo != -std::numeric_limits<FloatT>::infinity())
+                        index.lo[b.feat_id].push_back(b.lo);
+                    if (b.hi != std::numeric_limits<FloatT>::infinity())
+                        index.hi[b.feat_id].push_back(b.hi);
+                    if (b.left) ++index.bool_left[b.feat_id];
+                    if (b.right) ++index.bool_right[b.feat_id];
+                }
+                return;
+            }
+
+            const Split& split = node.get_split();
+            FeatId feat_id = visit_split(
+                    [](const LtSplit& s) { return s.feat_id; },
+                    [](const BoolSplit& s) { return s.feat_id; },
+                    split);
+
+            size_t k = 0;
+            for (; k < path.size() && path[k].feat_id != feat_id; ++k);
+            bool is_new = k == path.size();
+            if (is_new)
+                path.push_back({feat_id,
+                        -std::numeric_limits<FloatT>::infinity(),
+                        std::numeric_limits<FloatT>::infinity(),
+                        false, false});
+            PathBound saved = path[k];
+
+            visit_split(
+                [&path, k](const LtSplit& s) { path[k].hi = std::min(path[k].hi, s.split_value); },
+                [&path, k](const BoolSplit&) { path[k].left = true; },
+                split);
+            build_split_index(node.left(), tree_index, is_reachable, path, index);
+            path[k] = saved;
+
+            visit_split(
+                [&path, k](const LtSplit& s) { path[k].lo = std::max(path[k].lo, s.split_value); },
+                [&path, k](const BoolSplit&) { path[k].right = true; },
+                split);
+            build_split_index(node.right(), tree_index, is_reachable, path, index);
+            path[k] = saved;
+
+            if (is_new) path.pop_back();
+        }
+
+        static
+        SplitIndex
+        build_split_index(const AddTree& addtree, const IsReachable& is_reachable,
+                int nthreads)
+        {
+            // one partial index per thread, each for a range of trees
+            std::vector<SplitIndex> parts(util::num_threads(nthreads));
+            util::parallel_for(nthreads, addtree.size(),
+                    [&addtree, &is_reachable, &parts](size_t begin, size_t end, size_t t) {
+                std::vector<PathBound> path;
+                for (size_t tree_index = begin; tree_index < end; ++tree_index)
+                    build_split_index(addtree[tree_index].root(), tree_index,
+                            is_reachable, path, parts[t]);
+            });
+
+            SplitIndex index = std::move(parts[0]);
+            for (size_t t = 1; t < parts.size(); ++t)
+            {
+                for (auto& [feat_id, v] : parts[t].lo)
+                    index.lo[feat_id].insert(index.lo[feat_id].end(), v.begin(), v.end());
+                for (auto& [feat_id, v] : parts[t].hi)
+                    index.hi[feat_id].insert(index.hi[feat_id].end(), v.begin(), v.end());
+                for (auto [feat_id, c] : parts[t].bool_left) index.bool_left[feat_id] += c;
+                for (auto [feat_id, c] : parts[t].bool_right) index.bool_right[feat_id] += c;
+            }
+
+            std::vector<std::vector<FloatT> *> bounds;
+            for (auto& [feat_id, v] : index.lo) bounds.push_back(&v);
+            for (auto& [feat_id, v] : index.hi) bounds.push_back(&v);
+            util::parallel_for(nthreads, bounds.size(),
+                    [&bounds](size_t begin, size_t end, size_t) {
+                for (size_t k = begin; k < end; ++k)
+                    std::sort(bounds[k]->begin(), bounds[k]->end());
+            });
+
+            return index;
+        }
+
+        /* Distinct splits of nodes with two reachable children, in
+         * depth-first order, with the number of such nodes per split. */
+        static
+        void
+        collect_split_candidates(const AddTree& addtree,
+                const IsReachable& is_reachable,
+                std::vector<Split>& candidates,
+                std::vector<int>& counts)
+        {
+            // candidate index of each split seen so far
+            std::unordered_map<FeatId, std::unordered_map<FloatT, size_t>> lt_seen;
+            std::unordered_map<FeatId, size_t> bool_seen;
+            size_t tree_index = 0;
+
+            for (auto& tree : addtree.trees())
+            {
+                tree.dfs(
+                        [&is_reachable, &lt_seen, &bool_seen, &candidates,
+                         &counts, tree_index]
+                        (AddTree::TreeT::CRef node) {
+                    if (node.is_leaf())
+                        return ADD_NONE;
+
+                    int is_reachable_l = is_reachable.is_reachable(tree_index, node.left().id());
+                    int is_reachable_r = is_reachable.is_reachable(tree_index, node.right().id());
+
+                    // only consider split if both left and right subtree are reachable
+                    if (!is_reachable_l && !is_reachable_r)
+                        return ADD_NONE;
+                    if (!is_reachable_l)
+                        return ADD_RIGHT;
+                    if (!is_reachable_r)
+                        return ADD_LEFT;
+
+                    // (candidate index, is new)
+                    auto [k, is_new] = visit_split(
+                        [&lt_seen, &candidates](const LtSplit& split) {
+                            auto r = lt_seen[split.feat_id].emplace(split.split_value,
+                                    candidates.size());
+                            return std::make_tuple(r.first->second, r.second);
+                        },
+                        [&bool_seen, &candidates](const BoolSplit& split) {
+                            auto r = bool_seen.emplace(split.feat_id, candidates.size());
+                            return std::make_tuple(r.first->second, r.second);
+                        },
+                        node.get_split());
+
+                    if (is_new)
+                    {
+                        candidates.push_back(node.get_split());
+                        counts.push_back(1);
+                    }
+                    else // already seen
+                    {
+                        ++counts[k];
+                    }
+                    return ADD_LEFT_AND_RIGHT;
+                });
+                ++tree_index;
+            }
+        }
+
+        /* Number of leafs that become unreachable in the left and right
+         * part when the domain is split on each candidate (see
+         * count_unreachable_leafs) */
+        template <typename GetSplit>
+        static
+        std::vector<std::tuple<int, int>>
+        count_unreachable_leafs(const SplitIndex& index, size_t n,
+                const GetSplit& get_split, int nthreads);
+
+        static
+        int
+        count_greater_equal(const SplitIndex& index, FeatId feat_id, FloatT v)
+        {
+            auto search = index.lo.find(feat_id);
+            if (search == index.lo.end()) return 0;
+            const auto& lo = search->second;
+            return lo.end() - std::lower_bound(lo.begin(), lo.end(), v);
+        }
+
+        static
+        int
+        count_less_equal(const SplitIndex& index, FeatId feat_id, FloatT v)
+        {
+            auto search = index.hi.find(feat_id);
+            if (search == index.hi.end()) return 0;
+            const auto& hi = search->second;
+            return std::upper_bound(hi.begin(), hi.end(), v) - hi.begin();
+        }
+
+        static
+        int
+        get_or_zero(const std::unordered_map<FeatId, int>& counts, FeatId feat_id)
+        {
+            auto search = counts.find(feat_id);
+            return search == counts.end() ? 0 : search->second;
+        }
+
+        template <typename GetSplit>
+        static
+        std::vector<std::tuple<int, int>>
+        count_unreachable_leafs(const SplitIndex& index, size_t n,
+                const GetSplit& get_split, int nthreads)
+        {
+            std::vector<std::tuple<int, int>> unreachable(n);
+            util::parallel_for(nthreads, n,
+                    [&index, &get_split, &unreachable](size_t begin, size_t end, size_t) {
+                for (size_t k = begin; k < end; ++k)
+                {
+                    unreachable[k] = visit_split(
+                        [&index](const LtSplit& split) -> std::tuple<int, int> {
+                            return {
+                                count_greater_equal(index, split.feat_id, split.split_value),
+                                count_less_equal(index, split.feat_id, split.split_value)
+                            };
+                        },
+                        [&index](const BoolSplit& split) -> std::tuple<int, int> {
+                            return {
+                                get_or_zero(index.bool_right, split.feat_id),
+                                get_or_zero(index.bool_left, split.feat_id)
+                            };
+                        },
+                        get_split(k));
+                }
+            });
+            return unreachable;
+        }
+
+    } /* namespace inner */
+
     bool
     DomTreeLeaf::find_best_split_for_instance(
             size_t i, Split& max_split,
-            int& max_score, int& min_balance)
+            int& max_score, int& min_balance, int nthreads)
     {
         const AddTree& addtree = *instances_.at(i).addtree;
         const IsReachable& is_reachable = instances_.at(i).is_reachable;
 
-        size_t tree_index = 0;
-        bool has_improved = false;
-        std::unordered_map<FeatId, std::unordered_set<FloatT>> duplicates;
+        const inner::SplitIndex index = inner::build_split_index(addtree,
+                is_reachable, nthreads);
+        std::vector<Split> candidates;
+        std::vector<int> counts;
+        inner::collect_split_candidates(addtree, is_reachable, candidates, counts);
 
-        for (auto& tree : addtree.trees())
+        auto unreachable = inner::count_unreachable_leafs(index, candidates.size(),
+                [&candidates](size_t k) -> const Split& { return candidates[k]; },
+                nthreads);
+
+        // sequential reduction: same result for any nthreads
+        bool has_improved = false;
+        for (size_t k = 0; k < candidates.size(); ++k)
         {
-            tree.dfs(
-                    [this, &addtree, &is_reachable, &duplicates, tree_index,
-                     &max_split, &max_score, &min_balance, &has_improved, &i]
-                    (AddTree::TreeT::CRef node) {
-                if (node.is_leaf())
-                    return ADD_NONE;
+            auto [unreachable_l, unreachable_r] = unreachable[k];
+            int score = unreachable_l + unreachable_r;
+            int balance = std::abs(unreachable_l - unreachable_r);
 
-                int is_reachable_l = is_reachable.is_reachable(tree_index, node.left().id());
-                int is_reachable_r = is_reachable.is_reachable(tree_index, node.right().id());
+            if (score >= max_score)
+            if (score > max_score || min_balance > balance)
+            {
+                max_split = candidates[k];
+                max_score = score;
+                min_balance = balance;
+                has_improved = true;
+            }
+        }
 
-                // only consider split if both left and right subtree are reachable
-                if (!is_reachable_l && !is_reachable_r)
-                    return ADD_NONE;
-                if (!is_reachable_l)
-                    return ADD_RIGHT;
-                if (!is_reachable_r)
-                    return ADD_LEFT;
+        return has_improved;
+    }
 
-                Domain dom_l, dom_r;
-                FeatId feat_id;
+    std::vector<std::tuple<DomTreeSplit, int>>
+    DomTreeLeaf::get_split_candidates() const
+    {
+        std::vector<std::tuple<DomTreeSplit, int>> result;
+        for (size_t i = 0; i < num_instances(); ++i)
+        {
+            std::vector<Split> candidates;
+            std::vector<int> counts;
+            inner::collect_split_candidates(*instances_[i].addtree,
+                    instances_[i].is_reachable, candidates, counts);
+            for (size_t k = 0; k < candidates.size(); ++k)
+                result.push_back({DomTreeSplit{i, candidates[k]}, counts[k]});
+        }
+        return result;
+    }
 
-                bool skip = visit_split(
-                    [&dom_l, &dom_r, &feat_id, &duplicates]
-                    (const LtSplit& split) -> bool {
-                        feat_id = split.feat_id;
+    std::vector<std::tuple<int, int>>
+    DomTreeLeaf::count_unreachable_leafs(
+            const std::vector<DomTreeSplit>& splits, int nthreads) const
+    {
+        for (const DomTreeSplit& split : splits)
+            if (split.instance_index >= num_instances())
+                throw std::runtime_error("count_unreachable_leafs: invalid instance");
 
-                        auto& feat_id_dups = duplicates[split.feat_id]; // auto-initialize set for feat_id
-                        auto p = feat_id_dups.find(split.split_value);
-                        if (p != feat_id_dups.end())
-                            return true; // already checked, skip!
-                        feat_id_dups.insert(split.split_value);
+        std::vector<std::tuple<int, int>> result(splits.size());
+        for (size_t i = 0; i < num_instances(); ++i)
+        {
+            std::vector<size_t> ks; // splits for instance i
+            for (size_t k = 0; k < splits.size(); ++k)
+                if (splits[k].instance_index == i) ks.push_back(k);
+            if (ks.empty()) continue;
+
+            const inner::SplitIndex index = inner::build_split_index(
+                    *instances_[i].addtree, instances_[i].is_reachable, nthreads);
+            auto unreachable = inner::count_unreachable_leafs(index, ks.size(),
+                    [&splits, &ks](size_t k) -> const Split& { return splits[ks[k]].split; },
+                    nthreads);
+            for (size_t k = 0; k < ks.size(); ++k)
+                result[ks[k]] = unreachable[k];
+        }
+        return result;
+    }
 
-                        std::tie(dom_l, dom_r) = RealDomain().split(split.split_value);
-                        return false;
-                    },
-                    [&dom_l, &dom_r, &feat_id, &duplicates]
-                    (const BoolSplit& split) -> bool {
-                        feat_id = split.feat_id;
+    namespace inner {
 
-                        if (duplicates.find(split.feat_id) != duplicates.end())
-                            return true; // already in duplicates, skip!
-                        duplicates[split.feat_id]; // use duplicates as set for bool attributes
+        /* Width of the reachable leaf value range of one tree, optionally
+         * with the domain of `feat_id` set to `new_dom`. */
+        static
+        FloatT
+        tree_bounds_width(const AddTree& at, const IsReachable& is_reachable,
+                size_t tree_index, FeatId feat_id, const std::optional<Domain>& new_dom)
+        {
+            FloatT min =  std::numeric_limits<FloatT>::infinity();
+            FloatT max = -std::numeric_limits<FloatT>::infinity();
+            auto f = [&is_reachable, &min, &max](
+                    size_t tree_index,
+                    AddTree::TreeT::CRef node,
+                    bool marked) -> bool
+            {
+                if (marked || !is_reachable.is_reachable(tree_index, node.id()))
+                    return false; // (becomes) unreachable, stop
+                if (node.is_leaf())
+                {
+                    min = std::min(min, node.leaf_value());
+                    max = std::max(max, node.leaf_value());
+                    return false;
+                }
+                return true;
+            };
 
-                        // TODO remove check
-                        //if (duplicates.find(split.feat_id) == duplicates.end())
-                        //    throw std::runtime_error("assertion fail");
+            if (new_dom)
+                visit_addtree(at, is_reachable, tree_index, at[tree_index].root(),
+                        feat_id, *new_dom, false, f);
+            else // no split: a feat_id that does not occur
+                visit_addtree(at, is_reachable, tree_index, at[tree_index].root(),
+                        -1, Domain(), false, f);
 
-                        std::tie(dom_l, dom_r) = BoolDomain().split();
+            return min <= max ? max - min : 0.0; // empty tree: 0
+        }
 
-                        return false;
-                    },
-                    node.get_split());
+        /* The tree bounds widths of a leaf without a split, and for each
+         * feature the trees with a reachable split on it: a split on a
+         * feature only changes the widths of those trees. */
+        struct TreeBoundsWidths {
+            std::vector<FloatT> widths; // per tree
+            double sum;
+            std::unordered_map<FeatId, std::vector<size_t>> trees; // feat_id -> tree indexes
+        };
 
-                if (skip) // we've already checked this split
+        static
+        TreeBoundsWidths
+        tree_bounds_widths(const AddTree& at, const IsReachable& is_reachable)
+        {
+            TreeBoundsWidths tbw;
+            tbw.widths.resize(at.size());
+            tbw.sum = 0.0;
+            for (size_t tree_index = 0; tree_index < at.size(); ++tree_index)
+            {
+                tbw.widths[tree_index] = tree_bounds_width(at, is_reachable,
+                        tree_index, -1, {});
+                tbw.sum += tbw.widths[tree_index];
+
+                at[tree_index].dfs([&is_reachable, &tbw, tree_index](AddTree::TreeT::CRef node) {
+                    if (!is_reachable.is_reachable(tree_index, node.id()) || node.is_leaf())
+                        return ADD_NONE;
+                    FeatId feat_id = visit_split(
+                            [](const LtSplit& s) { return s.feat_id; },
+                            [](const BoolSplit& s) { return s.feat_id; },
+                            node.get_split());
+                    auto& trees = tbw.trees[feat_id];
+                    if (trees.empty() || trees.back() != tree_index)
+                        trees.push_back(tree_index);
                     return ADD_LEFT_AND_RIGHT;
+                });
+            }
+            return tbw;
+        }
 
-                // compute the number of unreachable nodes when we split the domain
-                // on split.feat_id <> split.split_value
-                int unreachable_l = count_unreachable_leafs(i, feat_id, dom_l);
-                int unreachable_r = count_unreachable_leafs(i, feat_id, dom_r);
-                int score = unreachable_l + unreachable_r;
-                int balance = std::abs(unreachable_l - unreachable_r);
-
-                //std::cout
-                //    << "instance=" << i
-                //    << ", tree_index=" << tree_index
-                //    << ", split=" << node.get_split()
-                //    << ", score=" << score
-                //    << ", (" << unreachable_l << ", " << unreachable_r << ")"
-                //    << ", balance=" << balance
-                //    << std::endl;
-
-                if (score >= max_score)
-                if (score > max_score || min_balance > balance)
-                {
-                    max_split = node.get_split();
-                    max_score = score;
-                    min_balance = balance;
-                    has_improved = true;
-                }
+        static
+        FloatT
+        sum_tree_bounds_width(const AddTree& at, const IsReachable& is_reachable,
+                const TreeBoundsWidths& tbw, FeatId feat_id, const Domain& new_dom)
+        {
+            auto search = tbw.trees.find(feat_id);
+            if (search == tbw.trees.end())
+                return static_cast<FloatT>(tbw.sum);
 
-                return ADD_LEFT_AND_RIGHT;
-            });
-            ++tree_index;
+            double sum = tbw.sum;
+            for (size_t tree_index : search->second)
+            {
+                sum -= tbw.widths[tree_index];
+                sum += tree_bounds_width(at, is_reachable, tree_index, feat_id, new_dom);
+            }
+            return static_cast<FloatT>(sum);
         }
 
-        //std::cout
-        //    << "best split l" << domtree_leaf_id_
-        //    << ", instance=" << i
-        //    << ", split=" << max_split
-        //    << ", score=" << max_score
-        //    << ", balance=" << min_balance
-        //    << std::endl;
+    } /* namespace inner */
 
-        return has_improved;
+    FloatT
+    DomTreeLeaf::sum_tree_bounds_width(size_t i, FeatId feat_id,
+            std::optional<Domain> new_dom) const
+    {
+        const AddTree& at = *instances_.at(i).addtree;
+        const IsReachable& is_reachable = instances_.at(i).is_reachable;
+
+        FloatT sum = 0.0;
+        for (size_t tree_index = 0; tree_index < at.size(); ++tree_index)
+            sum += inner::tree_bounds_width(at, is_reachable, tree_index, feat_id, new_dom);
+        return sum;
+    }
+
+    std::vector<std::tuple<FloatT, FloatT>>
+    DomTreeLeaf::sum_tree_bounds_width(
+            const std::vector<DomTreeSplit>& splits, int nthreads) const
+    {
+        for (const DomTreeSplit& split : splits)
+            if (split.instance_index >= num_instances())
+                throw std::runtime_error("sum_tree_bounds_width: invalid instance");
+
+        // the widths without split, once per instance
+        std::vector<std::optional<inner::TreeBoundsWidths>> tbws(num_instances());
+        for (const DomTreeSplit& split : splits)
+        {
+            size_t i = split.instance_index;
+            if (!tbws[i])
+                tbws[i] = inner::tree_bounds_widths(*instances_[i].addtree,
+                        instances_[i].is_reachable);
+        }
+
+        std::vector<std::tuple<FloatT, FloatT>> result(splits.size());
+        util::parallel_for(nthreads, splits.size(),
+                [this, &splits, &tbws, &result](size_t begin, size_t end, size_t) {
+            for (size_t k = begin; k < end; ++k)
+            {
+                const DomTreeSplit& s = splits[k];
+                const AddTree& at = *instances_[s.instance_index].addtree;
+                const IsReachable& is_reachable = instances_[s.instance_index].is_reachable;
+                const inner::TreeBoundsWidths& tbw = *tbws[s.instance_index];
+
+                Domain dom_l, dom_r;
+                FeatId feat_id = visit_split(
+                    [&dom_l, &dom_r](const LtSplit& s) {
+                        std::tie(dom_l, dom_r) = s.get_domains();
+                        return s.feat_id;
+                    },
+                    [&dom_l, &dom_r](const BoolSplit& s) {
+                        std::tie(dom_l, dom_r) = s.get_domains();
+                        return s.feat_id;
+                    },
+                    s.split);
+                result[k] = {
+                    inner::sum_tree_bounds_width(at, is_reachable, tbw, feat_id, dom_l),
+                    inner::sum_tree_bounds_width(at, is_reachable, tbw, feat_id, dom_r)
+                };
+            }
+        });
+        return result;
+    }
+
+    void
+    DomTreeLeaf::set_best_split(const DomTreeSplit& split, int score, int balance)
+    {
+        if (split.instance_index >= num_instances())
+            throw std::runtime_error("set_best_split: invalid instance");
+        best_split_.emplace(split);
+        this->score = score;
+        this->balance = balance;
     }
 
     int
@@ -684,6 +1221,240 @@ namespace treeck {
         return {min, max};
     }
 
+    namespace inner {
+
+        static void
+        smtlib_real(std::string& out, double value)
+        {
+            if (!std::isfinite(value))
+                throw std::runtime_error("to_smtlib: non-finite value");
+
+            // shortest round-trip digits d.ddde[+-]x, the digits of Python's
+            // repr used by z3py, written as a plain decimal for SMT-LIB
+            char buf[64];
+            auto res = std::to_chars(buf, buf + sizeof(buf), std::abs(value),
+                    std::chars_format::scientific);
+            std::string mantissa(buf, res.ptr);
+            size_t e = mantissa.find('e');
+            int pos = std::stoi(mantissa.substr(e + 1)) + 1; // decimal point
+            std::string digits = mantissa.substr(0, e);
+            digits.erase(std::remove(digits.begin(), digits.end(), '.'), digits.end());
+
+            std::string dec;
+            int n = static_cast<int>(digits.size());
+            if (pos <= 0)     dec = "0." + std::string(-pos, '0') + digits;
+            else if (pos < n) dec = digits.substr(0, pos) + "." + digits.substr(pos);
+            else              dec = digits + std::string(pos - n, '0') + ".0";
+
+            if (value < 0.0) out += "(- " + dec + ")";
+            else             out += dec;
+        }
+
+        /* Shared boolean literals `s<f>_<bits>_<instance>` for the LtSplits
+         * of a `to_smtlib` call, one per (feat_id, split_value). */
+        struct SmtlibLiterals {
+            size_t instance;
+            std::map<std::pair<FeatId, FloatT>, std::string> lits;
+
+            std::string
+            get(const Split& split)
+            {
+                return visit_split(
+                    [this](const LtSplit& s) {
+                        auto key = std::make_pair(s.feat_id, s.split_value);
+                        auto it = lits.find(key);
+                        if (it != lits.end())
+                            return it->second;
+                        uint32_t bits;
+                        std::memcpy(&bits, &s.split_value, sizeof(bits));
+                        char hex[9];
+                        std::snprintf(hex, sizeof(hex), "%08x", bits);
+                        std::string lit = "s" + std::to_string(s.feat_id) + "_"
+                            + hex + "_" + std::to_string(instance);
+                        lits.emplace(key, lit);
+                        return lit;
+                    },
+                    [](const BoolSplit& s) {
+                        return "x" + std::to_string(s.feat_id);
+                    },
+                    split);
+            }
+
+            /* Declarations and definitions of the literals handed out, and
+             * the order of consecutive thresholds of a feature: x < a implies
+             * x < b for a < b. */
+            void
+            define(std::string& out) const
+            {
+                const std::string *prev = nullptr;
+                FeatId prev_feat_id = -1;
+                for (auto& [key, lit] : lits) // sorted by (feat_id, split_value)
+                {
+                    out += "(declare-const " + lit + " Bool)\n(assert (= " + lit
+                        + " (< x" + std::to_string(key.first) + " ";
+                    smtlib_real(out, key.second);
+                    out += ")))\n";
+                    if (prev != nullptr && prev_feat_id == key.first)
+                        out += "(assert (=> " + *prev + " " + lit + "))\n";
+                    prev = &lit;
+                    prev_feat_id = key.first;
+                }
+            }
+        };
+
+        /* Returns false if no leaf below `node` is reachable. */
+        static bool
+        smtlib_node(std::string& out, const DomTreeLeaf& leaf, size_t instance,
+                size_t tree_index, AddTree::TreeT::CRef node, FloatT& lo,
+                FloatT& hi, int& leaf_count, SmtlibLiterals *lits)
+        {
+            if (node.is_leaf())
+            {
+                out += "(= w" + std::to_string(tree_index) + " ";
+                smtlib_real(out, node.leaf_value());
+                out += ")";
+                lo = std::min(lo, node.leaf_value());
+                hi = std::max(hi, node.leaf_value());
+                ++leaf_count;
+                return true;
+            }
+
+            std::string l, r, cond;
+            bool has_l = leaf.is_reachable(instance, tree_index, node.left().id())
+                && smtlib_node(l, leaf, instance, tree_index, node.left(), lo, hi,
+                        leaf_count, lits);
+            bool has_r = leaf.is_reachable(instance, tree_index, node.right().id())
+                && smtlib_node(r, leaf, instance, tree_index, node.right(), lo, hi,
+                        leaf_count, lits);
+
+            if (lits != nullptr) cond = lits->get(node.get_split());
+            else visit_split(
+                [&cond](const LtSplit& s) {
+                    cond = "(< x" + std::to_string(s.feat_id) + " ";
+                    smtlib_real(cond, s.split_value); // consistent with LtSplit::test
+                    cond += ")";
+                },
+                [&cond](const BoolSplit& s) {
+                    cond = "x" + std::to_string(s.feat_id); // true goes left
+                },
+                node.get_split());
+
+            if (has_l && has_r) out += "(ite " + cond + " " + l + " " + r + ")";
+            else if (has_l)     out += "(and " + cond + " " + l + ")";
+            else if (has_r)     out += "(and (not " + cond + ") " + r + ")";
+            return has_l || has_r;
+        }
+
+        /* Leaf indicators: the reachable leafs below `node` with the split
+         * literals on their path. */
+        static void
+        smtlib_leafs(std::vector<std::tuple<NodeId, FloatT, std::string>>& leafs,
+                const DomTreeLeaf& leaf, size_t instance, size_t tree_index,
+                AddTree::TreeT::CRef node, std::string& path,
+                SmtlibLiterals& lits)
+        {
+            if (node.is_leaf())
+            {
+                leafs.emplace_back(node.id(), node.leaf_value(), path);
+                return;
+            }
+
+            std::string lit = lits.get(node.get_split());
+            size_t n = path.size();
+            if (leaf.is_reachable(instance, tree_index, node.left().id()))
+            {
+                path += " " + lit;
+                smtlib_leafs(leafs, leaf, instance, tree_index, node.left(),
+                        path, lits);
+                path.resize(n);
+            }
+            if (leaf.is_reachable(instance, tree_index, node.right().id()))
+            {
+                path += " (not " + lit + ")";
+                smtlib_leafs(leafs, leaf, instance, tree_index, node.right(),
+                        path, lits);
+                path.resize(n);
+            }
+        }
+
+    } /* namespace inner */
+
+    std::string
+    DomTreeLeaf::to_smtlib(size_t instance, const std::vector<size_t>& tree_indices,
+            int& leaf_count, bool leaf_indicators, bool shared_splits) const
+    {
+        const AddTree& at = *instances_.at(instance).addtree;
+        inner::SmtlibLiterals lits{instance, {}};
+        std::string out;
+        for (size_t tree_index : tree_indices)
+        {
+            if (tree_index >= at.size())
+                throw std::runtime_error("to_smtlib: tree_index out of bounds");
+
+            FloatT lo =  std::numeric_limits<FloatT>::infinity();
+            FloatT hi = -std::numeric_limits<FloatT>::infinity();
+            std::string w = "w" + std::to_string(tree_index);
+            AddTree::TreeT::CRef root = at[tree_index].root();
+            bool has_leafs = is_reachable(instance, tree_index, root.id());
+
+            if (has_leafs && leaf_indicators)
+            {
+                std::vector<std::tuple<NodeId, FloatT, std::string>> leafs;
+                std::string path;
+                inner::smtlib_leafs(leafs, *this, instance, tree_index, root,
+                        path, lits);
+
+                // one Bool per leaf: exactly one holds, and it implies its path
+                std::string ls, sum;
+                for (auto& [node_id, value, conds] : leafs)
+                {
+                    std::string l = "l" + std::to_string(tree_index) + "_"
+                        + std::to_string(node_id) + "_" + std::to_string(instance);
+                    out += "(declare-const " + l + " Bool)\n";
+                    if (!conds.empty())
+                        out += "(assert (=> " + l + " (and" + conds + ")))\n";
+                    ls += " " + l;
+                    sum += " (ite " + l + " ";
+                    inner::smtlib_real(sum, value);
+                    sum += " 0.0)";
+                    lo = std::min(lo, value);
+                    hi = std::max(hi, value);
+                }
+                leaf_count += static_cast<int>(leafs.size());
+                if (leafs.empty())
+                    has_leafs = false;
+                else if (leafs.size() == 1)
+                    out += "(assert" + ls + ")\n(assert (= " + w + sum + "))\n";
+                else
+                    out += "(assert (or" + ls + "))\n(assert ((_ at-most 1)" + ls
+                        + "))\n(assert (= " + w + " (+" + sum + ")))\n";
+            }
+            else
+            {
+                out += "(assert ";
+                has_leafs = has_leafs && inner::smtlib_node(out, *this, instance,
+                        tree_index, root, lo, hi, leaf_count,
+                        shared_splits ? &lits : nullptr);
+                out += has_leafs ? ")\n" : "false)\n";
+            }
+
+            if (!has_leafs)
+            {
+                if (leaf_indicators) out += "(assert false)\n";
+                continue;
+            }
+            out += "(assert (>= " + w + " ";
+            inner::smtlib_real(out, lo);
+            out += "))\n(assert (<= " + w + " ";
+            inner::smtlib_real(out, hi);
+            out += "))\n";
+        }
+
+        std::string defs;
+        lits.define(defs);
+        return defs + out;
+    }
+
     DomTreeLeaf
     DomTreeLeaf::merge(const std::vector<DomTreeLeaf>& leafs)
     {
@@ -734,10 +1505,36 @@ namespace treeck {
     void
     DomTreeLeaf::to_binary(std::ostream& os) const
     {
+        bool registered = std::all_of(instances_.begin(), instances_.end(),
+                [](const DomTreeLeafInstance& inst) {
+                    return AddTreeRegistry::get(inst.addtree->model_id()) != nullptr;
+                });
+
         cereal::BinaryOutputArchive ar(os);
         ar(cereal::make_nvp("id", domtree_leaf_id_),
-           cereal::make_nvp("instances", instances_),
-           cereal::make_nvp("best_split", best_split_),
+           cereal::make_nvp("registered", registered));
+
+        if (registered)
+        {
+            std::vector<uint64_t> model_ids;
+            std::vector<DomainsT> domains;
+            std::vector<IsReachable> is_reachables;
+            for (const DomTreeLeafInstance& inst : instances_)
+            {
+                model_ids.push_back(inst.addtree->model_id());
+                domains.push_back(inst.domains);
+                is_reachables.push_back(inst.is_reachable); // shares bits
+            }
+            ar(cereal::make_nvp("model_ids", model_ids),
+               cereal::make_nvp("domains", domains),
+               cereal::make_nvp("is_reachables", is_reachables));
+        }
+        else
+        {
+            ar(cereal::make_nvp("instances", instances_));
+        }
+
+        ar(cereal::make_nvp("best_split", best_split_),
            cereal::make_nvp("score", score),
            cereal::make_nvp("balance", balance));
     }
@@ -746,14 +1543,44 @@ namespace treeck {
     DomTreeLeaf::from_binary(std::istream& is)
     {
         NodeId id;
+        bool registered;
         std::vector<DomTreeLeafInstance> instances;
         std::optional<DomTreeSplit> best_split;
         int score, balance;
         {
             cereal::BinaryInputArchive ar(is);
             ar(cereal::make_nvp("id", id),
-               cereal::make_nvp("instances", instances),
-               cereal::make_nvp("best_split", best_split),
+               cereal::make_nvp("registered", registered));
+
+            if (registered)
+            {
+                std::vector<uint64_t> model_ids;
+                std::vector<DomainsT> domains;
+                std::vector<IsReachable> is_reachables;
+                ar(cereal::make_nvp("model_ids", model_ids),
+                   cereal::make_nvp("domains", domains),
+                   cereal::make_nvp("is_reachables", is_reachables));
+
+                if (model_ids.size() != domains.size()
+                        || model_ids.size() != is_reachables.size())
+                    throw std::runtime_error("DomTreeLeaf::from_binary: invalid data");
+
+                for (size_t i = 0; i < model_ids.size(); ++i)
+                {
+                    auto addtree = AddTreeRegistry::get(model_ids[i]);
+                    if (!addtree)
+                        throw std::runtime_error("DomTreeLeaf::from_binary: unknown "
+                                "model id, register the AddTree first");
+                    instances.push_back({addtree, std::move(domains[i]),
+                            std::move(is_reachables[i])});
+                }
+            }
+            else
+            {
+                ar(cereal::make_nvp("instances", instances));
+            }
+
+            ar(cereal::make_nvp("best_split", best_split),
                cereal::make_nvp("score", score),
                cereal::make_nvp("balance", balance));
         }
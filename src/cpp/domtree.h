@@ -7,6 +7,7 @@
 #ifndef TREECK_DOMTREE_H
 #define TREECK_DOMTREE_H
 
+#include <cstdint>
 #include <string>
 #include <utility>
 #include <ostream>
@@ -21,25 +22,23 @@
 
 namespace treeck {
 
-    struct IsReachableKey {
-        int tree_index;
-        NodeId node_id;
-
-        template <typename Archive>
-        void serialize(Archive& archive);
-    };
-
-    bool operator==(const IsReachableKey& a, const IsReachableKey& b);
-
-    struct IsReachableKeyHash {
-        size_t operator()(const IsReachableKey& k) const;
+    /** Unreachable nodes as one dense bitset per tree, indexed by NodeId.
+     * Bitsets grow on demand; missing bits are reachable.
+     *
+     * Copies share their storage (copy-on-write at two levels: the list of
+     * trees, and each tree's bitset), so the near-identical IsReachables of
+     * DomTree nodes only pay for the trees in which they differ. */
+    class IsReachable {
+        using WordT = uint64_t;
+        using BitsT = std::vector<WordT>;
+        using TreeBitsT = std::vector<std::shared_ptr<BitsT>>; // tree_index -> bitset
+        static constexpr size_t WORD_BITS = 64;
 
-        template <typename Archive>
-        void serialize(Archive& archive);
-    };
+        std::shared_ptr<TreeBitsT> unreachable_; // null when all reachable
+        size_t num_unreachable_;
 
-    class IsReachable {
-        std::unordered_set<IsReachableKey, IsReachableKeyHash> unreachable_;
+        TreeBitsT& mut_trees(size_t num_trees); // unshares tree list
+        BitsT& mut_bits(size_t tree_index, size_t num_words); // unshares bitset
 
     public:
         IsReachable();
@@ -56,7 +55,10 @@ namespace treeck {
         void combine(const IsReachable& other);
 
         template <typename Archive>
-        void serialize(Archive& archive);
+        void save(Archive& archive) const;
+
+        template <typename Archive>
+        void load(Archive& archive);
     };
 
     using ReachableT = std::unordered_map<NodeId, IsReachable>; // domtree_node_id -> IsReachble
@@ -134,7 +136,18 @@ namespace treeck {
         DomTreeLeaf get_leaf(NodeId domtree_leaf_id) const;
         void apply_leaf(DomTreeLeaf&& leaf);
 
+        /**
+         * Split the leaf into up to 2^splits.size() parts in one step: each
+         * split is applied to every part whose domain it still divides.
+         * Returns the domtree leaf ids of the parts, from left to right.
+         */
+        std::vector<NodeId>
+        apply_leaf(DomTreeLeaf&& leaf, const std::vector<DomTreeSplit>& splits);
+
     private:
+        void combine_leaf(DomTreeLeaf& leaf);
+        bool divides(NodeId domtree_leaf_id, const DomTreeSplit& split) const;
+        void split_leaf(NodeId domtree_leaf_id, const DomTreeSplit& split);
         void update_is_reachable(size_t instance, NodeId domtree_leaf_id,
                 FeatId feat_id, Domain new_dom);
     };
@@ -173,18 +186,71 @@ namespace treeck {
         bool is_reachable(size_t instance, size_t tree_index, NodeId) const;
         void mark_unreachable(size_t instance, size_t tree_index, NodeId);
 
-        void find_best_split();
+        /** Mark the nodes of tree `tree_index` that cannot be reached by any
+         * point in the box `domains` unreachable, without a solver. Returns
+         * the number of newly marked nodes. */
+        int mark_unreachable_outside(size_t instance, size_t tree_index,
+                const DomainsT& domains);
+
+        /** Candidate splits are scored over `nthreads` threads (<= 0: all
+         * hardware threads); the result does not depend on `nthreads`. */
+        void find_best_split(int nthreads = 1);
         bool find_best_split_for_instance(size_t instance, Split& max_split,
-                int& max_score, int& min_balance);
+                int& max_score, int& min_balance, int nthreads = 1);
 
         int count_unreachable_leafs(size_t instance,
                 FeatId feat_id, Domain new_dom) const;
 
+        /** Distinct splits of reachable nodes over all instances, with the
+         * number of reachable nodes using each split. */
+        std::vector<std::tuple<DomTreeSplit, int>> get_split_candidates() const;
+
+        /** Unreachable leaf counts (left, right) for each split. */
+        std::vector<std::tuple<int, int>>
+        count_unreachable_leafs(const std::vector<DomTreeSplit>& splits,
+                int nthreads = 1) const;
+
+        /** Sum over the trees of the width of the reachable leaf value
+         * range, optionally with the domain of `feat_id` set to `new_dom`. */
+        FloatT sum_tree_bounds_width(size_t instance, FeatId feat_id,
+                std::optional<Domain> new_dom) const;
+
+        /** sum_tree_bounds_width (left, right) for each split; only the
+         * trees that split on the feature of a split are walked again. */
+        std::vector<std::tuple<FloatT, FloatT>>
+        sum_tree_bounds_width(const std::vector<DomTreeSplit>& splits,
+                int nthreads = 1) const;
+
+        /** Use a split chosen elsewhere, e.g. by a Python heuristic. */
+        void set_best_split(const DomTreeSplit& split, int score, int balance);
+
         std::tuple<FloatT, FloatT>
         get_tree_bounds(size_t instance, size_t tree_index);
 
+        /**
+         * SMT-LIB 2 assertions for the reachable nodes of the trees
+         * `tree_indices` of `instance`, and bounds on their outputs. The
+         * output of tree t is the Real `w<t>`, feature f is `x<f>` (Real for
+         * LtSplits, Bool for BoolSplits); these are not declared. Adds the
+         * number of encoded leafs to `leaf_count`.
+         *
+         * Trees are nested `ite` terms, or, if `leaf_indicators`, one Bool per
+         * reachable leaf with an exactly-one constraint per tree, implications
+         * from each leaf to the split literals on its path, and `w<t>` as the
+         * sum of the leaf values of the indicators.
+         *
+         * With leaf indicators or `shared_splits`, LtSplits are Bools shared
+         * by the trees with the same (feat_id, split_value), and consecutive
+         * thresholds of a feature are ordered by implications.
+         */
+        std::string to_smtlib(size_t instance,
+                const std::vector<size_t>& tree_indices, int& leaf_count,
+                bool leaf_indicators = false, bool shared_splits = false) const;
+
         static DomTreeLeaf merge(const std::vector<DomTreeLeaf>& leafs);
 
+        /** AddTrees registered in the AddTreeRegistry are written as their
+         * model ids; `from_binary` looks them up again. */
         void to_binary(std::ostream& os) const;
         static DomTreeLeaf from_binary(std::istream& is);
     };
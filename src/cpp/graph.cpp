@@ -16,113 +16,137 @@
 #include <iostream>
 #include <iomanip>
 #include <limits>
+#include <numeric>
 #include <vector>
 
 #include "graph.h"
 
 namespace treeck {
 
-    DomainBox::DomainBox() : domains_() { }
+    DomainBox::DomainBox() : feat_ids_(), los_(), his_(), is_bool_() { }
 
-    std::vector<std::pair<FeatId, Domain>>::const_iterator
-    DomainBox::begin() const
+    size_t
+    DomainBox::size() const
+    {
+        return feat_ids_.size();
+    }
+
+    FeatId
+    DomainBox::feat_id(size_t i) const
+    {
+        return feat_ids_[i];
+    }
+
+    FloatT
+    DomainBox::lo(size_t i) const
     {
-        return domains_.begin();
+        return los_[i];
     }
 
-    std::vector<std::pair<FeatId, Domain>>::const_iterator
-    DomainBox::end() const
+    FloatT
+    DomainBox::hi(size_t i) const
     {
-        return domains_.end();
+        return his_[i];
     }
 
-    std::vector<std::pair<FeatId, Domain>>::const_iterator
+    Domain
+    DomainBox::domain(size_t i) const
+    {
+        if (!is_bool_[i])
+            return RealDomain(los_[i], his_[i]);
+        if (los_[i] == 0.0 && his_[i] == 2.0)
+            return BoolDomain();
+        return BoolDomain(los_[i] == 1.0);
+    }
+
+    std::vector<std::pair<FeatId, Domain>>
+    DomainBox::domains() const
+    {
+        std::vector<std::pair<FeatId, Domain>> domains;
+        for (size_t i = 0; i < size(); ++i)
+            domains.push_back({feat_ids_[i], domain(i)});
+        return domains;
+    }
+
+    int
     DomainBox::find(FeatId feat_id) const
     {
-        return std::find_if(domains_.cbegin(), domains_.cend(), 
-                [feat_id](const std::pair<FeatId, Domain>& arg) {
-            return arg.first == feat_id;
-        });
+        auto it = std::lower_bound(feat_ids_.begin(), feat_ids_.end(), feat_id);
+        if (it == feat_ids_.end() || *it != feat_id)
+            return -1;
+        return static_cast<int>(it - feat_ids_.begin());
     }
 
-    std::vector<std::pair<FeatId, Domain>>::iterator
-    DomainBox::find(FeatId feat_id)
+    void
+    DomainBox::refine(FeatId feat_id, FloatT lo, FloatT hi, bool is_bool)
     {
-        return std::find_if(domains_.begin(), domains_.end(), 
-                [feat_id](std::pair<FeatId, Domain>& arg) {
-            return arg.first == feat_id;
-        });
+        auto it = std::lower_bound(feat_ids_.begin(), feat_ids_.end(), feat_id);
+        size_t i = it - feat_ids_.begin();
+        if (it == feat_ids_.end() || *it != feat_id)
+        {
+            feat_ids_.insert(i, feat_id);
+            los_.insert(i, lo);
+            his_.insert(i, hi);
+            is_bool_.insert(i, is_bool);
+            return;
+        }
+
+        lo = std::max(lo, los_[i]);
+        hi = std::min(hi, his_[i]);
+        if (lo >= hi)
+            throw std::runtime_error("DomainBox::refine: empty domain");
+        los_[i] = lo;
+        his_[i] = hi;
     }
 
     void
     DomainBox::refine(Split split, bool is_left_child)
     {
+        const FloatT inf = std::numeric_limits<FloatT>::infinity();
         visit_split(
-                [this, is_left_child](const LtSplit& s) {
-                    auto p = find(s.feat_id);
-                    if (p == end()) {
-                        domains_.push_back({s.feat_id, refine_domain({}, s, is_left_child)});
-                    } else {
-                        RealDomain dom = util::get_or<RealDomain>(p->second);
-                        p->second = refine_domain(dom, s, is_left_child);
-                    }
+                [this, is_left_child, inf](const LtSplit& s) {
+                    if (is_left_child) refine(s.feat_id, -inf, s.split_value, false);
+                    else               refine(s.feat_id, s.split_value, inf, false);
                 },
                 [this, is_left_child](const BoolSplit& s) {
-                    auto p = find(s.feat_id);
-                    if (p == end()) {
-                        domains_.push_back({s.feat_id, refine_domain({}, s, is_left_child)});
-                    } else {
-                        BoolDomain dom = util::get_or<BoolDomain>(p->second);
-                        p->second = refine_domain(dom, s, is_left_child);
-                    }
-               },
-               split);
+                    if (is_left_child) refine(s.feat_id, 1.0, 2.0, true); // true goes left
+                    else               refine(s.feat_id, 0.0, 1.0, true);
+                },
+                split);
     }
 
     void
-    DomainBox::sort()
+    DomainBox::refine(FeatId feat_id, const Domain& dom)
     {
-        std::sort(domains_.begin(), domains_.end(), [](auto& p, auto& q) {
-            return p.first < q.first;
-        });
+        visit_domain(
+                [this, feat_id](const RealDomain& d) {
+                    refine(feat_id, d.lo, d.hi, false);
+                },
+                [this, feat_id](const BoolDomain& d) {
+                    if (d.is_true())       refine(feat_id, 1.0, 2.0, true);
+                    else if (d.is_false()) refine(feat_id, 0.0, 1.0, true);
+                    else                   refine(feat_id, 0.0, 2.0, true);
+                },
+                dom);
     }
 
     bool
     DomainBox::overlaps(const DomainBox& other) const
     {
-        //std::cout << "OVERLAPS" << std::endl;
-        //std::cout << "  " << *this << std::endl;
-        //std::cout << "  " << other << std::endl;
-
-        auto it0 = domains_.begin();
-        auto it1 = other.domains_.begin();
-        
-        // assume sorted
-        while (it0 != domains_.end() && it1 != other.domains_.end())
+        size_t i0 = 0, i1 = 0;
+        size_t n0 = size(), n1 = other.size();
+        while (i0 < n0 && i1 < n1)
         {
-            //std::cout << "checking " << it0->first << ", " << it1->first << std::endl;
-            if (it0->first == it1->first)
+            FeatId f0 = feat_ids_[i0], f1 = other.feat_ids_[i1];
+            if (f0 == f1)
             {
-                bool overlaps = visit_domain(
-                    [it1](const RealDomain& dom0) {
-                        auto dom1 = util::get_or<RealDomain>(it1->second);
-                        return dom0.overlaps(dom1);
-                    },
-                    [it1](const BoolDomain& dom0) {
-                        auto dom1 = util::get_or<BoolDomain>(it1->second);
-                        return (dom0.value_ & dom1.value_) != 0;
-                    },
-                    it0->second);
-
-                ++it0; ++it1;
-
-                if (!overlaps)
+                if (los_[i0] >= other.his_[i1] || other.los_[i1] >= his_[i0])
                     return false;
+                ++i0; ++i1;
             }
-            else if (it0->first < it1->first) ++it0;
-            else ++it1;
+            else if (f0 < f1) ++i0;
+            else ++i1;
         }
-
         return true;
     }
 
@@ -130,51 +154,41 @@ namespace treeck {
     DomainBox::combine(const DomainBox& other) const
     {
         DomainBox box;
+        size_t i0 = 0, i1 = 0;
+        size_t n0 = size(), n1 = other.size();
+        auto push = [&box](FeatId feat_id, FloatT lo, FloatT hi, bool is_bool) {
+            box.feat_ids_.push_back(feat_id);
+            box.los_.push_back(lo);
+            box.his_.push_back(hi);
+            box.is_bool_.push_back(is_bool);
+        };
 
-        auto it0 = domains_.begin();
-        auto it1 = other.domains_.begin();
-
-        // assume sorted
-        while (it0 != domains_.end() && it1 != other.domains_.end())
+        while (i0 < n0 && i1 < n1)
         {
-            if (it0->first == it1->first)
+            FeatId f0 = feat_ids_[i0], f1 = other.feat_ids_[i1];
+            if (f0 == f1)
             {
-                visit_domain(
-                    [&box, it1](const RealDomain& dom0) {
-                        auto dom1 = util::get_or<RealDomain>(it1->second);
-                        box.domains_.push_back({it1->first, dom0.intersect(dom1)});
-                    },
-                    [&box, it1](const BoolDomain& dom0) {
-                        auto dom1 = util::get_or<BoolDomain>(it1->second);
-                        box.domains_.push_back({it1->first, dom0.intersect(dom1)});
-                    },
-                    it0->second);
-
-                ++it0; ++it1;
+                push(f0, std::max(los_[i0], other.los_[i1]),
+                        std::min(his_[i0], other.his_[i1]), is_bool_[i0]);
+                ++i0; ++i1;
             }
-            else if (it0->first < it1->first)
+            else if (f0 < f1)
             {
-                box.domains_.push_back(*it0); // copy
-                ++it0;
+                push(f0, los_[i0], his_[i0], is_bool_[i0]);
+                ++i0;
             }
             else
             {
-                box.domains_.push_back(*it1); // copy
-                ++it1;
+                push(f1, other.los_[i1], other.his_[i1], other.is_bool_[i1]);
+                ++i1;
             }
         }
 
-        auto end = domains_.end();
-        if (it1 != domains_.end()) // it0 must be end
-        {
-            it0 = it1;
-            end = other.domains_.end();
-        }
-
-        for (; it0 != end; ++it0)
-        {
-            box.domains_.push_back(*it0); // copy
-        }
+        // at most one of the boxes has domains left
+        for (; i0 < n0; ++i0)
+            push(feat_ids_[i0], los_[i0], his_[i0], is_bool_[i0]);
+        for (; i1 < n1; ++i1)
+            push(other.feat_ids_[i1], other.los_[i1], other.his_[i1], other.is_bool_[i1]);
 
         return box;
     }
@@ -183,8 +197,8 @@ namespace treeck {
     operator<<(std::ostream& s, const DomainBox& box)
     {
         s << "DomainBox { ";
-        for (auto&& [feat_id, dom] : box)
-            s << feat_id << "->" << dom << " ";
+        for (size_t i = 0; i < box.size(); ++i)
+            s << box.feat_id(i) << "->" << box.domain(i) << " ";
         s << '}';
         return s;
     }
@@ -195,6 +209,118 @@ namespace treeck {
         , min_output(output)
         , max_output(output) { }
 
+    // - OverlapIndex ----------------------------------------------------------
+
+    OverlapIndex::OverlapIndex() : feats_(), num_vertices_(0) { }
+
+    void
+    OverlapIndex::build(const std::vector<Vertex>& vertices)
+    {
+        const FloatT inf = std::numeric_limits<FloatT>::infinity();
+        size_t n = vertices.size();
+
+        feats_.clear();
+        num_vertices_ = static_cast<int>(n);
+        for (const Vertex& v : vertices)
+            for (size_t k = 0; k < v.box.size(); ++k)
+                feats_[v.box.feat_id(k)]; // index each feature used by some vertex
+
+        size_t m = 1; // number of leafs of the max-tree
+        while (m < n) m <<= 1;
+
+        std::vector<std::pair<FloatT, FloatT>> intervals(n);
+        for (auto& [feat_id, index] : feats_)
+        {
+            for (size_t i = 0; i < n; ++i)
+            {
+                const DomainBox& box = vertices[i].box;
+                int k = box.find(feat_id);
+                intervals[i] = k == -1
+                    ? std::pair<FloatT, FloatT>{-inf, inf}
+                    : std::pair<FloatT, FloatT>{box.lo(k), box.hi(k)};
+            }
+
+            index.by_lo.resize(n);
+            std::iota(index.by_lo.begin(), index.by_lo.end(), 0);
+            std::stable_sort(index.by_lo.begin(), index.by_lo.end(),
+                [&intervals](int i, int j) {
+                    return intervals[i].first < intervals[j].first;
+                });
+
+            index.los.resize(n);
+            index.his.resize(n);
+            index.max_hi.assign(2 * m, -inf);
+            for (size_t i = 0; i < n; ++i)
+            {
+                index.los[i] = intervals[index.by_lo[i]].first;
+                index.his[i] = intervals[i].second;
+                index.max_hi[m + i] = intervals[index.by_lo[i]].second;
+            }
+            std::sort(index.his.begin(), index.his.end());
+            for (size_t k = m - 1; k > 0; --k)
+                index.max_hi[k] = std::max(index.max_hi[2*k], index.max_hi[2*k + 1]);
+        }
+    }
+
+    void
+    OverlapIndex::collect(const FeatIndex& index, size_t node, size_t node_lo,
+            size_t node_hi, size_t end, FloatT lo, std::vector<int>& out) const
+    {
+        // vertices at [node_lo, node_hi) in lo order; only [0, end) have v.lo < hi
+        if (node_lo >= end || index.max_hi[node] <= lo)
+            return;
+        if (node_hi - node_lo == 1)
+        {
+            out.push_back(index.by_lo[node_lo]);
+            return;
+        }
+        size_t mid = (node_lo + node_hi) / 2;
+        collect(index, 2 * node, node_lo, mid, end, lo, out);
+        collect(index, 2 * node + 1, mid, node_hi, end, lo, out);
+    }
+
+    void
+    OverlapIndex::candidates(const DomainBox& box, std::vector<int>& out) const
+    {
+        out.clear();
+
+        // the indexed feature of `box` with the fewest overlapping vertices:
+        // #(v.lo < hi) - #(v.hi <= lo), as v.hi <= lo implies v.lo < hi
+        const FeatIndex *best = nullptr;
+        size_t best_count = num_vertices_, best_end = 0;
+        FloatT best_lo = 0.0;
+        for (size_t k = 0; k < box.size(); ++k)
+        {
+            auto it = feats_.find(box.feat_id(k));
+            if (it == feats_.end())
+                continue;
+            const FeatIndex& index = it->second;
+            FloatT lo = box.lo(k), hi = box.hi(k);
+            size_t end = std::lower_bound(index.los.begin(), index.los.end(), hi)
+                - index.los.begin();
+            size_t below = std::upper_bound(index.his.begin(), index.his.end(), lo)
+                - index.his.begin();
+            size_t count = end > below ? end - below : 0;
+            if (count <= best_count)
+            {
+                best = &index;
+                best_count = count;
+                best_end = end;
+                best_lo = lo;
+            }
+        }
+
+        if (best == nullptr)
+        {
+            out.resize(num_vertices_);
+            std::iota(out.begin(), out.end(), 0);
+        }
+        else if (best_count > 0)
+        {
+            collect(*best, 1, 0, best->max_hi.size() / 2, best_end, best_lo, out);
+        }
+    }
+
     //bool
     //Vertex::operator<(const Vertex& other) const
     //{
@@ -214,10 +340,39 @@ namespace treeck {
         for (const AddTree::TreeT& tree : addtree.trees())
         {
             IndependentSet set;
-            fill_independence_set(set, tree.root());
+            fill_independence_set(set, tree.root(), [](AddTree::TreeT::CRef) {
+                return true;
+            });
 
             sets_.push_back(set);
         }
+        build_indexes();
+    }
+
+    KPartiteGraph::KPartiteGraph(const DomTreeLeaf& leaf, size_t instance)
+    {
+        const AddTree& addtree = *leaf.addtree(instance);
+
+        DomainBox leaf_box;
+        for (auto&& [feat_id, dom] : leaf.get_domains(instance))
+            leaf_box.refine(feat_id, dom);
+
+        for (size_t tree_index = 0; tree_index < addtree.size(); ++tree_index)
+        {
+            IndependentSet set;
+            fill_independence_set(set, addtree[tree_index].root(),
+                [&leaf, instance, tree_index](AddTree::TreeT::CRef node) {
+                    return leaf.is_reachable(instance, tree_index, node.id());
+                });
+
+            IndependentSet restricted;
+            for (const Vertex& v : set.vertices)
+                if (v.box.overlaps(leaf_box))
+                    restricted.vertices.push_back({v.box.combine(leaf_box), v.output});
+
+            sets_.push_back(std::move(restricted));
+        }
+        build_indexes();
     }
 
     std::vector<IndependentSet>::const_iterator
@@ -232,13 +387,18 @@ namespace treeck {
         return sets_.cend();
     }
 
+    template <typename F>
     void
-    KPartiteGraph::fill_independence_set(IndependentSet& set, AddTree::TreeT::CRef node)
+    KPartiteGraph::fill_independence_set(IndependentSet& set, AddTree::TreeT::CRef node,
+            const F& is_reachable)
     {
+        if (!is_reachable(node))
+            return;
+
         if (node.is_internal())
         {
-            fill_independence_set(set, node.left());
-            fill_independence_set(set, node.right());
+            fill_independence_set(set, node.left(), is_reachable);
+            fill_independence_set(set, node.right(), is_reachable);
         }
         else
         {
@@ -252,14 +412,22 @@ namespace treeck {
                 node = node.parent();
                 box.refine(node.get_split(), child_node.is_left_child());
             }
-            box.sort();
             set.vertices.push_back({box, leaf_value});
         }
     }
 
+    void
+    KPartiteGraph::build_indexes()
+    {
+        for (auto& set : sets_)
+            set.index.build(set.vertices);
+    }
+
     std::tuple<FloatT, FloatT>
     KPartiteGraph::propagate_outputs()
     {
+        std::vector<int> candidates;
+
         // dynamic programming algorithm from paper Chen et al. 2019
         // we do it from the back to the front
         for (auto it1 = sets_.rbegin() + 1; it1 != sets_.rend(); ++it1)
@@ -269,8 +437,10 @@ namespace treeck {
             {
                 FloatT min0 = +std::numeric_limits<FloatT>::infinity();
                 FloatT max0 = -std::numeric_limits<FloatT>::infinity();
-                for (const auto& v0 : it0->vertices)
+                it0->index.candidates(v1.box, candidates);
+                for (int i : candidates)
                 {
+                    const Vertex& v0 = it0->vertices[i];
                     if (v0.box.overlaps(v1.box))
                     {
                         min0 = std::min(min0, v0.min_output);
@@ -301,6 +471,7 @@ namespace treeck {
     KPartiteGraph::merge(int K)
     {
         std::vector<IndependentSet> new_sets;
+        std::vector<int> candidates;
 
         for (auto it = sets_.cbegin(); it != sets_.cend(); )
         {
@@ -311,8 +482,11 @@ namespace treeck {
             {
                 for (const auto& v0 : set0.vertices)
                 {
-                    for (const auto& v1 : it->vertices)
+                    it->index.candidates(v0.box, candidates);
+                    std::sort(candidates.begin(), candidates.end()); // keep vertex order
+                    for (int i : candidates)
                     {
+                        const Vertex& v1 = it->vertices[i];
                         if (v0.box.overlaps(v1.box))
                         {
                             auto box = v0.box.combine(v1.box);
@@ -330,6 +504,7 @@ namespace treeck {
         }
 
         std::swap(new_sets, sets_);
+        build_indexes();
     }
 
     void
@@ -339,9 +514,10 @@ namespace treeck {
         {
             std::sort(set.vertices.begin(), set.vertices.end(),
                 [](const Vertex& a, const Vertex& b){
-                    return a.output < b.output;
+                    return a.min_output < b.min_output;
             });
         }
+        build_indexes();
     }
 
     void
@@ -351,9 +527,10 @@ namespace treeck {
         {
             std::sort(set.vertices.begin(), set.vertices.end(),
                 [](const Vertex& a, const Vertex& b){
-                    return a.output > b.output;
+                    return a.max_output > b.max_output;
             });
         }
+        build_indexes();
     }
 
     size_t
@@ -413,7 +590,7 @@ namespace treeck {
     std::ostream&
     operator<<(std::ostream&s, const Clique& c)
     {
-        std::cout
+        s
             << "Clique { " << std::endl
             << "    box=" << c.box << std::endl
             << "    output=" << c.output << std::endl
@@ -426,17 +603,28 @@ namespace treeck {
 
     template <typename Cmp>
     KPartiteGraphFind<Cmp>::KPartiteGraphFind(KPartiteGraph& graph)
-        : graph_(graph), nsteps_(0)
+        : graph_(graph)
+        , nsteps_(0)
+        , npushes_(0)
+        , npops_(0)
+        , max_pq_size_(0)
+        , callback_()
+        , callback_every_(1)
+        , pq_budget_(0)
+        , npruned_(0)
+        , pruned_estimate_(0.0)
     {
+        auto&& [min, max] = graph.propagate_outputs();
+
+        // the first compatible vertex then has the best bound in its set, so
+        // that the output estimates of the cliques are admissible
         if constexpr (std::is_same_v<MaxKPartiteGraphFind, KPartiteGraphFind<Cmp>>)
-            graph.sort_desc(); // try vertices with greater output values first
+            graph.sort_desc(); // try vertices with greater max_output values first
         else if constexpr (std::is_same_v<MinKPartiteGraphFind, KPartiteGraphFind<Cmp>>)
-            graph.sort_asc(); // try vertices with smaller output values first
+            graph.sort_asc(); // try vertices with smaller min_output values first
         else
             static_assert(util::always_false<Cmp>::value, "invalid Cmp type"); 
 
-        auto&& [min, max] = graph.propagate_outputs();
-
         FloatT output_estimate = 0.0;
         if constexpr (std::is_same_v<MaxKPartiteGraphFind, KPartiteGraphFind<Cmp>>)
             output_estimate = max;
@@ -453,7 +641,7 @@ namespace treeck {
         //    }
         //}
 
-        if (graph.num_independent_sets() > 0)
+        if (graph.num_independent_sets() > 0 && !graph.sets_.front().vertices.empty())
         {
             int indep_set = 0; // join into the first tree
             int vertex = 0; // the first vertex of the first indep.set
@@ -467,8 +655,6 @@ namespace treeck {
                 vertex
             });
         }
-
-        std::cout << "THE GRAPH " << graph << std::endl;
     }
 
     template <typename Cmp>
@@ -478,6 +664,7 @@ namespace treeck {
         std::pop_heap(pq_buf_.begin(), pq_buf_.end(), cmp_);
         Clique c = std::move(pq_buf_.back());
         pq_buf_.pop_back();
+        ++npops_;
         return c;
     }
 
@@ -487,6 +674,39 @@ namespace treeck {
     {
         pq_buf_.push_back(std::move(c));
         std::push_heap(pq_buf_.begin(), pq_buf_.end(), cmp_);
+        ++npushes_;
+        if (pq_budget_ > 0 && pq_buf_.size() > pq_budget_)
+            pq_prune();
+        max_pq_size_ = std::max(max_pq_size_, pq_buf_.size());
+    }
+
+    template <typename Cmp>
+    bool
+    KPartiteGraphFind<Cmp>::is_better(FloatT a, FloatT b) const
+    {
+        if constexpr (std::is_same_v<MaxKPartiteGraphFind, KPartiteGraphFind<Cmp>>)
+            return a > b;
+        else
+            return a < b;
+    }
+
+    template <typename Cmp>
+    void
+    KPartiteGraphFind<Cmp>::pq_prune()
+    {
+        // keep the better half; cmp_(a, b) is true if a is worse than b
+        size_t keep = std::max<size_t>(1, pq_budget_ / 2);
+        std::nth_element(pq_buf_.begin(), pq_buf_.begin() + keep, pq_buf_.end(),
+                [this](const Clique& a, const Clique& b) { return cmp_(b, a); });
+
+        // the best of the pruned cliques is at `keep`
+        FloatT est = pq_buf_[keep].output_estimate;
+        if (npruned_ == 0 || is_better(est, pruned_estimate_))
+            pruned_estimate_ = est;
+        npruned_ += pq_buf_.size() - keep;
+
+        pq_buf_.erase(pq_buf_.begin() + keep, pq_buf_.end());
+        std::make_heap(pq_buf_.begin(), pq_buf_.end(), cmp_);
     }
 
     template <typename Cmp>
@@ -504,10 +724,14 @@ namespace treeck {
         // 1. find next vertex in `indep_set`
         // 2. update max_output (assume vertices in indep_set sorted)
 
-        const auto& set = graph_.sets_[c.indep_set].vertices;
-        for (int i = c.vertex + 1; i < set.size(); ++i)
+        const auto& set = graph_.sets_[c.indep_set];
+        set.index.candidates(c.box, candidates_);
+        std::sort(candidates_.begin(), candidates_.end());
+        for (auto it = std::upper_bound(candidates_.begin(), candidates_.end(), c.vertex);
+                it != candidates_.end(); ++it)
         {
-            const Vertex& v = set[i];
+            int i = *it;
+            const Vertex& v = set.vertices[i];
             if (c.box.overlaps(v.box))
             {
                 c.vertex = i;
@@ -550,8 +774,6 @@ namespace treeck {
         // 2.1. if no more expansions possible, remove from pq
         // 2.2. otherwise: update next vertex index
         // 2.3. and update output_estimate
-        
-        FloatT old_est = current_output_estimate();
 
         Clique c = pq_pop();
         const Vertex& v = graph_.sets_[c.indep_set].vertices[c.vertex];
@@ -582,12 +804,9 @@ namespace treeck {
             pq_push(std::move(new_c));
         }
 
-        std::cout << "STEP " << nsteps_ << " UPDATE " << old_est << " -> " << current_output_estimate()
-            << " (#pq=" << pq_buf_.size()
-            << ", #sol=" << solutions_.size() << ')'
-            << std::endl;
-
         ++nsteps_;
+        if (callback_ && nsteps_ % callback_every_ == 0)
+            callback_();
         return true;
     }
 
@@ -623,6 +842,86 @@ namespace treeck {
         return nsteps_;
     }
 
+    template <typename Cmp>
+    size_t
+    KPartiteGraphFind<Cmp>::npushes() const
+    {
+        return npushes_;
+    }
+
+    template <typename Cmp>
+    size_t
+    KPartiteGraphFind<Cmp>::npops() const
+    {
+        return npops_;
+    }
+
+    template <typename Cmp>
+    size_t
+    KPartiteGraphFind<Cmp>::pq_size() const
+    {
+        return pq_buf_.size();
+    }
+
+    template <typename Cmp>
+    size_t
+    KPartiteGraphFind<Cmp>::max_pq_size() const
+    {
+        return max_pq_size_;
+    }
+
+    template <typename Cmp>
+    void
+    KPartiteGraphFind<Cmp>::set_pq_budget(size_t budget)
+    {
+        pq_budget_ = budget;
+        if (pq_budget_ > 0 && pq_buf_.size() > pq_budget_)
+            pq_prune();
+    }
+
+    template <typename Cmp>
+    size_t
+    KPartiteGraphFind<Cmp>::pq_budget() const
+    {
+        return pq_budget_;
+    }
+
+    template <typename Cmp>
+    size_t
+    KPartiteGraphFind<Cmp>::npruned() const
+    {
+        return npruned_;
+    }
+
+    template <typename Cmp>
+    std::tuple<FloatT, FloatT>
+    KPartiteGraphFind<Cmp>::bounds() const
+    {
+        constexpr bool is_max = std::is_same_v<MaxKPartiteGraphFind, KPartiteGraphFind<Cmp>>;
+        const FloatT worst = (is_max ? -1 : 1) * std::numeric_limits<FloatT>::infinity();
+
+        // solutions are found in best-first order: the first is the best
+        FloatT best = solutions_.empty() ? worst : solutions_.front().output;
+        FloatT estimate = best; // nothing better than best left to find
+        if (!pq_buf_.empty() && is_better(pq_buf_.front().output_estimate, estimate))
+            estimate = pq_buf_.front().output_estimate;
+        if (npruned_ > 0 && is_better(pruned_estimate_, estimate))
+            estimate = pruned_estimate_;
+
+        if constexpr (is_max)
+            return {best, estimate};
+        else
+            return {estimate, best};
+    }
+
+    template <typename Cmp>
+    void
+    KPartiteGraphFind<Cmp>::set_callback(std::function<void()> f, size_t every)
+    {
+        callback_ = std::move(f);
+        callback_every_ = std::max<size_t>(1, every);
+    }
+
 
     // TODO remove
     //template <typename Cmp>
@@ -12,34 +12,52 @@
  * https://github.com/chenhongge/treeVerification
  */
 
+#include <functional>
 #include <tuple>
 #include <vector>
 #include <unordered_map>
 
 #include "domain.h"
 #include "tree.h"
+#include "domtree.h"
+#include "util.h"
 
 #ifndef TREECK_GRAPH_H
 #define TREECK_GRAPH_H
 
 namespace treeck {
 
+    /**
+     * A box of domains sorted by feat_id, stored as parallel arrays of feat
+     * ids and [lo, hi) bounds with inline storage for small boxes.
+     * BoolDomains are stored as intervals: false [0, 1), true [1, 2).
+     */
     class DomainBox {
-        std::vector<std::pair<FeatId, Domain>> domains_;
+        static constexpr size_t INLINE_SIZE = 8;
+
+        util::SmallVector<FeatId, INLINE_SIZE> feat_ids_;
+        util::SmallVector<FloatT, INLINE_SIZE> los_;
+        util::SmallVector<FloatT, INLINE_SIZE> his_;
+        util::SmallVector<bool, INLINE_SIZE> is_bool_;
+
+    private:
+        void refine(FeatId feat_id, FloatT lo, FloatT hi, bool is_bool);
 
     public:
         DomainBox();
 
-        Domain& operator[](FeatId feat_id);
+        size_t size() const;
+        FeatId feat_id(size_t i) const;
+        FloatT lo(size_t i) const;
+        FloatT hi(size_t i) const;
+        Domain domain(size_t i) const;
+        std::vector<std::pair<FeatId, Domain>> domains() const;
 
-        std::vector<std::pair<FeatId, Domain>>::const_iterator begin() const;
-        std::vector<std::pair<FeatId, Domain>>::const_iterator end() const;
-        std::vector<std::pair<FeatId, Domain>>::const_iterator find(FeatId feat_id) const;
-        std::vector<std::pair<FeatId, Domain>>::iterator find(FeatId feat_id);
+        /** Index of `feat_id` in the box, or -1. */
+        int find(FeatId feat_id) const;
 
         void refine(Split split, bool is_left_child);
-
-        void sort();
+        void refine(FeatId feat_id, const Domain& dom);
 
         bool overlaps(const DomainBox& other) const;
         DomainBox combine(const DomainBox& other) const;
@@ -60,8 +78,41 @@ namespace treeck {
         //bool operator>(const Vertex& other) const;
     };
 
+    /**
+     * Index of the vertices of an independent set for overlap queries:
+     * per feature, the vertices sorted by the lower bound of their domain,
+     * with a max-tree over the upper bounds, and the sorted upper bounds.
+     * BoolDomains are indexed as intervals: false [0, 1), true [1, 2).
+     */
+    class OverlapIndex {
+        struct FeatIndex {
+            std::vector<int> by_lo;     // vertex indices sorted by lo
+            std::vector<FloatT> los;    // lo of by_lo, ascending
+            std::vector<FloatT> his;    // all hi values, ascending
+            std::vector<FloatT> max_hi; // max-tree over the hi of by_lo
+        };
+
+        std::unordered_map<FeatId, FeatIndex> feats_;
+        int num_vertices_;
+
+    private:
+        void collect(const FeatIndex& index, size_t node, size_t node_lo,
+                size_t node_hi, size_t end, FloatT lo,
+                std::vector<int>& out) const;
+
+    public:
+        OverlapIndex();
+
+        void build(const std::vector<Vertex>& vertices);
+
+        /** The indices of a superset of the vertices overlapping `box`, in
+         * no particular order. */
+        void candidates(const DomainBox& box, std::vector<int>& out) const;
+    };
+
     struct IndependentSet {
         std::vector<Vertex> vertices;
+        OverlapIndex index; // rebuilt by KPartiteGraph when vertices change
     };
 
     template <typename Cmp>
@@ -73,16 +124,25 @@ namespace treeck {
         template <typename Cmp> friend class KPartiteGraphFind;
 
     private:
-        void fill_independence_set(IndependentSet& set, AddTree::TreeT::CRef node);
+        template <typename F>
+        void fill_independence_set(IndependentSet& set, AddTree::TreeT::CRef node,
+                const F& is_reachable);
+        void build_indexes();
 
     public:
         KPartiteGraph(const AddTree& addtree);
 
+        /** Only the reachable leafs of the trees of `instance` in `leaf`, with
+         * their boxes restricted to the leaf's domains. */
+        KPartiteGraph(const DomTreeLeaf& leaf, size_t instance);
+
         std::vector<IndependentSet>::const_iterator begin() const;
         std::vector<IndependentSet>::const_iterator end() const;
 
         std::tuple<FloatT, FloatT> propagate_outputs();
         void merge(int K);
+        /** Sort the vertices of each set by min_output (max_output), which
+         * equal the output before `propagate_outputs`. */
         void sort_asc();
         void sort_desc();
 
@@ -115,12 +175,26 @@ namespace treeck {
         std::vector<Clique> pq_buf_;
         std::vector<Clique> solutions_;
         Cmp cmp_;
+        mutable std::vector<int> candidates_; // buffer for `update_clique`
 
+        // instrumentation
         size_t nsteps_;
+        size_t npushes_;
+        size_t npops_;
+        size_t max_pq_size_;
+        std::function<void()> callback_;
+        size_t callback_every_;
+
+        // memory budget: beam search on the best cliques beyond it
+        size_t pq_budget_;
+        size_t npruned_;
+        FloatT pruned_estimate_; // best output_estimate of the pruned cliques
 
     private:
         Clique pq_pop();
         void pq_push(Clique&& c);
+        void pq_prune();
+        bool is_better(FloatT a, FloatT b) const;
 
         bool is_solution(const Clique& c) const;
         bool update_clique(Clique& c) const;
@@ -134,6 +208,31 @@ namespace treeck {
         FloatT current_output_estimate() const;
         const std::vector<Clique>& solutions() const;
         size_t nsteps() const;
+        size_t npushes() const;
+        size_t npops() const;
+        size_t pq_size() const;
+        size_t max_pq_size() const;
+
+        /** Call `f` after every `every` steps, e.g. to log the progress of
+         * the search; an empty `f` removes the callback. */
+        void set_callback(std::function<void()> f, size_t every = 1);
+
+        /**
+         * Keep at most `budget` cliques in the queue (0: unlimited). When it
+         * is exceeded, only the better half is kept, as in a beam search:
+         * the search may miss the best solution, but `bounds` stay sound.
+         */
+        void set_pq_budget(size_t budget);
+        size_t pq_budget() const;
+        size_t npruned() const;
+
+        /**
+         * Proven (lower, upper) bounds on the max (min) output of a clique,
+         * valid between any two steps: one side is the output of the best
+         * solution so far, the other the best estimate of the remaining and
+         * pruned cliques. Equal when the best solution is known.
+         */
+        std::tuple<FloatT, FloatT> bounds() const;
     };
 
     using MaxKPartiteGraphFind = KPartiteGraphFind<std::less<Clique>>;
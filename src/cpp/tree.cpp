@@ -4,7 +4,20 @@
  * Author: Laurens Devos
 */
 
+#include <cstdint>
+#include <cstring>
+#include <map>
+#include <mutex>
+
+#ifndef _WIN32
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
+
 #include "tree.hpp"
+#include "compiled.h"
 
 namespace treeck {
 
@@ -125,6 +138,8 @@ namespace treeck {
 
     AddTree::AddTree()
         : trees_{}
+        , meta_{}
+        , compiled_{}
         , base_score(0.0)
     {
         trees_.reserve(16);
@@ -133,11 +148,57 @@ namespace treeck {
     size_t
     AddTree::add_tree(AddTree::TreeT&& tree)
     {
+        invalidate_meta();
         size_t index = trees_.size();
         trees_.push_back(std::move(tree));
         return index;
     }
 
+    size_t
+    AddTree::add_tree_from_arrays(size_t num_nodes, const FeatId *feat_ids,
+            const FloatT *values, const NodeId *left, const NodeId *right,
+            const bool *is_bool)
+    {
+        if (num_nodes == 0)
+            throw std::runtime_error("add_tree_from_arrays: empty tree");
+
+        TreeT tree;
+        std::stack<std::tuple<TreeT::MRef, NodeId>> stack;
+        stack.push({tree.root(), 0});
+        size_t visited = 0;
+
+        while (!stack.empty())
+        {
+            auto [node, i] = stack.top();
+            stack.pop();
+
+            if (++visited > num_nodes)
+                throw std::runtime_error("add_tree_from_arrays: not a tree");
+
+            if (left[i] == -1)
+            {
+                node.set_leaf_value(values[i]);
+                continue;
+            }
+
+            NodeId l = left[i], r = right[i];
+            if (l <= 0 || r <= 0
+                    || static_cast<size_t>(l) >= num_nodes
+                    || static_cast<size_t>(r) >= num_nodes)
+                throw std::runtime_error("add_tree_from_arrays: child out of bounds");
+
+            if (is_bool[i])
+                node.split(BoolSplit(feat_ids[i]));
+            else
+                node.split(LtSplit(feat_ids[i], values[i]));
+
+            stack.push({node.right(), r});
+            stack.push({node.left(), l});
+        }
+
+        return add_tree(std::move(tree));
+    }
+
     size_t
     AddTree::size() const
     {
@@ -165,6 +226,7 @@ namespace treeck {
     AddTree::TreeT&
     AddTree::operator[](size_t index)
     {
+        invalidate_meta(); // the tree may be modified through the reference
         return trees_[index];
     }
 
@@ -180,6 +242,161 @@ namespace treeck {
         return trees_;
     }
 
+    void
+    AddTree::invalidate_meta()
+    {
+        meta_.reset();
+        std::atomic_store(&compiled_, std::shared_ptr<const CompiledAddTree>());
+    }
+
+    std::shared_ptr<const CompiledAddTree>
+    AddTree::compiled() const
+    {
+        // base_score is a public member: recompile if it was changed
+        auto compiled = std::atomic_load(&compiled_);
+        if (!compiled || compiled->base_score != base_score)
+        {
+            compiled = std::make_shared<const CompiledAddTree>(*this);
+            std::atomic_store(&compiled_, compiled);
+        }
+        return compiled;
+    }
+
+    namespace inner {
+
+        const uint64_t FNV_OFFSET = 0xcbf29ce484222325ULL;
+        const uint64_t FNV_PRIME = 0x100000001b3ULL;
+
+        template <typename T>
+        uint64_t
+        fnv1a(uint64_t h, T value)
+        {
+            const unsigned char *p = reinterpret_cast<const unsigned char *>(&value);
+            for (size_t i = 0; i < sizeof(T); ++i)
+                h = (h ^ p[i]) * FNV_PRIME;
+            return h;
+        }
+
+    } /* namespace inner */
+
+    const AddTree::Meta&
+    AddTree::meta() const
+    {
+        if (meta_) return *meta_;
+
+        auto meta = std::make_shared<Meta>();
+        meta->hash = inner::FNV_OFFSET;
+        for (const TreeT& tree : trees_)
+        {
+            meta->hash = inner::fnv1a(meta->hash, static_cast<uint64_t>(tree.nodes_size()));
+            for (size_t id = 0; id < tree.nodes_size(); ++id)
+            {
+                const auto& n = tree.node_at(id);
+                meta->hash = inner::fnv1a(meta->hash, n.parent);
+                meta->hash = inner::fnv1a(meta->hash, n.tree_size);
+                if (n.is_leaf())
+                {
+                    meta->hash = inner::fnv1a(meta->hash, n.leaf.value);
+                    continue;
+                }
+                meta->hash = inner::fnv1a(meta->hash, n.internal.left);
+                meta->hash = inner::fnv1a(meta->hash, n.internal.split.index());
+                visit_split(
+                    [&meta](const LtSplit& x) {
+                        meta->hash = inner::fnv1a(meta->hash, x.feat_id);
+                        meta->hash = inner::fnv1a(meta->hash, x.split_value);
+                    },
+                    [&meta](const BoolSplit& x) {
+                        meta->hash = inner::fnv1a(meta->hash, x.feat_id);
+                    },
+                    n.internal.split);
+            }
+        }
+
+        std::map<FeatId, size_t> feat_types;
+        for (const TreeT& tree : trees_)
+        {
+            int leaf_count = 0;
+            FloatT lo = std::numeric_limits<FloatT>::infinity();
+            FloatT hi = -std::numeric_limits<FloatT>::infinity();
+            tree.dfs([&](TreeT::CRef n) {
+                if (n.is_leaf())
+                {
+                    ++leaf_count;
+                    lo = std::min(lo, n.leaf_value());
+                    hi = std::max(hi, n.leaf_value());
+                    return ADD_NONE;
+                }
+                const Split& split = n.get_split();
+                FeatId feat_id = visit_split(
+                        [](const LtSplit& s) { return s.feat_id; },
+                        [](const BoolSplit& s) { return s.feat_id; },
+                        split);
+                auto r = feat_types.emplace(feat_id, split.index());
+                if (!r.second && r.first->second != split.index())
+                {
+                    std::stringstream ss;
+                    ss << "AddTree split type error for feat_id " << feat_id;
+                    throw std::runtime_error(ss.str());
+                }
+                return ADD_LEFT_AND_RIGHT;
+            });
+            meta->leaf_counts.push_back(leaf_count);
+            meta->min_leaf_values.push_back(lo);
+            meta->max_leaf_values.push_back(hi);
+        }
+        meta->feat_types.assign(feat_types.begin(), feat_types.end());
+
+        meta_ = meta;
+        return *meta_;
+    }
+
+    uint64_t
+    AddTree::model_id() const
+    {
+        return inner::fnv1a(meta().hash, base_score);
+    }
+
+    namespace inner {
+
+        static std::mutex registry_mutex;
+        static std::unordered_map<uint64_t, std::shared_ptr<AddTree>> registry;
+
+    } /* namespace inner */
+
+    uint64_t
+    AddTreeRegistry::add(std::shared_ptr<AddTree> addtree)
+    {
+        uint64_t model_id = addtree->model_id(); // caches meta before sharing
+        std::lock_guard<std::mutex> guard(inner::registry_mutex);
+        inner::registry.emplace(model_id, std::move(addtree));
+        return model_id;
+    }
+
+    std::shared_ptr<AddTree>
+    AddTreeRegistry::get(uint64_t model_id)
+    {
+        std::lock_guard<std::mutex> guard(inner::registry_mutex);
+        auto search = inner::registry.find(model_id);
+        if (search == inner::registry.end())
+            return nullptr;
+        return search->second;
+    }
+
+    bool
+    AddTreeRegistry::remove(uint64_t model_id)
+    {
+        std::lock_guard<std::mutex> guard(inner::registry_mutex);
+        return inner::registry.erase(model_id) > 0;
+    }
+
+    void
+    AddTreeRegistry::clear()
+    {
+        std::lock_guard<std::mutex> guard(inner::registry_mutex);
+        inner::registry.clear();
+    }
+
     std::string
     AddTree::to_json() const
     {
@@ -223,6 +440,202 @@ namespace treeck {
     }
 
     namespace inner {
+
+        /* Binary AddTree format, version 2 (native byte order and node
+         * layout):
+         *
+         *   BinaryHeader
+         *   BinaryNode probes[3], see `binary_probes`
+         *   uint32_t num_nodes[num_trees]
+         *   BinaryNode nodes[sum(num_nodes)], tree after tree, in NodeId order
+         *
+         * Each part is zero-padded to a multiple of 8 bytes. The nodes are
+         * stored as they are in memory, so a mapped file is used in place;
+         * the probes detect a build that lays out its nodes differently.
+         */
+        using BinaryNode = Node<Split, FloatT>;
+
+        static const char BINARY_MAGIC[8] = {'T', 'R', 'E', 'E', 'C', 'K', 'A', 'T'};
+        static const uint32_t BINARY_VERSION = 2;
+        static const uint32_t BINARY_BYTE_ORDER = 0x01020304;
+        static const size_t BINARY_NUM_PROBES = 3;
+
+        struct BinaryHeader {
+            char magic[8];
+            uint32_t version;
+            uint32_t byte_order;
+            uint32_t num_trees;
+            uint32_t node_size; /* sizeof(BinaryNode) */
+            FloatT base_score;
+            uint32_t padding;
+        };
+
+        static_assert(sizeof(BinaryHeader) == 32, "unexpected BinaryHeader padding");
+        static_assert(alignof(BinaryNode) <= 8, "BinaryNode alignment exceeds padding");
+
+        static
+        size_t
+        binary_padded(size_t size)
+        {
+            return (size + 7) & ~static_cast<size_t>(7);
+        }
+
+        /* a leaf, an LtSplit and a BoolSplit node with known field values */
+        static
+        std::vector<BinaryNode>
+        binary_probes()
+        {
+            std::vector<BinaryNode> probes;
+            BinaryNode leaf(0, 0);
+            leaf.leaf.value = 1.5;
+            probes.push_back(leaf);
+            BinaryNode lt(1, 0);
+            lt.tree_size = 3;
+            lt.internal.left = 5;
+            lt.internal.split = LtSplit(7, 2.5);
+            probes.push_back(lt);
+            BinaryNode bool_(2, 1);
+            bool_.tree_size = 5;
+            bool_.internal.left = 3;
+            bool_.internal.split = BoolSplit(9);
+            probes.push_back(bool_);
+            return probes;
+        }
+
+        static
+        bool
+        binary_probes_match(const BinaryNode *p)
+        {
+            return p[0].id == 0 && p[0].parent == 0 && p[0].tree_size == 1
+                && p[0].leaf.value == 1.5
+                && p[1].id == 1 && p[1].tree_size == 3 && p[1].internal.left == 5
+                && p[1].internal.split.index() == 0
+                && std::get<LtSplit>(p[1].internal.split).feat_id == 7
+                && std::get<LtSplit>(p[1].internal.split).split_value == 2.5
+                && p[2].id == 2 && p[2].parent == 1 && p[2].tree_size == 5
+                && p[2].internal.left == 3
+                && p[2].internal.split.index() == 1
+                && std::get<BoolSplit>(p[2].internal.split).feat_id == 9;
+        }
+
+        /* Check the node records of a tree before they are used: every
+         * node has its own id, children in bounds with greater ids, and a
+         * valid split; the children of the nodes reachable from the root
+         * point back to their parent, and tree_size is consistent. Nodes
+         * left behind by `skip_branch` are unreachable and only checked
+         * for bounds. */
+        static
+        void
+        check_binary_tree(const BinaryNode *nodes, size_t n)
+        {
+            for (NodeId id = 0; id < static_cast<NodeId>(n); ++id)
+            {
+                const BinaryNode& node = nodes[id];
+                if (node.id != id)
+                    throw std::runtime_error("binary AddTree: invalid node id");
+                if (node.is_leaf()) continue;
+                if (node.tree_size < 3 || node.internal.left <= id
+                        || node.internal.left + 1 >= static_cast<NodeId>(n)
+                        || node.internal.split.index() >= 2)
+                    throw std::runtime_error("binary AddTree: invalid internal node");
+                FeatId feat_id = visit_split(
+                        [](const LtSplit& s) { return s.feat_id; },
+                        [](const BoolSplit& s) { return s.feat_id; },
+                        node.internal.split);
+                if (feat_id < 0)
+                    throw std::runtime_error("binary AddTree: invalid internal node");
+            }
+
+            if (nodes[0].parent != 0)
+                throw std::runtime_error("binary AddTree: invalid root");
+
+            std::stack<NodeId> stack;
+            stack.push(0);
+            while (!stack.empty())
+            {
+                NodeId id = stack.top();
+                const BinaryNode& node = nodes[id];
+                stack.pop();
+                if (node.is_leaf()) continue;
+
+                NodeId l = node.internal.left;
+                if (nodes[l].parent != id || nodes[l + 1].parent != id)
+                    throw std::runtime_error("binary AddTree: invalid parent");
+                if (node.tree_size != 1 + nodes[l].tree_size + nodes[l + 1].tree_size)
+                    throw std::runtime_error("binary AddTree: invalid tree_size");
+                stack.push(l + 1);
+                stack.push(l);
+            }
+        }
+
+        /* The checked node records of each tree in `data`, read in place. */
+        static
+        std::vector<std::tuple<const BinaryNode *, size_t>>
+        parse_binary(const char *data, size_t size, FloatT& base_score)
+        {
+            BinaryHeader header;
+            if (size < sizeof(header))
+                throw std::runtime_error("binary AddTree: truncated header");
+            std::memcpy(&header, data, sizeof(header));
+            if (std::memcmp(header.magic, BINARY_MAGIC, sizeof(header.magic)) != 0)
+                throw std::runtime_error("binary AddTree: bad magic");
+            if (header.byte_order != BINARY_BYTE_ORDER)
+                throw std::runtime_error("binary AddTree: byte order mismatch");
+            if (header.version != BINARY_VERSION)
+                throw std::runtime_error("binary AddTree: unsupported version");
+            if (header.node_size != sizeof(BinaryNode))
+                throw std::runtime_error("binary AddTree: node layout mismatch");
+            if (reinterpret_cast<uintptr_t>(data) % alignof(BinaryNode) != 0)
+                throw std::runtime_error("binary AddTree: misaligned data");
+
+            size_t offset = sizeof(header);
+            size_t probes_size = binary_padded(BINARY_NUM_PROBES * sizeof(BinaryNode));
+            size_t num_nodes_size = binary_padded(header.num_trees * sizeof(uint32_t));
+            if (size < offset + probes_size + num_nodes_size)
+                throw std::runtime_error("binary AddTree: truncated");
+            if (!binary_probes_match(reinterpret_cast<const BinaryNode *>(data + offset)))
+                throw std::runtime_error("binary AddTree: node layout mismatch");
+            offset += probes_size;
+
+            std::vector<uint32_t> num_nodes(header.num_trees);
+            std::memcpy(num_nodes.data(), data + offset,
+                    header.num_trees * sizeof(uint32_t));
+            offset += num_nodes_size;
+
+            size_t total = 0;
+            for (uint32_t n : num_nodes) total += n;
+            if (size != offset + total * sizeof(BinaryNode))
+                throw std::runtime_error("binary AddTree: size mismatch");
+
+            std::vector<std::tuple<const BinaryNode *, size_t>> trees;
+            const BinaryNode *nodes = reinterpret_cast<const BinaryNode *>(data + offset);
+            for (uint32_t n : num_nodes)
+            {
+                if (n == 0)
+                    throw std::runtime_error("binary AddTree: empty tree");
+                check_binary_tree(nodes, n);
+                trees.push_back({nodes, n});
+                nodes += n;
+            }
+            base_score = header.base_score;
+            return trees;
+        }
+
+#ifndef _WIN32
+        /* unmaps and closes on destruction */
+        struct MappedFile {
+            int fd = -1;
+            void *data = MAP_FAILED;
+            size_t size = 0;
+
+            ~MappedFile()
+            {
+                if (data != MAP_FAILED) munmap(data, size);
+                if (fd != -1) close(fd);
+            }
+        };
+#endif
+
         static
         void
         insert_split_value(AddTree::SplitMapT& splits, const LtSplit& split)
@@ -268,6 +681,100 @@ namespace treeck {
         }
     } /* namespace inner */
 
+    void
+    AddTree::to_binary_file(const char *file) const
+    {
+        inner::BinaryHeader header;
+        std::memset(&header, 0, sizeof(header));
+        std::memcpy(header.magic, inner::BINARY_MAGIC, sizeof(header.magic));
+        header.version = inner::BINARY_VERSION;
+        header.byte_order = inner::BINARY_BYTE_ORDER;
+        header.num_trees = static_cast<uint32_t>(trees_.size());
+        header.node_size = sizeof(inner::BinaryNode);
+        header.base_score = base_score;
+
+        auto probes = inner::binary_probes();
+        std::vector<uint32_t> num_nodes(trees_.size());
+        for (size_t i = 0; i < trees_.size(); ++i)
+            num_nodes[i] = static_cast<uint32_t>(trees_[i].nodes_size());
+
+        auto write_padded = [](std::ofstream& f, const void *data, size_t size) {
+            static const char zeros[8] = {0};
+            f.write(static_cast<const char *>(data), size);
+            f.write(zeros, inner::binary_padded(size) - size);
+        };
+
+        std::ofstream f(file, std::ios::binary);
+        if (!f) throw std::runtime_error("cannot open file for writing");
+        write_padded(f, &header, sizeof(header));
+        write_padded(f, probes.data(), probes.size() * sizeof(inner::BinaryNode));
+        write_padded(f, num_nodes.data(), num_nodes.size() * sizeof(uint32_t));
+        for (const TreeT& tree : trees_)
+            f.write(reinterpret_cast<const char *>(&tree.node_at(0)),
+                    tree.nodes_size() * sizeof(inner::BinaryNode));
+        if (!f) throw std::runtime_error("write failed");
+    }
+
+    AddTree
+    AddTree::from_binary(const char *data, size_t size)
+    {
+        AddTree addtree;
+        auto trees = inner::parse_binary(data, size, addtree.base_score);
+        addtree.trees_.reserve(trees.size());
+        for (auto [nodes, n] : trees)
+        {
+            TreeT tree;
+            tree.nodes_.assign(nodes, nodes + n);
+            addtree.trees_.push_back(std::move(tree));
+        }
+        return addtree;
+    }
+
+    AddTree
+    AddTree::from_binary_file(const char *file, bool use_mmap)
+    {
+#ifndef _WIN32
+        if (use_mmap)
+        {
+            auto m = std::make_shared<inner::MappedFile>();
+            m->fd = open(file, O_RDONLY);
+            if (m->fd == -1) throw std::runtime_error("cannot open file");
+            struct stat st;
+            if (fstat(m->fd, &st) == -1) throw std::runtime_error("fstat failed");
+            m->size = static_cast<size_t>(st.st_size);
+            if (m->size < sizeof(inner::BinaryHeader))
+                throw std::runtime_error("binary AddTree: truncated header");
+            m->data = mmap(nullptr, m->size, PROT_READ, MAP_PRIVATE, m->fd, 0);
+            if (m->data == MAP_FAILED) throw std::runtime_error("mmap failed");
+
+            // the trees read their nodes from the mapping, and keep it alive
+            AddTree addtree;
+            auto trees = inner::parse_binary(static_cast<const char *>(m->data),
+                    m->size, addtree.base_score);
+            addtree.trees_.reserve(trees.size());
+            for (auto [nodes, n] : trees)
+            {
+                TreeT tree;
+                tree.nodes_.clear();
+                tree.nodes_.shrink_to_fit();
+                tree.mapped_nodes_ = nodes;
+                tree.num_mapped_nodes_ = n;
+                tree.mapping_ = m;
+                addtree.trees_.push_back(std::move(tree));
+            }
+            return addtree;
+        }
+#endif
+        // no mmap (or not available): read and copy
+        std::ifstream f(file, std::ios::binary | std::ios::ate);
+        if (!f) throw std::runtime_error("cannot open file");
+        std::vector<char> buffer(static_cast<size_t>(f.tellg()));
+        f.seekg(0);
+        f.read(buffer.data(), buffer.size());
+        if (!f) throw std::runtime_error("read failed");
+        return AddTree::from_binary(buffer.data(), buffer.size());
+    }
+
     AddTree::SplitMapT
     AddTree::get_splits() const
     {
@@ -290,6 +797,41 @@ namespace treeck {
         return splits;
     }
 
+    template <typename T>
+    void
+    AddTree::predict(const T *data, size_t nrows, size_t ncols, double *out,
+            int nthreads) const
+    {
+        compiled()->predict(data, nrows, ncols, out, nthreads);
+    }
+
+    template <typename T>
+    void
+    AddTree::predict_leafs(const T *data, size_t nrows, size_t ncols, NodeId *out,
+            int nthreads) const
+    {
+        compiled()->predict_leafs(data, nrows, ncols, out, nthreads);
+    }
+
+    template void AddTree::predict(const float *, size_t, size_t, double *, int) const;
+    template void AddTree::predict(const double *, size_t, size_t, double *, int) const;
+    template void AddTree::predict_leafs(const float *, size_t, size_t, NodeId *, int) const;
+    template void AddTree::predict_leafs(const double *, size_t, size_t, NodeId *, int) const;
+
+    DomainsT
+    AddTree::get_domains(const NodeId *leaf_ids) const
+    {
+        DomainsT domains;
+        for (size_t tree_index = 0; tree_index < size(); ++tree_index)
+        {
+            auto node = trees_[tree_index][leaf_ids[tree_index]];
+            if (!node.is_leaf())
+                throw std::runtime_error("leaf_id does not point to leaf");
+            node.get_domains(domains);
+        }
+        return domains;
+    }
+
     std::ostream&
     operator<<(std::ostream& s, const AddTree& at)
     {
@@ -7,9 +7,11 @@
 #ifndef TREECK_TREE_H
 #define TREECK_TREE_H
 
+#include <cstdint>
 #include <fstream>
 #include <iostream>
 #include <iostream>
+#include <memory>
 #include <optional>
 #include <sstream>
 #include <type_traits>
@@ -247,8 +249,21 @@ namespace treeck {
     private:
         friend MRef;
         friend CRef;
+        friend class AddTree; // binary format
 
-        std::vector<inner::Node<SplitT, LeafT>> nodes_;
+        using NodeT = inner::Node<SplitT, LeafT>;
+
+        /* the nodes are owned by `nodes_`, or, for a tree loaded from a
+         * mapped binary file, read in place from `mapped_nodes_`; they are
+         * copied into `nodes_` on the first mutation */
+        std::vector<NodeT> nodes_;
+        const NodeT *mapped_nodes_;
+        size_t num_mapped_nodes_;
+        std::shared_ptr<const void> mapping_; // keeps the mapped file alive
+
+        size_t nodes_size() const;
+        const NodeT& node_at(NodeId id) const;
+        std::vector<NodeT>& mut_nodes(); // unmaps
 
     public:
         Tree();
@@ -270,7 +285,9 @@ namespace treeck {
         void dfs(TreeVisitorT&& visitor) const;
 
         template <typename Archive>
-        void serialize(Archive& archive);
+        void save(Archive& archive) const;
+        template <typename Archive>
+        void load(Archive& archive); // unmaps
 
         std::string to_json() const;
         static Tree from_json(const std::string& json);
@@ -280,13 +297,30 @@ namespace treeck {
     std::ostream& operator<<(std::ostream& s, const Tree<SplitT, LeafT>& t);
 
 
+    class CompiledAddTree;
+
     class AddTree {
     public:
         using TreeT = Tree<Split, FloatT>;
         using SplitMapT = std::unordered_map<FeatId, std::vector<FloatT>>;
 
+        /** Structural summary of the trees, computed once and cached until
+         * the next mutation. */
+        struct Meta {
+            /* (feat_id, Split variant index), sorted by feat_id */
+            std::vector<std::pair<FeatId, size_t>> feat_types;
+            std::vector<int> leaf_counts; /* per tree */
+            std::vector<FloatT> min_leaf_values; /* per tree */
+            std::vector<FloatT> max_leaf_values; /* per tree */
+            uint64_t hash; /* FNV-1a hash of the nodes of all trees */
+        };
+
     private:
         std::vector<TreeT> trees_;
+        mutable std::shared_ptr<const Meta> meta_; /* not thread-safe */
+        mutable std::shared_ptr<const CompiledAddTree> compiled_; /* atomic access only */
+
+        void invalidate_meta();
 
     public:
         FloatT base_score;
@@ -294,6 +328,14 @@ namespace treeck {
         AddTree();
 
         size_t add_tree(TreeT&& tree);
+
+        /** Append a tree given as flat node arrays (XGBoost's layout): node
+         * `i` is a leaf with value `values[i]` when `left[i] == -1`, and
+         * splits on `feat_ids[i]` otherwise, using a BoolSplit if
+         * `is_bool[i]`, or an LtSplit on `values[i]`. Node 0 is the root. */
+        size_t add_tree_from_arrays(size_t num_nodes, const FeatId *feat_ids,
+                const FloatT *values, const NodeId *left, const NodeId *right,
+                const bool *is_bool);
         size_t size() const;
         size_t num_nodes() const;
         size_t num_leafs() const;
@@ -304,16 +346,71 @@ namespace treeck {
 
         SplitMapT get_splits() const;
 
+        /** Cached structural metadata; throws if a feat_id is used with
+         * different split types. */
+        const Meta& meta() const;
+
+        /** Cached CompiledAddTree, rebuilt after a mutation or a change of
+         * base_score. Safe to call from several threads as long as the
+         * AddTree is not mutated; the returned pointer keeps the compiled
+         * trees alive while they are in use. */
+        std::shared_ptr<const CompiledAddTree> compiled() const;
+
+        /** Content hash of the trees and base_score; equal models on
+         * different processes have equal ids. */
+        uint64_t model_id() const;
+
+        /** Evaluate `nrows` examples stored row-major in `data` (`ncols`
+         * values per row); write base_score + sum of leaf values to `out`.
+         * Rows (or trees, when there are fewer rows than threads) are split
+         * over `nthreads` threads; nthreads <= 0 uses all hardware threads.
+         * Uses a CompiledAddTree that is cached until the next mutation. */
+        template <typename T>
+        void predict(const T *data, size_t nrows, size_t ncols, double *out,
+                int nthreads = 1) const;
+
+        /** Like `predict`, but write the leaf NodeId of each tree to `out`,
+         * an nrows x size() row-major matrix. */
+        template <typename T>
+        void predict_leafs(const T *data, size_t nrows, size_t ncols, NodeId *out,
+                int nthreads = 1) const;
+
+        /** Domains of the leafs `leaf_ids`, one leaf per tree. */
+        DomainsT get_domains(const NodeId *leaf_ids) const;
+
         std::string to_json() const;
         static AddTree from_json(const std::string& json);
         static AddTree from_json_file(const char *file);
 
+        /** Versioned binary format: a small header followed by the nodes
+         * as they are laid out in memory, for this build. `from_binary_file`
+         * maps the file with mmap when `use_mmap` is set (not on Windows)
+         * and the trees read their nodes from the mapping in place, until
+         * they are modified; otherwise, the nodes are copied. The records
+         * are checked first; corrupt data throws. */
+        void to_binary_file(const char *file) const;
+        static AddTree from_binary(const char *data, size_t size);
+        static AddTree from_binary_file(const char *file, bool use_mmap = true);
+
         template <typename Archive>
         void serialize(Archive& archive);
     };
 
     std::ostream& operator<<(std::ostream& s, const AddTree& at);
 
+    /**
+     * Process-wide AddTrees by model id. DomTreeLeafs whose AddTrees are
+     * all registered are serialised with model ids instead of the trees;
+     * the AddTrees must then be registered where the leaf is loaded.
+     */
+    class AddTreeRegistry {
+    public:
+        static uint64_t add(std::shared_ptr<AddTree> addtree);
+        static std::shared_ptr<AddTree> get(uint64_t model_id); /* null if missing */
+        static bool remove(uint64_t model_id);
+        static void clear();
+    };
+
 } /* namespace treeck */
 
 #endif /* TREECK_TREE_H */
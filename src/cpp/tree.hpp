@@ -7,6 +7,7 @@
 #include <exception>
 #include <limits>
 #include <stack>
+#include <stdexcept>
 #include <iostream>
 #include <utility>
 
@@ -125,7 +126,7 @@ namespace treeck {
     const typename NodeRef<RefT>::NodeT&
     NodeRef<RefT>::node() const
     {
-        return tree_->nodes_.at(node_id_);
+        return tree_->node_at(node_id_);
     }
 
     template <typename RefT>
@@ -133,7 +134,7 @@ namespace treeck {
     std::enable_if_t<T::is_mut_type::value, typename NodeRef<RefT>::NodeT&>
     NodeRef<RefT>::node()
     {
-        return tree_->nodes_.at(node_id_);
+        return tree_->mut_nodes().at(node_id_);
     }
 
     template <typename RefT>
@@ -255,13 +256,14 @@ namespace treeck {
     {
         if (is_internal()) throw std::runtime_error("split internal");
 
-        NodeId left_id = tree_->nodes_.size();
+        auto& nodes = tree_->mut_nodes();
+        NodeId left_id = nodes.size();
 
         NodeT left(left_id,      id());
         NodeT right(left_id + 1, id());
         
-        tree_->nodes_.push_back(left);
-        tree_->nodes_.push_back(right);
+        nodes.push_back(left);
+        nodes.push_back(right);
 
         node().internal.split = split;
         node().internal.left = left_id;
@@ -328,11 +330,47 @@ namespace treeck {
 
     template <typename SplitT, typename LeafT>
     Tree<SplitT, LeafT>::Tree()
+        : nodes_{}
+        , mapped_nodes_(nullptr)
+        , num_mapped_nodes_(0)
+        , mapping_{}
     {
         // NodeT must be default constructible
         nodes_.push_back({0, 0}); /* add a root leaf node */
     }
 
+    template <typename SplitT, typename LeafT>
+    size_t
+    Tree<SplitT, LeafT>::nodes_size() const
+    {
+        return mapped_nodes_ ? num_mapped_nodes_ : nodes_.size();
+    }
+
+    template <typename SplitT, typename LeafT>
+    const typename Tree<SplitT, LeafT>::NodeT&
+    Tree<SplitT, LeafT>::node_at(NodeId id) const
+    {
+        if (!mapped_nodes_)
+            return nodes_.at(id);
+        if (id < 0 || static_cast<size_t>(id) >= num_mapped_nodes_)
+            throw std::out_of_range("node id out of range");
+        return mapped_nodes_[id];
+    }
+
+    template <typename SplitT, typename LeafT>
+    std::vector<typename Tree<SplitT, LeafT>::NodeT>&
+    Tree<SplitT, LeafT>::mut_nodes()
+    {
+        if (mapped_nodes_)
+        {
+            nodes_.assign(mapped_nodes_, mapped_nodes_ + num_mapped_nodes_);
+            mapped_nodes_ = nullptr;
+            num_mapped_nodes_ = 0;
+            mapping_.reset();
+        }
+        return nodes_;
+    }
+
     template <typename SplitT, typename LeafT>
     typename Tree<SplitT, LeafT>::CRef
     Tree<SplitT, LeafT>::root() const
@@ -351,7 +389,7 @@ namespace treeck {
     int
     Tree<SplitT, LeafT>::num_nodes() const
     {
-        return nodes_[0].tree_size;
+        return node_at(0).tree_size;
     }
 
     template <typename SplitT, typename LeafT>
@@ -415,9 +453,23 @@ namespace treeck {
     template <typename SplitT, typename LeafT>
     template <typename Archive>
     void
-    Tree<SplitT, LeafT>::serialize(Archive& archive)
+    Tree<SplitT, LeafT>::save(Archive& archive) const
+    {
+        if (!mapped_nodes_)
+        {
+            archive(cereal::make_nvp("tree_nodes", nodes_));
+            return;
+        }
+        std::vector<NodeT> nodes(mapped_nodes_, mapped_nodes_ + num_mapped_nodes_);
+        archive(cereal::make_nvp("tree_nodes", nodes));
+    }
+
+    template <typename SplitT, typename LeafT>
+    template <typename Archive>
+    void
+    Tree<SplitT, LeafT>::load(Archive& archive)
     {
-        archive(cereal::make_nvp("tree_nodes", this->nodes_));
+        archive(cereal::make_nvp("tree_nodes", mut_nodes()));
     }
 
     template <typename SplitT, typename LeafT>
@@ -427,7 +479,7 @@ namespace treeck {
         std::stringstream ss;
         {
             cereal::JSONOutputArchive ar(ss);
-            ar(cereal::make_nvp("tree_nodes", this->nodes_)); // destructor must run!
+            save(ar); // destructor must run!
         }
         return ss.str();
     }
@@ -471,6 +523,7 @@ namespace treeck {
     void
     AddTree::serialize(Archive& archive)
     {
+        invalidate_meta();
         archive(cereal::make_nvp("base_score", base_score),
                 cereal::make_nvp("trees", trees_));
     }
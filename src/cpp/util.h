@@ -7,9 +7,13 @@
 #ifndef TREECK_UTIL_H
 #define TREECK_UTIL_H
 
+#include <algorithm>
+#include <exception>
 #include <sstream>
+#include <thread>
 #include <type_traits>
 #include <variant>
+#include <vector>
 
 namespace treeck {
     namespace util {
@@ -50,6 +54,164 @@ namespace treeck {
                 throw std::runtime_error(ss.str());
             }
         }
+
+        /** Number of threads to use for `nthreads`: <= 0 means all hardware
+         * threads. */
+        static inline int
+        num_threads(int nthreads)
+        {
+            if (nthreads <= 0)
+                return std::max(1u, std::thread::hardware_concurrency());
+            return nthreads;
+        }
+
+        /**
+         * Split [0, n) into at most `nthreads` contiguous chunks and call
+         * f(begin, end, thread_index) for each chunk on its own thread.
+         * Exceptions are rethrown in the calling thread after all threads
+         * have joined. nthreads <= 0 uses all hardware threads.
+         */
+        template <typename F>
+        static void
+        parallel_for(int nthreads, size_t n, const F& f)
+        {
+            nthreads = num_threads(nthreads);
+            size_t nchunks = std::min(static_cast<size_t>(nthreads), n);
+            if (nchunks <= 1)
+            {
+                if (n > 0) f(0, n, 0);
+                return;
+            }
+
+            size_t chunk = (n + nchunks - 1) / nchunks;
+            std::vector<std::thread> threads;
+            std::vector<std::exception_ptr> errors(nchunks);
+            for (size_t t = 0; t < nchunks; ++t)
+            {
+                size_t begin = t * chunk;
+                size_t end = std::min(n, begin + chunk);
+                if (begin >= end) break;
+                threads.emplace_back([&f, &errors, begin, end, t]() {
+                    try { f(begin, end, t); }
+                    catch (...) { errors[t] = std::current_exception(); }
+                });
+            }
+            for (auto& thread : threads)
+                thread.join();
+            for (auto& e : errors)
+                if (e) std::rethrow_exception(e);
+        }
+
+        /**
+         * Vector of trivially copyable values that stores up to N values
+         * inline, and only allocates on the heap when it grows beyond that.
+         */
+        template <typename T, size_t N>
+        class SmallVector {
+            static_assert(std::is_trivially_copyable_v<T>, "trivially copyable T only");
+
+            T inline_[N];
+            T *data_;
+            size_t size_;
+            size_t capacity_;
+
+            bool is_inline() const { return data_ == inline_; }
+
+            void
+            take(SmallVector&& o) // requires empty inline storage in this
+            {
+                if (o.is_inline())
+                {
+                    std::copy(o.data_, o.data_ + o.size_, data_);
+                }
+                else
+                {
+                    data_ = o.data_;
+                    capacity_ = o.capacity_;
+                    o.data_ = o.inline_;
+                    o.capacity_ = N;
+                }
+                size_ = o.size_;
+                o.size_ = 0;
+            }
+
+        public:
+            SmallVector() : data_(inline_), size_(0), capacity_(N) {}
+            SmallVector(const SmallVector& o) : SmallVector() { *this = o; }
+            SmallVector(SmallVector&& o) noexcept : SmallVector() { take(std::move(o)); }
+
+            SmallVector&
+            operator=(const SmallVector& o)
+            {
+                if (this == &o)
+                    return *this;
+                clear();
+                reserve(o.size_);
+                std::copy(o.data_, o.data_ + o.size_, data_);
+                size_ = o.size_;
+                return *this;
+            }
+
+            SmallVector&
+            operator=(SmallVector&& o) noexcept
+            {
+                if (this == &o)
+                    return *this;
+                if (!is_inline())
+                    delete[] data_;
+                data_ = inline_;
+                capacity_ = N;
+                take(std::move(o));
+                return *this;
+            }
+
+            ~SmallVector()
+            {
+                if (!is_inline())
+                    delete[] data_;
+            }
+
+            void
+            reserve(size_t capacity)
+            {
+                if (capacity <= capacity_)
+                    return;
+                T *data = new T[capacity];
+                std::copy(data_, data_ + size_, data);
+                if (!is_inline())
+                    delete[] data_;
+                data_ = data;
+                capacity_ = capacity;
+            }
+
+            void
+            push_back(T value)
+            {
+                if (size_ == capacity_)
+                    reserve(2 * capacity_);
+                data_[size_++] = value;
+            }
+
+            void
+            insert(size_t pos, T value)
+            {
+                if (size_ == capacity_)
+                    reserve(2 * capacity_);
+                std::copy_backward(data_ + pos, data_ + size_, data_ + size_ + 1);
+                data_[pos] = value;
+                ++size_;
+            }
+
+            void clear() { size_ = 0; }
+
+            size_t size() const { return size_; }
+            bool empty() const { return size_ == 0; }
+            T& operator[](size_t i) { return data_[i]; }
+            const T& operator[](size_t i) const { return data_[i]; }
+            const T *begin() const { return data_; }
+            const T *end() const { return data_ + size_; }
+        };
+
     } /* namespace util */
 } /* namespace treeck */
 
@@ -69,22 +69,6 @@ def __addtree_predict_single(self, example):
         result += tree.predict_single(example)
     return result
 
-def __addtree_predict(self, examples):
-    it = enumerate(examples)
-    try:
-        import pandas as pd
-        if isinstance(examples, pd.DataFrame):
-            it = examples.iterrows()
-    except: pass
-
-    predictions = []
-    #print("predicting...", end="")
-    for i, example in it:
-        #print("\rpredicting...", i, "/", len(examples), end="")
-        predictions.append(self.predict_single(example))
-    #print("\rdone                    ")
-    return predictions
-
 def __addtree_write(self, f):
     with open(f, "w") as fh:
         json = self.to_json()
@@ -97,37 +81,13 @@ def __addtree_read(f):
 
 AddTree.__iter__ = __addtree_iter
 AddTree.predict_single = __addtree_predict_single
-AddTree.predict = __addtree_predict
 AddTree.write = __addtree_write
 AddTree.read = __addtree_read
 
 
 class AddTreeFeatureTypes:
     def __init__(self, at):
-        self._types = dict()
-
-        for tree_index in range(len(at)):
-            tree = at[tree_index]
-            self._check_types(tree, tree.root())
-
-        # sort by key
-        self._types = {fid: self._types[fid] for fid in sorted(self._types)}
-
-    def _check_types(self, tree, node):
-        l, r = tree.left(node), tree.right(node)
-
-        if not tree.is_internal(node): return
-
-        split = tree.get_split(node)
-        split_type = type(split)
-
-        if split.feat_id in self._types and self._types[split.feat_id] != split_type:
-            raise RuntimeError(f"AddTree split type error for feat_id {split.feat_id}")
-
-        self._types[split.feat_id] = split_type
-
-        if not tree.is_leaf(l): self._check_types(tree, l)
-        if not tree.is_leaf(r): self._check_types(tree, r)
+        self._types = at.feat_types # cached in C++, sorted by feat_id
 
     def feat_ids(self):
         yield from self._types.keys()
@@ -2,13 +2,16 @@
 # License: Apache License 2.0
 # Author: Laurens Devos
 
-import timeit, math, time
+import timeit, math, time, threading, uuid
+import numpy as np
 
-from dask.distributed import wait
+from dask.distributed import wait, WorkerPlugin
 
-from . import DomTree, DomTreeLeaf
+from . import AddTree, DomTree, DomTreeLeaf, RealDomain
+from . import KPartiteGraph, MaxKPartiteGraphFind, MinKPartiteGraphFind
 from .verifier import Verifier, VerifierTimeout, VerifierNotExpr
 from .verifier import in_domain_constraint
+from .heuristics import SplitHeuristic, UnreachableLeafsHeuristic
 
 
 class VerifierFactory:
@@ -23,19 +26,44 @@ class VerifierFactory:
         raise RuntimeError("Override this method in your own verifier "
             + "factory defining your problem's constraints.")
 
+    def reuse(self, verifier, path_checking):
+        """
+        Override this method to let workers reuse warm verifiers (backend
+        context, feature types, declared variables) across tasks.
+
+        `verifier` was created by `__call__` for a leaf of the same AddTrees
+        and has been reset to the new leaf with `Verifier.reset`: re-add your
+        problem's constraints and return True. Its additional variables are
+        kept. Return False to create a new verifier for each task.
+        """
+        return False
+
     def inv_logit(self, prob):
         """ Convert probability to raw output values for binary classification. """
         return -math.log(1.0 / x - 1)
 
 
 
+# Per worker process: warm verifiers by (factory key, model ids, path_checking),
+# at most _VERIFIER_CACHE_SIZE per key; the keys of finished runs are dropped
+_VERIFIER_CACHE_SIZE = 4
+_verifier_cache = {}
+_verifier_cache_closed = set()
+_verifier_cache_lock = threading.Lock()
+
 class _VerifierFactoryWrap(VerifierFactory):
     def __init__(self, vfactory, add_domain_constraints_opt):
         self._vfactory = vfactory
         self.add_domain_constraints_opt = add_domain_constraints_opt
+        self._key = uuid.uuid4().hex # survives pickling, identifies the run
+        self._reuse = type(vfactory).reuse is not VerifierFactory.reuse
 
     def __call__(self, lk, path_checking):
-        v = self._vfactory(lk, path_checking)
+        v = None
+        if self._reuse:
+            v = self._cached_verifier(lk, path_checking)
+        if v is None:
+            v = self._vfactory(lk, path_checking)
         if self.add_domain_constraints_opt:
             for instance_index in range(lk.num_instances()):
                 v.add_constraint(in_domain_constraint(v,
@@ -43,6 +71,83 @@ class _VerifierFactoryWrap(VerifierFactory):
                     instance=instance_index))
         return v
 
+    def release(self, v, path_checking):
+        """ Give a verifier returned by `__call__` back to the worker's cache. """
+        if not self._reuse: return
+        with _verifier_cache_lock:
+            if self._key in _verifier_cache_closed: return # run finished
+            vs = _verifier_cache.setdefault(self._cache_key(v._lk, path_checking), [])
+            if len(vs) < _VERIFIER_CACHE_SIZE:
+                vs.append(v)
+
+    def new_run(self):
+        """ Use a new cache key; call `close` on the workers when done. """
+        self._key = uuid.uuid4().hex
+
+    @staticmethod
+    def close(key):
+        """ Drop the cached verifiers of run `key` in this process. """
+        with _verifier_cache_lock:
+            _verifier_cache_closed.add(key)
+            for k in [k for k in _verifier_cache if k[0] == key]:
+                del _verifier_cache[k]
+
+    def _cache_key(self, lk, path_checking):
+        model_ids = tuple(lk.addtree(i).model_id for i in range(lk.num_instances()))
+        return self._key, model_ids, path_checking
+
+    def _cached_verifier(self, lk, path_checking):
+        with _verifier_cache_lock:
+            vs = _verifier_cache.get(self._cache_key(lk, path_checking), [])
+            v = vs.pop() if len(vs) > 0 else None
+        if v is not None and self._vfactory.reuse(v.reset(lk), path_checking):
+            return v
+        return None
+
+
+
+
+
+# Per process: the number of users of each registered AddTree by model id;
+# the AddTree is unregistered when the last one releases it
+_addtree_refs = {}
+_addtree_refs_lock = threading.Lock()
+
+def _acquire_addtrees(addtrees, model_ids):
+    with _addtree_refs_lock:
+        for at, model_id in zip(addtrees, model_ids):
+            if at.register() != model_id:
+                raise RuntimeError("AddTree model id changed in transfer")
+            _addtree_refs[model_id] = _addtree_refs.get(model_id, 0) + 1
+
+def _release_addtrees(model_ids):
+    with _addtree_refs_lock:
+        for model_id in model_ids:
+            n = _addtree_refs.get(model_id, 0) - 1
+            if n > 0:
+                _addtree_refs[model_id] = n
+            else:
+                _addtree_refs.pop(model_id, None)
+                AddTree.unregister(model_id)
+
+class _AddTreeRegistration(WorkerPlugin):
+    """
+    Registers the AddTrees on each worker, also on workers that join or are
+    restarted later, so that DomTreeLeafs can be pickled with model ids.
+    Unregistering the plugin unregisters the AddTrees.
+    """
+
+    def __init__(self, addtrees, model_ids):
+        self.addtrees = addtrees
+        self.model_ids = model_ids
+        self.name = "treeck-addtrees-" + uuid.uuid4().hex
+
+    def setup(self, worker):
+        _acquire_addtrees(self.addtrees, self.model_ids)
+
+    def teardown(self, worker):
+        _release_addtrees(self.model_ids)
+
 
 
 
@@ -60,9 +165,29 @@ class DistributedVerifier:
             global_timeout = 0,
             timeout_start = 30,
             timeout_max = 600,
-            timeout_grow_rate = 1.5):
+            timeout_grow_rate = 1.5,
+            split_nthreads = 1,
+            split_heuristic = None,
+            max_fanout = 2,
+            register_addtrees = True,
+            output_bounds = None,
+            bound_max_steps = 1000,
+            bound_pq_budget = 0):
+        """
+        output_bounds=(lo, hi): promise that the problem of `verifier_factory`
+        is exactly lo < f < hi within the domains of a DomTree leaf, for a
+        single instance. Leafs whose KPartiteGraph output bounds exclude
+        (lo, hi) are then closed without a worker; the workers first search
+        the best clique of the others, with at most `bound_max_steps` search
+        steps and a search queue of at most `bound_pq_budget` cliques (0:
+        unbounded). This is not checked: if
+        the factory adds any other constraint, UNSAT results are wrong.
+        """
 
         assert isinstance(verifier_factory, VerifierFactory), "invalid verifier factory"
+        if split_heuristic is None:
+            split_heuristic = UnreachableLeafsHeuristic(split_nthreads)
+        assert isinstance(split_heuristic, SplitHeuristic), "invalid split heuristic"
 
         self._timeout_start = float(timeout_start)
         self._timeout_max = float(max(timeout_start, timeout_max))
@@ -79,11 +204,59 @@ class DistributedVerifier:
         self._num_initial_tasks_opt = num_initial_tasks
         self._stop_when_num_sats_opt = stop_when_num_sats
         self._global_timeout_opt = global_timeout
+        self._split_heuristic = split_heuristic
+        self._split_scores = {} # domtree_leaf_id => split heuristic score
+        self._max_fanout_opt = max(2, max_fanout)
+
+        # (lo, hi): leafs are decided by the bounds of their KPartiteGraph if
+        # possible, see `_check_output_bounds` and `_search_output_bounds`
+        self._output_bounds_opt = output_bounds
+        self._bound_max_steps_opt = bound_max_steps
+        self._bound_pq_budget_opt = bound_pq_budget # 0: unbounded search queue
 
         self._stop_flag = False
         self._print_queue = []
 
+        # ship the AddTrees to each worker once; DomTreeLeafs are then
+        # pickled with model ids instead of full AddTrees. Unregistered by
+        # `close`.
+        self._registration = None
+        if register_addtrees:
+            addtrees = [domtree.addtree(i) for i in range(domtree.num_instances())]
+            model_ids = [at.model_id for at in addtrees]
+            _acquire_addtrees(addtrees, model_ids)
+            self._registration = _AddTreeRegistration(addtrees, model_ids)
+            try:
+                client.register_plugin(self._registration)
+            except Exception:
+                _release_addtrees(model_ids)
+                raise
+
+    def close(self):
+        """ Unregister the AddTrees on the workers and here. """
+        if self._registration is None: return
+        registration, self._registration = self._registration, None
+        try:
+            self._client.unregister_worker_plugin(registration.name)
+        finally:
+            _release_addtrees(registration.model_ids)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
     def check(self):
+        self._verifier_factory.new_run()
+        try:
+            self._check()
+        finally:
+            # cached verifiers of this run each hold a backend context
+            self._client.run(_VerifierFactoryWrap.close, self._verifier_factory._key)
+
+    def _check(self):
+        self._stop_flag = False
         self.done_count = 0
         self.start_time = timeit.default_timer()
         self.sat_count = 0
@@ -118,9 +291,7 @@ class DistributedVerifier:
             lks = [l0]
 
         # 3: submit verifier 'check' tasks for each item in `ls`
-        for lk in lks:
-            f = self._make_verify_future(lk, self._timeout_start)
-            self._fs.append(f)
+        self._fs += self._make_verify_futures(lks, self._timeout_start)
 
         # 4: wait for future to complete, act on result
         # - if sat/unsat -> done (finish if sat if opt set)
@@ -142,11 +313,11 @@ class DistributedVerifier:
 
             wait(self._fs, return_when="FIRST_COMPLETED")
 
-            next_fs = []
-            for f in self._fs:
-                if f.done(): next_fs += self._handle_done_future(f)
-                else:        next_fs.append(f)
-            self._fs = next_fs
+            done = [f.done() for f in self._fs]
+            done_fs = [f for f, d in zip(self._fs, done) if d]
+            self._fs = [f for f, d in zip(self._fs, done) if not d]
+            for f in done_fs:
+                self._fs += self._handle_done_future(f)
             self._print_flush()
 
         self.results["check_time"] = timeit.default_timer() - self.start_time
@@ -179,7 +350,7 @@ class DistributedVerifier:
 
     def _generate_splits(self, l0, ntasks):
         # split domtrees until we have ntask `Subspace`s; this runs locally
-        l0.find_best_split()
+        self._find_best_split(l0)
         lks = [l0]
 
         while len(lks) < ntasks:
@@ -187,8 +358,9 @@ class DistributedVerifier:
             max_lk = None
 
             for lk in lks:
-                if lk.score > max_score:
-                    max_score = lk.score
+                score = self._split_scores[lk.domtree_leaf_id()]
+                if score > max_score:
+                    max_score = score
                     max_lk = lk
 
             if max_lk is None:
@@ -200,35 +372,41 @@ class DistributedVerifier:
             self._print_flush()
         return lks
 
-    def _split_domtree(self, lk, find_best_split):
+    def _split_domtree(self, lk, find_best_split, splits=None):
         nid = lk.domtree_leaf_id()
         split = lk.get_best_split()
-        score, balance = lk.score, lk.balance
+        score, balance = self._split_scores.get(nid, lk.score), lk.balance
 
-        self._domtree.apply_leaf(lk) # lk's fields are invalid after .split(lk)
-
-        l, r = self._domtree.tree().left(nid), self._domtree.tree().right(nid)
-        lk_l = self._domtree.get_leaf(l)
-        lk_r = self._domtree.get_leaf(r)
-
-        if find_best_split:
-            lk_l.find_best_split()
-            lk_r.find_best_split()
+        # lk's fields are invalid after .apply_leaf(lk)
+        if splits is None:
+            self._domtree.apply_leaf(lk)
+            children = [self._domtree.tree().left(nid), self._domtree.tree().right(nid)]
+        else:
+            children = self._domtree.apply_leaf(lk, splits)
+            self.results[nid]["splits"] = splits
+        lks = [self._domtree.get_leaf(c) for c in children]
 
         self.results[nid]["split"] = split
         self.results[nid]["score"] = score
         self.results[nid]["balance"] = balance
-        self.results[nid]["children"] = [l, r]
+        self.results[nid]["children"] = children
 
-        self.results[l] = self._init_results(lk_l)
-        self.results[r] = self._init_results(lk_r)
-        self.results[l]["parent"] = nid
-        self.results[r]["parent"] = nid
+        for c, lk_c in zip(children, lks):
+            self.results[c] = self._init_results(lk_c)
+            self.results[c]["parent"] = nid
+            if find_best_split:
+                self._find_best_split(lk_c)
 
-        self._print("SPLIT l{}: {} into {}, {}, score {} ".format(
-            nid, split, l, r, score))
+        self._print("SPLIT l{}: {} into {}, score {} ".format(
+            nid, split if splits is None else splits,
+            ", ".join(map(str, children)), score))
 
-        return [lk_l, lk_r]
+        return lks
+
+    def _find_best_split(self, lk):
+        nid = lk.domtree_leaf_id()
+        self._split_scores[nid] = self._split_heuristic(lk)
+        self.results[nid]["split_time"] = self._split_heuristic.score_time
 
     def _handle_done_future(self, f):
         t = f.result()
@@ -240,6 +418,13 @@ class DistributedVerifier:
         self.results[f.domtree_leaf_id]["status"] = status
         self.results[f.domtree_leaf_id]["check_time"] = check_time
         self.results[f.domtree_leaf_id]["num_leafs"] = num_leafs
+        if status != Verifier.Result.UNKNOWN and t[4]:
+            self.results[f.domtree_leaf_id]["by_output_bounds"] = True
+
+        parent = self.results[f.domtree_leaf_id].get("parent")
+        if parent is not None:
+            for split in self.results[parent].get("splits", [self.results[parent]["split"]]):
+                self._split_heuristic.feedback(split, status != Verifier.Result.UNKNOWN)
 
         # We're finished with this branch!
         if status != Verifier.Result.UNKNOWN:
@@ -253,28 +438,81 @@ class DistributedVerifier:
 
         else: # We timed out, split and try again
             lk = t[3]
+            self._split_scores[f.domtree_leaf_id] = t[4]
+            self.results[f.domtree_leaf_id]["split_time"] = t[5]
             self.results[f.domtree_leaf_id]["num_unreachable_after"] = self._num_unreachable(lk)
             next_timeout = min(self._timeout_max, self._timeout_rate * f.timeout)
 
-            new_lks = self._split_domtree(lk, False)
-            new_fs = [self._make_verify_future(lk, next_timeout) for lk in new_lks]
-
-            return new_fs
-
+            # fan out to idle workers: n-ary split instead of binary split
+            nparts = min(self._max_fanout_opt, self._nworkers - len(self._fs))
+            splits = None
+            if nparts > 2:
+                splits = self._split_heuristic.find_best_splits(lk, nparts)
 
+            new_lks = self._split_domtree(lk, False, splits)
+            return self._make_verify_futures(new_lks, next_timeout)
 
+    def _check_output_bounds(self, lk):
+        """
+        Decide `lk` without a worker: UNSAT if the [min, max] output bounds
+        of the KPartiteGraph of its reachable leafs (Chen et al. 2019)
+        exclude `output_bounds`. Returns (status, model), or None.
+        """
+        if self._output_bounds_opt is None or lk.num_instances() != 1:
+            return None
+        lo, hi = self._output_bounds_opt
+        at = lk.addtree(0)
+
+        graph = KPartiteGraph(lk, 0)
+        if len(graph) == 0:
+            return None
+        glo, ghi = graph.propagate_outputs()
+        if ghi + at.base_score <= lo or glo + at.base_score >= hi:
+            return Verifier.Result.UNSAT, {}
+        return None
+
+    def _make_verify_futures(self, lks, timeout):
+        """ Futures for the leafs in `lks` that are not decided by their
+        output bounds. """
+        fs = []
+        for lk in lks:
+            if self._stop_flag: break
+            nid = lk.domtree_leaf_id()
+            t0 = timeit.default_timer()
+            decided = self._check_output_bounds(lk)
+            if decided is None:
+                fs.append(self._make_verify_future(lk, timeout))
+                continue
+
+            status, model = decided
+            check_time = timeit.default_timer() - t0
+            self._print("{} for l{} by output bounds in {:.2f}s".format(status,
+                nid, check_time))
+            self.results[nid]["status"] = status
+            self.results[nid]["check_time"] = check_time
+            self.results[nid]["model"] = model
+            self.results[nid]["by_output_bounds"] = True
+            self.done_count += 1
+        return fs
 
     def _make_verify_future(self, lk, timeout):
         nid = lk.domtree_leaf_id()
         tree = self._domtree.tree()
-        parent_split = None
-
-        if not tree.is_root(nid) and self._check_paths_opt:
-            pid = tree.parent(nid)
-            parent_split = tree.get_split(pid)
-
+        parent_splits = []
+
+        # all domtree splits between this leaf and its parent in `results`
+        parent = self.results.get(nid, {}).get("parent")
+        if parent is not None and self._check_paths_opt:
+            pid = nid
+            while pid != parent:
+                pid = tree.parent(pid)
+                parent_splits.append(tree.get_split(pid))
+
+        bounds_opts = (self._output_bounds_opt, self._bound_max_steps_opt,
+                self._bound_pq_budget_opt)
         f = self._client.submit(DistributedVerifier._verify_fun,
-                lk, timeout, self._verifier_factory, parent_split)
+                lk, timeout, self._verifier_factory, self._split_heuristic,
+                parent_splits, bounds_opts)
 
         f.timeout = timeout
         f.domtree_leaf_id = nid
@@ -336,6 +574,8 @@ class DistributedVerifier:
 
         v.instance(instance_index).mark_unreachable_paths(tree_index, only_feat_id)
 
+        if v is not v_or_vfactory:
+            v_or_vfactory.release(v, True)
         return lk
 
     @staticmethod
@@ -349,13 +589,76 @@ class DistributedVerifier:
         return lk
 
     @staticmethod
-    def _verify_fun(lk, timeout, vfactory, parent_split = None):
+    def _search_output_bounds(lk, output_bounds, max_steps, pq_budget):
+        """
+        Decide `lk` by its best clique towards `output_bounds`, before
+        building a verifier: UNSAT if the clique is not good enough, SAT if
+        its box contains a witness. Returns (status, model), or None.
+        """
+        if output_bounds is None or lk.num_instances() != 1:
+            return None
+        lo, hi = output_bounds
+        at = lk.addtree(0)
+
+        graph = KPartiteGraph(lk, 0)
+        if len(graph) == 0:
+            return None
+
+        # best-first search for the max (min) clique, exact when it finishes
+        # without pruning; under a queue budget, rely on the proven bounds
+        maximize = math.isinf(hi) or not math.isinf(lo)
+        find = MaxKPartiteGraphFind(graph) if maximize else MinKPartiteGraphFind(graph)
+        find.set_pq_budget(pq_budget)
+        while len(find.solutions()) == 0 and find.nsteps() < max_steps:
+            if not find.step():
+                break
+        blo, bhi = find.bounds()
+        if (maximize and bhi + at.base_score <= lo) or \
+                (not maximize and blo + at.base_score >= hi):
+            return Verifier.Result.UNSAT, {} # the best clique is not good enough
+        if len(find.solutions()) == 0:
+            return None
+
+        # a point in the clique's box and in the leaf's domains (the box is
+        # restricted to them); the other features are unconstrained
+        output, box = find.solutions()[0]
+        doms = lk.get_domains(0)
+        doms.update(box)
+        xs = {}
+        for feat_id, dom in doms.items():
+            if not isinstance(dom, RealDomain): xs[feat_id] = dom.is_true()
+            elif not math.isinf(dom.lo):        xs[feat_id] = dom.lo
+            elif not math.isinf(dom.hi):
+                xs[feat_id] = float(np.nextafter(np.float32(dom.hi), -np.inf))
+            else: xs[feat_id] = 0.0
+        row = np.zeros((1, max(xs.keys(), default=-1) + 1), dtype=np.float32)
+        for feat_id, x in xs.items():
+            row[0, feat_id] = x
+        f = float(at.predict(row)[0])
+        if lo < f < hi:
+            return Verifier.Result.SAT, {"xs": xs, "f": f, "family": dict(box)}
+        if find.npruned() == 0 and ((f <= lo and math.isinf(hi)) or (f >= hi and math.isinf(lo))):
+            return Verifier.Result.UNSAT, {} # the best clique is not good enough
+        return None
+
+    @staticmethod
+    def _verify_fun(lk, timeout, vfactory, split_heuristic, parent_splits = None,
+            bounds_opts = (None, 0, 0)):
+        if parent_splits is None:
+            parent_splits = []
+
+        t0 = timeit.default_timer()
+        decided = DistributedVerifier._search_output_bounds(lk, *bounds_opts)
+        if decided is not None:
+            status, model = decided
+            return status, timeit.default_timer() - t0, [], model, True
+
         v = vfactory(lk, False)
 
         # Re-checking reachabilities after split, only for splits involving feat_id
-        if parent_split is not None and lk.num_instances() > 1:
-            feat_id = parent_split[1].feat_id
-            lk = DistributedVerifier._recheck_tree_paths(lk, v, feat_id)
+        if lk.num_instances() > 1:
+            for feat_id in sorted({split.feat_id for _, split in parent_splits}):
+                lk = DistributedVerifier._recheck_tree_paths(lk, v, feat_id)
 
         v.set_timeout(timeout)
         v.add_all_trees()
@@ -367,11 +670,15 @@ class DistributedVerifier:
                 model = v.model()
                 model["family"] = v.model_family(model)
 
-            return status, v.check_time, num_leafs, model
+            return status, v.check_time, num_leafs, model, False
 
         except VerifierTimeout as e:
-            lk.find_best_split()
+            score = split_heuristic(lk)
 
             print(f"timeout after {e.unk_after} (timeout = {timeout}) best split = {lk.get_best_split()}")
 
-            return Verifier.Result.UNKNOWN, v.check_time, num_leafs, lk
+            return Verifier.Result.UNKNOWN, v.check_time, num_leafs, lk, \
+                    score, split_heuristic.score_time
+
+        finally:
+            vfactory.release(v, False)
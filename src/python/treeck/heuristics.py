@@ -0,0 +1,144 @@
+# Copyright 2019 DTAI Research Group - KU Leuven.
+# License: Apache License 2.0
+# Author: Laurens Devos
+
+import timeit, math
+
+from . import LtSplit
+
+
+class SplitHeuristic:
+    """
+    Chooses the best split of a DomTreeLeaf. Must be pickleable: it is sent
+    to the workers along with each task.
+
+    Subclasses implement `find_best_split`, which must set the leaf's best
+    split and return its score (higher is better).
+    """
+
+    def __init__(self, nthreads=1):
+        self.nthreads = nthreads
+        self.score_time = 0.0 # time taken by the last call
+
+    def __call__(self, lk):
+        t0 = timeit.default_timer()
+        try:
+            return self.find_best_split(lk)
+        finally:
+            self.score_time = timeit.default_timer() - t0
+
+    def find_best_split(self, lk):
+        raise RuntimeError("Override this method in your split heuristic")
+
+    def find_best_splits(self, lk, nparts, same_feature=False):
+        """
+        Splits for an n-ary split of `lk` into at most `nparts` parts, to be
+        passed to `DomTree.apply_leaf`. Starts with the leaf's best split, if
+        set. If `same_feature`, uses up to nparts-1 split values of the
+        feature of the first split; otherwise, takes the product of the best
+        split of the floor(log2(nparts)) best (instance, feat_id) pairs by
+        number of unreachable leafs.
+        """
+        candidates = [(i, split) for i, split, _ in lk.get_split_candidates()]
+        counts = lk.count_unreachable_leafs(candidates, self.nthreads)
+        per_feat = {} # (i, feat_id) => [(score, split), ...]
+        for (i, split), (ul, ur) in zip(candidates, counts):
+            per_feat.setdefault((i, split.feat_id), []).append((ul + ur, (i, split)))
+        if len(per_feat) == 0:
+            raise RuntimeError("no DomTree split found")
+
+        # best feature first, best split of each feature first (stable sorts)
+        keys = sorted(per_feat.keys(), key=lambda k: -max(c for c, _ in per_feat[k]))
+        for key in per_feat:
+            per_feat[key] = [s for _, s in sorted(per_feat[key], key=lambda x: -x[0])]
+
+        first = lk.get_best_split()
+        if first is not None:
+            key = (first[0], first[1].feat_id)
+            keys = [key] + [k for k in keys if k != key]
+            per_feat[key] = [first] + [s for s in per_feat[key] if s != first]
+
+        if same_feature:
+            return per_feat[keys[0]][0:max(1, nparts - 1)]
+        n = max(1, int(math.log2(max(2, nparts))))
+        return [per_feat[k][0] for k in keys[0:n]]
+
+    def feedback(self, split, solved):
+        """ Called on the coordinator when a child of `split` finishes;
+        `solved` is False if it timed out. """
+        pass
+
+    def _set_best(self, lk, candidates, scores):
+        if len(candidates) == 0:
+            raise RuntimeError("no DomTree split found")
+        k = max(range(len(candidates)), key=lambda k: scores[k]) # first max
+        lk.set_best_split(candidates[k])
+        return scores[k]
+
+
+class UnreachableLeafsHeuristic(SplitHeuristic):
+    """ Number of leafs that become unreachable, balance as tie-breaker. """
+
+    def find_best_split(self, lk):
+        lk.find_best_split(self.nthreads)
+        return lk.score
+
+
+class TreeBoundsHeuristic(SplitHeuristic):
+    """ Reduction of the summed width of the reachable leaf value ranges of
+    the trees, summed over both parts of the split. """
+
+    def find_best_split(self, lk):
+        candidates = [(i, split) for i, split, _ in lk.get_split_candidates()]
+        widths = lk.sum_tree_bounds_width(candidates, self.nthreads)
+        width0 = [lk.sum_tree_bounds_width(i) for i in range(lk.num_instances())]
+        scores = [2.0 * width0[i] - wl - wr
+                for (i, _), (wl, wr) in zip(candidates, widths)]
+        return self._set_best(lk, candidates, scores)
+
+
+class FeatureFrequencyHeuristic(SplitHeuristic):
+    """ Split on the feature used by most reachable nodes, at the median of
+    its reachable split values. """
+
+    def find_best_split(self, lk):
+        freqs = {}
+        for i, split, count in lk.get_split_candidates():
+            entry = freqs.setdefault((i, split.feat_id), [0, []]) # [count, splits]
+            entry[0] += count
+            entry[1].append(split)
+        if len(freqs) == 0:
+            raise RuntimeError("no DomTree split found")
+
+        (i, _), (freq, splits) = max(freqs.items(), key=lambda x: x[1][0])
+        if isinstance(splits[0], LtSplit):
+            splits.sort(key=lambda s: s.split_value)
+        lk.set_best_split((i, splits[len(splits) // 2]))
+        return freq
+
+
+class LearnedHeuristic(SplitHeuristic):
+    """
+    Unreachable leaf counts weighted per (instance, feat_id) by how often
+    splits on that feature led to subproblems that were solved before their
+    timeout, learned from the coordinator's `feedback`.
+    """
+
+    def __init__(self, nthreads=1, learning_rate=0.3, prior=0.5):
+        super().__init__(nthreads)
+        self.learning_rate = learning_rate
+        self.prior = prior
+        self.weights = {}
+
+    def find_best_split(self, lk):
+        candidates = [(i, split) for i, split, _ in lk.get_split_candidates()]
+        counts = lk.count_unreachable_leafs(candidates, self.nthreads)
+        scores = [(ul + ur) * (0.5 + self.weights.get((i, split.feat_id), self.prior))
+                for (i, split), (ul, ur) in zip(candidates, counts)]
+        return self._set_best(lk, candidates, scores)
+
+    def feedback(self, split, solved):
+        i, split = split
+        key = (i, split.feat_id)
+        w = self.weights.get(key, self.prior)
+        self.weights[key] = w + self.learning_rate * (float(solved) - w)
@@ -4,6 +4,7 @@
 
 import math, timeit
 from bisect import bisect
+import numpy as np
 
 from enum import Enum
 from . import RealDomain, BoolDomain, AddTreeFeatureTypes
@@ -155,12 +156,47 @@ def not_in_domain_constraint(verifier, domains, instance, strict=True):
         return VerifierOrExpr(*cs)
     return VerifierAndExpr(*cs)
 
+def _float32_below(value): # largest float32 <= value
+    f = np.float32(value)
+    return np.nextafter(f, np.float32(-np.inf)) if float(f) > value else f
+
+def _float32_above(value): # smallest float32 >= value
+    f = np.float32(value)
+    return np.nextafter(f, np.float32(np.inf)) if float(f) < value else f
+
+def _real_bound(op, value):
+    """
+    Bounds (lo, hi) of the smallest float32 RealDomain [lo, hi) containing
+    all reals x for which `x op value` holds, or None.
+    """
+    lo, hi = -math.inf, math.inf
+    if op in (VerifierLtExpr, VerifierLeExpr, VerifierEqExpr):
+        hi = _float32_above(value)
+        if op != VerifierLtExpr and float(hi) == value: # x == hi must be included
+            hi = np.nextafter(hi, np.float32(np.inf))
+    if op in (VerifierGtExpr, VerifierGeExpr, VerifierEqExpr):
+        lo = _float32_below(value)
+    if op == VerifierNeExpr or math.isnan(value):
+        return None
+    return float(lo), float(hi)
+
+_FLIPPED_ORDER_EXPR = {
+    VerifierLtExpr: VerifierGtExpr, VerifierGtExpr: VerifierLtExpr,
+    VerifierLeExpr: VerifierGeExpr, VerifierGeExpr: VerifierLeExpr,
+    VerifierEqExpr: VerifierEqExpr, VerifierNeExpr: VerifierNeExpr}
+
 
 # -----------------------------------------------------------------------------
 
 
 class VerifierBackend:
 
+    # tree encoding for backends with `add_smtlib`: nested if-then-else
+    # terms, or one indicator per leaf, and split tests as inline comparisons
+    # or as ordered literals shared by the trees (see `DomTreeLeaf.to_smtlib`)
+    leaf_indicators = False
+    shared_splits = False
+
     def set_timeout(self, timeout):
         """
         Set the maximum number of SECONDS the backend is allowed to spend.
@@ -187,6 +223,28 @@ class VerifierBackend:
         """ Given the backend a chance to process a bunch of added constraints. """
         raise RuntimeError("abstract method")
 
+    def reset(self):
+        """ Remove all constraints, but keep the variables. """
+        raise RuntimeError("abstract method")
+
+    def add_smtlib(self, smtlib, variables):
+        """
+        Optional: add the assertions in SMT-LIB 2 string `smtlib`, which uses
+        the names in dict `variables` (name => variable) without declaring
+        them. Backends that do not override this get trees encoded node by
+        node through `encode_split`, `encode_internal`, and `encode_leaf`.
+        """
+        raise RuntimeError("abstract method")
+
+    def push(self):
+        """ Create a backtracking point: constraints added after `push` are
+        removed by the matching `pop`. """
+        raise RuntimeError("abstract method")
+
+    def pop(self):
+        """ Remove the constraints added since the last `push`. """
+        raise RuntimeError("abstract method")
+
     def encode_leaf(self, tree_var, leaf_value):
         """ Encode the leaf node """
         raise RuntimeError("abstract method")
@@ -266,6 +324,29 @@ class Verifier:
         self.check_time = -math.inf
         self.nchecks = 0
 
+    def reset(self, domtree_leaf):
+        """
+        Reuse this verifier for another leaf of the same AddTrees: removes all
+        constraints, but keeps the backend and the declared variables,
+        including those added with `add_rvar` and `add_bvar`.
+        """
+        assert isinstance(domtree_leaf, DomTreeLeaf)
+        if domtree_leaf.num_instances() != len(self._instances) or any(
+                domtree_leaf.addtree(i).model_id != inst._addtree.model_id
+                for i, inst in enumerate(self._instances)):
+            raise RuntimeError("Verifier.reset: leaf of different AddTrees")
+
+        self._backend.reset()
+        self._lk = domtree_leaf
+        for inst in self._instances:
+            inst._reset()
+
+        self._status = Verifier.Result.UNKNOWN
+
+        self.check_time = -math.inf
+        self.nchecks = 0
+        return self
+
     def instance(self, instance=0):
         return self._instances[instance]
 
@@ -313,8 +394,32 @@ class Verifier:
         Add a user-defined constraint. Use add_rvar, rvar, bvar, xvar, and fvar
         to get access to the variables.
         """
+        self._collect_bounds(constraint)
         return self._backend.add_constraint(constraint)
 
+    def _collect_bounds(self, c):
+        """
+        Record the plain comparisons of an xvar with a constant in (conjunctions
+        of) constraints as bounds; `mark_unreachable_paths` uses them to prune
+        nodes without calling the backend.
+        """
+        if isinstance(c, VerifierAndExpr):
+            for conjunct in c.conjuncts:
+                self._collect_bounds(conjunct)
+        elif isinstance(c, Xvar):
+            c._verifier._add_bool_bound(c._feat_id, True)
+        elif isinstance(c, VerifierNotExpr) and isinstance(c.expr, Xvar):
+            c.expr._verifier._add_bool_bound(c.expr._feat_id, False)
+        elif type(c) in _FLIPPED_ORDER_EXPR:
+            op, lhs, rhs = type(c), c.lhs, c.rhs
+            if isinstance(rhs, Xvar):
+                op, lhs, rhs = _FLIPPED_ORDER_EXPR[op], rhs, lhs
+            if isinstance(lhs, Xvar) and isinstance(rhs, (float, int)) \
+                    and not isinstance(rhs, bool):
+                bound = _real_bound(op, rhs)
+                if bound is not None:
+                    lhs._verifier._add_real_bound(lhs._feat_id, *bound)
+
     def set_timeout(self, timeout):
         """ Set the timeout of the backend solver. """
         self._backend.set_timeout(timeout)
@@ -397,6 +502,13 @@ class AddTreeInstance:
                 for i in range(len(self._addtree))]
         self._fvar = self._v._backend.add_real_var(f"f{suffix}")
 
+        self._reset()
+
+    def _reset(self):
+        self._addtree = self._v._lk.addtree(self._instance_index)
+        self._real_bounds = {} # feat_id => (lo, hi) from the constraints
+        self._bool_bounds = {} # feat_id => True/False, None if conflicting
+
         # FVAR = sum{WVARS}
         fexpr = SumExpr(self._addtree.base_score, *self._wvars)
         self._v.add_constraint(fexpr == self.fvar())
@@ -418,6 +530,8 @@ class AddTreeInstance:
 
     def add_tree(self, tree_index):
         """ Add the full encoding of a tree to the backend.  """
+        if self._has_smtlib():
+            return self._add_trees_smtlib([tree_index])
         tree = self._addtree[tree_index]
         enc = self._enc_tree(tree, tree.root())
         self._v._backend.add_constraint(enc)
@@ -430,9 +544,25 @@ class AddTreeInstance:
 
     def add_all_trees(self):
         """ Add all trees in the addtree. """
+        if self._has_smtlib():
+            return self._add_trees_smtlib(range(len(self._addtree)))
         for tree_index in range(len(self._addtree)):
             self.add_tree(tree_index)
 
+    def _has_smtlib(self):
+        return type(self._v._backend).add_smtlib is not VerifierBackend.add_smtlib
+
+    def _add_trees_smtlib(self, tree_indices):
+        """ Encode the trees natively, see `DomTreeLeaf.to_smtlib`. """
+        tree_indices = list(tree_indices)
+        smtlib, leaf_count = self._v._lk.to_smtlib(self._instance_index,
+                tree_indices, leaf_indicators=self._v._backend.leaf_indicators,
+                shared_splits=self._v._backend.shared_splits)
+        variables = {f"x{fid}": var for fid, var in self._xvars.items()}
+        variables.update((f"w{i}", self._wvars[i]) for i in tree_indices)
+        self._v._backend.add_smtlib(smtlib, variables)
+        self.leaf_count += leaf_count
+
     def feat_ids(self):
         """ Loop over all feature IDs in the associated addtree. """
         yield from self._feat_types.feat_ids()
@@ -440,42 +570,70 @@ class AddTreeInstance:
     def mark_unreachable_paths(self, tree_index, only_feat_id = -1):
         """
         Check the reachability of the paths in the trees of this instance
-        against the constraints in the Verifier.
+        against the constraints in the Verifier. The tree is traversed
+        depth-first; each level adds a single split condition to the backend
+        between a `push` and a `pop`.
         """
-        i = self._instance_index
         tree = self._addtree[tree_index]
-        stack = [(tree.root(), VerifierAndExpr())]
 
-        while len(stack) > 0:
-            node, path_constraints = stack.pop()
-
-            l, r = tree.left(node), tree.right(node)
-            split = tree.get_split(node)
-            xvar = self._xvars[split.feat_id]
-
-            if only_feat_id != -1 and split.feat_id != only_feat_id:
-                continue # only test paths splitting on this feat_id
-
-            constraint_l = self._v._backend.encode_split(xvar, split)
-            constraint_r = VerifierNotExpr(constraint_l)
-
-            if self._v._lk.is_reachable(i, tree_index, l):
-                path_constraints_l = VerifierAndExpr(constraint_l, path_constraints);
-                if self._v.check(path_constraints_l).is_sat():
-                    if tree.is_internal(l):
-                        stack.append((l, path_constraints_l))
-                else:
-                    #print(f"unreachable  left: {i} {tree_index} {l}, {only_feat_id}")
-                    self._v._lk.mark_unreachable(i, tree_index, l)
-
-            if self._v._lk.is_reachable(i, tree_index, r):
-                path_constraints_r = VerifierAndExpr(constraint_r, path_constraints);
-                if self._v.check(path_constraints_r).is_sat():
-                    if tree.is_internal(r):
-                        stack.append((r, path_constraints_r))
-                else:
-                    #print(f"unreachable right: {i} {tree_index} {r}, {only_feat_id}")
-                    self._v._lk.mark_unreachable(i, tree_index, r)
+        # interval pre-filter: only the nodes that remain go to the backend
+        domains = self._bound_domains()
+        if only_feat_id != -1:
+            domains = {only_feat_id: domains[only_feat_id]} \
+                    if only_feat_id in domains else {}
+        if len(domains) > 0:
+            self._v._lk.mark_unreachable_outside(self._instance_index,
+                    tree_index, domains)
+
+        if tree.is_internal(tree.root()):
+            self._mark_unreachable_paths(tree, tree.root(), only_feat_id)
+
+    def _mark_unreachable_paths(self, tree, node, only_feat_id):
+        i, tree_index = self._instance_index, tree.index()
+        split = tree.get_split(node)
+        xvar = self._xvars[split.feat_id]
+
+        if only_feat_id != -1 and split.feat_id != only_feat_id:
+            return # only test paths splitting on this feat_id
+
+        constraint_l = self._v._backend.encode_split(xvar, split)
+        constraint_r = VerifierNotExpr(constraint_l)
+
+        for child, constraint in [(tree.left(node), constraint_l),
+                                  (tree.right(node), constraint_r)]:
+            if not self._v._lk.is_reachable(i, tree_index, child):
+                continue
+            self._v._backend.push()
+            try:
+                self._v._backend.add_constraint(constraint)
+                if not self._v.check().is_sat():
+                    #print(f"unreachable: {i} {tree_index} {child}, {only_feat_id}")
+                    self._v._lk.mark_unreachable(i, tree_index, child)
+                elif tree.is_internal(child):
+                    self._mark_unreachable_paths(tree, child, only_feat_id)
+            finally:
+                self._v._backend.pop()
+
+    def _add_real_bound(self, feat_id, lo, hi):
+        if self._addtree.feat_types.get(feat_id) != LtSplit: return
+        lo0, hi0 = self._real_bounds.get(feat_id, (-math.inf, math.inf))
+        self._real_bounds[feat_id] = (max(lo, lo0), min(hi, hi0))
+
+    def _add_bool_bound(self, feat_id, value):
+        if self._addtree.feat_types.get(feat_id) != BoolSplit: return
+        value0 = self._bool_bounds.get(feat_id, value)
+        self._bool_bounds[feat_id] = value if value0 == value else None
+
+    def _bound_domains(self):
+        """ Box of the bounds; conflicting bounds are left to the backend. """
+        domains = {}
+        for feat_id, (lo, hi) in self._real_bounds.items():
+            if lo < hi and (lo, hi) != (-math.inf, math.inf):
+                domains[feat_id] = RealDomain(lo, hi)
+        for feat_id, value in self._bool_bounds.items():
+            if value is not None:
+                domains[feat_id] = BoolDomain(value)
+        return domains
 
     def _enc_tree(self, tree, node):
         if tree.is_leaf(node):
@@ -497,8 +655,18 @@ class AddTreeInstance:
             return self._v._backend.encode_internal(split_enc, l, r)
 
     def _xs_family(self, xs):
-        leafs = [tree.predict_leaf(xs) for tree in self._addtree]
-        return self._addtree.get_domains(leafs)
+        missing = [feat_id for feat_id in self._feat_types.feat_ids()
+                if xs.get(feat_id) is None]
+        if len(missing) > 0:
+            raise RuntimeError(f"model family: no value for feat_ids {missing}")
+
+        # features not used by the trees do not change the leafs: 0.0
+        row = np.zeros((1, max(xs.keys(), default=-1) + 1))
+        for feat_id, x in xs.items():
+            if x is not None:
+                row[0, feat_id] = x
+        leafs = self._addtree.predict_leafs(row)
+        return self._addtree.get_domains(leafs)[0]
         #if self._splits is None:
         #    self._splits = self._addtree.get_splits()
 
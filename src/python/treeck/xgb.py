@@ -2,7 +2,9 @@
 # License: Apache License 2.0
 # Author: Laurens Devos
 
-import json
+import json, math
+
+import numpy as np
 
 from xgboost.sklearn import XGBModel
 from xgboost.core import Booster
@@ -12,7 +14,7 @@ from . import AddTree
 def addtree_from_xgb_model(model, feat2id_map=lambda x: int(x[1:]),
         multiclass=(0, 1)):
     """
-    mulclass=(offset, num_classes): only loads tree offset, offset+num_classes,
+    multiclass=(offset, num_classes): only loads tree offset, offset+num_classes,
     offset+2*num_classes...
     """
     base_score = 0.5
@@ -59,3 +61,161 @@ def _parse_tree(at, tree_dump, feat2id_map):
         else:
             leaf_value = node_json["leaf"]
             tree.set_leaf_value(node, leaf_value)
+
+# XGBoost stores base_score as a prediction; its margin depends on the link
+_XGB_LOGIT_OBJECTIVES = {"binary:logistic", "reg:logistic"}
+_XGB_LOG_OBJECTIVES = {"count:poisson", "reg:gamma", "reg:tweedie",
+        "survival:cox", "survival:aft"}
+_XGB_IDENTITY_OBJECTIVES = {"reg:squarederror", "reg:linear",
+        "reg:squaredlogerror", "reg:pseudohubererror", "reg:absoluteerror",
+        "reg:quantileerror", "binary:hinge", "multi:softmax", "multi:softprob",
+        "rank:pairwise", "rank:ndcg", "rank:map"}
+
+def addtree_from_xgb_json(model, feat2id_map=None, multiclass=(0, 1)):
+    """
+    Load an AddTree from XGBoost's full model JSON or UBJSON (`save_raw`) in
+    one pass. `model` is a Booster, an XGBModel, the raw bytes, a path to a
+    .json/.ubj file, or the already decoded dict. Trees are built in C++ from
+    the flat node arrays.
+
+    feat2id_map: None to use XGBoost's feature indices as feat_ids, or a
+    function mapping feature names ("f0", "f1", ... if the model has none)
+    to feat_ids.
+    multiclass=(class, num_classes): only loads the trees of `class`, as given
+    by the model's `tree_info`.
+
+    base_score is converted to a margin for the logit and log link
+    objectives; objectives with an unknown link raise a RuntimeError.
+
+    Missing value routing (`default_left`) is ignored. Indicator features
+    (feature type "i") become BoolSplits when all their split conditions are
+    in (0, 1], i.e., when they separate 0 from 1; otherwise they keep
+    LtSplits.
+    """
+    if isinstance(model, XGBModel):
+        model = model.get_booster()
+    if isinstance(model, Booster):
+        model = model.save_raw("ubj")
+    if isinstance(model, str):
+        with open(model, "rb") as fh:
+            model = fh.read()
+    if isinstance(model, (bytes, bytearray, memoryview)):
+        model = _xgb_loads(bytes(model))
+
+    learner = model["learner"]
+    params = learner["learner_model_param"]
+    gbtree = learner["gradient_booster"]["model"]
+    trees = gbtree["trees"]
+    feature_types = learner.get("feature_types", [])
+    feature_names = learner.get("feature_names", [])
+
+    offset, num_classes = multiclass
+    base_scores = params["base_score"].strip("[]").split(",") # one per class
+    base_score = float(base_scores[offset if len(base_scores) > 1 else 0])
+    objective = learner.get("objective", {}).get("name", "")
+    if objective in _XGB_LOGIT_OBJECTIVES:
+        base_score = math.log(base_score / (1.0 - base_score)) # margin
+    elif objective in _XGB_LOG_OBJECTIVES:
+        base_score = math.log(base_score)
+    elif objective not in _XGB_IDENTITY_OBJECTIVES:
+        raise RuntimeError(f"unsupported objective '{objective}': "
+                "unknown link function for base_score")
+
+    num_feature = int(params["num_feature"])
+    is_indicator = np.zeros(num_feature, dtype=bool)
+    for i, t in enumerate(feature_types):
+        is_indicator[i] = (t == "i")
+    feat_ids = np.arange(num_feature, dtype=np.int32)
+    if feat2id_map is not None:
+        names = feature_names if len(feature_names) > 0 \
+                else [f"f{i}" for i in range(num_feature)]
+        feat_ids = np.array([feat2id_map(n) for n in names], dtype=np.int32)
+
+    tree_info = gbtree.get("tree_info", np.arange(len(trees)) % num_classes)
+    tree_info = np.asarray(tree_info, dtype=np.int64)
+    trees = [tree for tree, c in zip(trees, tree_info) if c == offset]
+
+    # a feature is binary if XGBoost marks it as an indicator, and all its
+    # splits separate 0 from 1 (a feat_id cannot mix Lt- and BoolSplits)
+    is_binary = is_indicator.copy()
+    for tree in trees:
+        split_indices = np.asarray(tree["split_indices"], dtype=np.int64)
+        values = np.asarray(tree["split_conditions"], dtype=np.float32)
+        internal = np.asarray(tree["left_children"], dtype=np.int32) != -1
+        separates = (values > 0.0) & (values <= 1.0)
+        is_binary[split_indices[internal & ~separates]] = False
+
+    at = AddTree()
+    at.base_score = base_score
+
+    for tree in trees:
+        if np.any(np.asarray(tree["split_type"]) != 0):
+            raise RuntimeError("categorical splits not supported")
+        split_indices = np.asarray(tree["split_indices"], dtype=np.int64)
+        values = np.asarray(tree["split_conditions"], dtype=np.float32)
+        left = np.asarray(tree["left_children"], dtype=np.int32)
+        right = np.asarray(tree["right_children"], dtype=np.int32)
+
+        is_bool = (left != -1) & is_binary[split_indices]
+        # XGBoost sends x to the left child iff x < split_condition, i.e.,
+        # false goes left, whereas BoolSplit sends true to the left
+        left, right = np.where(is_bool, right, left), np.where(is_bool, left, right)
+
+        at.add_tree_from_arrays(feat_ids[split_indices], values, left, right,
+                is_bool)
+
+    return at
+
+def _xgb_loads(data):
+    if data[:1] == b"{" and data[1:2] in b"\"} \t\r\n":
+        return json.loads(data)
+    value, _ = _ubj_value(memoryview(data), 0)
+    return value
+
+_UBJ_NUMBERS = { # marker: (big-endian numpy dtype, size)
+    b"i": (">i1", 1), b"U": (">u1", 1), b"I": (">i2", 2), b"l": (">i4", 4),
+    b"L": (">i8", 8), b"d": (">f4", 4), b"D": (">f8", 8) }
+
+def _ubj_value(buf, pos, marker=None):
+    if marker is None:
+        marker, pos = bytes(buf[pos:pos+1]), pos+1
+    if marker in _UBJ_NUMBERS:
+        dtype, size = _UBJ_NUMBERS[marker]
+        return np.frombuffer(buf, dtype, 1, pos)[0].item(), pos + size
+    if marker == b"S" or marker == b"H":
+        n, pos = _ubj_value(buf, pos)
+        return bytes(buf[pos:pos+n]).decode("utf-8"), pos + n
+    if marker == b"C":
+        return bytes(buf[pos:pos+1]).decode("utf-8"), pos + 1
+    if marker == b"T": return True, pos
+    if marker == b"F": return False, pos
+    if marker == b"Z": return None, pos
+    if marker == b"[" or marker == b"{":
+        return _ubj_container(buf, pos, marker == b"{")
+    raise RuntimeError(f"unsupported UBJSON marker {marker}")
+
+def _ubj_container(buf, pos, is_object):
+    vtype, count = None, None
+    if buf[pos:pos+1] == b"$":
+        vtype, pos = bytes(buf[pos+1:pos+2]), pos+2
+    if buf[pos:pos+1] == b"#":
+        count, pos = _ubj_value(buf, pos+1)
+
+    # typed numeric arrays: one bulk read
+    if not is_object and count is not None and vtype in _UBJ_NUMBERS:
+        dtype, size = _UBJ_NUMBERS[vtype]
+        values = np.frombuffer(buf, dtype, count, pos)
+        return values.astype(values.dtype.newbyteorder("=")), pos + count * size
+
+    result = {} if is_object else []
+    while count is None or len(result) < count:
+        if count is None and buf[pos:pos+1] == (b"}" if is_object else b"]"):
+            return result, pos+1
+        if is_object:
+            key, pos = _ubj_value(buf, pos, b"S")
+            value, pos = _ubj_value(buf, pos, vtype)
+            result[key] = value
+        else:
+            value, pos = _ubj_value(buf, pos, vtype)
+            result.append(value)
+    return result, pos
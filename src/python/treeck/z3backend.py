@@ -18,7 +18,15 @@ class Z3Backend(VerifierBackend):
     ORDER_CONSTRAINTS_MAP = dict(
         [(eval(name), method) for (name, method) in ORDER_CONSTRAINTS])
 
-    def __init__(self):
+    def __init__(self, leaf_indicators=False, shared_splits=False):
+        """
+        If `leaf_indicators`, trees are encoded with one boolean per leaf
+        instead of nested `If` terms. If `shared_splits`, the split tests are
+        one boolean per distinct (feat_id, split_value), shared by all trees
+        (always the case with leaf indicators). See `DomTreeLeaf.to_smtlib`.
+        """
+        self.leaf_indicators = leaf_indicators
+        self.shared_splits = shared_splits
         self._ctx = z3.Context()
         self._solver = z3.Solver(ctx=self._ctx)
 
@@ -39,6 +47,18 @@ class Z3Backend(VerifierBackend):
     def simplify(self):
         pass
 
+    def reset(self):
+        self._solver.reset()
+
+    def add_smtlib(self, smtlib, variables):
+        self._solver.add(z3.parse_smt2_string(smtlib, decls=variables, ctx=self._ctx))
+
+    def push(self):
+        self._solver.push()
+
+    def pop(self):
+        self._solver.pop()
+
     def encode_leaf(self, tree_var, leaf_value):
         return (tree_var == leaf_value)
 
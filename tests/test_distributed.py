@@ -1,5 +1,5 @@
 #import matplotlib.pyplot as plt
-import unittest, json
+import unittest, json, math
 import numpy as np
 import z3
 import importlib
@@ -31,12 +31,16 @@ class TestDistributedVerifier(unittest.TestCase):
             N = 10
             at = AddTree.read("tests/models/xgb-img-easy.json")
             dt = DomTree(at, {})
-            dv = DistributedVerifier(client, dt, VFactory(),
+            with DistributedVerifier(client, dt, VFactory(),
                     check_paths = True,
                     num_initial_tasks = N,
-                    stop_when_num_sats = N)
-
-            dv.check()
+                    stop_when_num_sats = N) as dv:
+                client.restart() # restarted workers register the AddTree again
+                dv.check()
+            model_id = at.model_id
+            self.assertIsNone(AddTree.registered(model_id))
+            self.assertFalse(any(client.run(
+                lambda: AddTree.registered(model_id) is not None).values()))
             #print(json.dumps(dv.results, indent=2, default=str))
             count_with_status = 0
             count_with_sat = 0
@@ -131,6 +135,32 @@ class TestDistributedVerifier(unittest.TestCase):
             self.assertEqual(count_with_status, N)
             self.assertEqual(count_with_sat, 0)
 
+    def test_output_bounds(self):
+        class VFactory(VerifierFactory):
+            def __call__(self, lk, check_paths):
+                v = Verifier(lk, Backend())
+                v.add_constraint(v.fvar() < 0.0)
+                return v
+
+        with Client(dask_scheduler) as client:
+            client.restart()
+            N = 10
+            at = AddTree.read("tests/models/xgb-img-easy.json")
+            dt = DomTree(at, {})
+            dv = DistributedVerifier(client, dt, VFactory(),
+                    check_paths = False,
+                    num_initial_tasks = N,
+                    stop_when_num_sats = N,
+                    output_bounds = (-math.inf, 0.0))
+
+            dv.check()
+            count_by_bounds = 0
+            for k, d in dv.results.items():
+                if isinstance(k, int) and d.get("by_output_bounds", False):
+                    count_by_bounds += 1
+                    if d["status"].is_sat():
+                        self.assertLess(d["model"]["f"], 0.0)
+            self.assertGreater(count_by_bounds, 0)
 
     #def test_adv(self):
     #    instance_key = 0
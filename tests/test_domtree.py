@@ -121,6 +121,30 @@ class TestDomTree(unittest.TestCase):
         self.assertEqual(l0.score, l0c.score)
         self.assertEqual(l0.balance, l0c.balance)
 
+    def test_serialize_registered(self):
+        at = AddTree.read("tests/models/xgb-calhouse-hard.json")
+        dt = DomTree([(at, {}), (at, {0: RealDomain(0, 1)})])
+        l0 = dt.get_leaf(0);
+        l0.find_best_split()
+        nbytes1 = len(pickle.dumps(l0))
+
+        model_id = at.register()
+        try:
+            nbytes2 = len(pickle.dumps(l0))
+            self.assertLess(nbytes2, nbytes1 // 10)
+
+            l0c = pickle.loads(pickle.dumps(l0))
+            self.assertEqual(l0c.addtree(0).model_id, model_id)
+            self.assertEqual(l0c.get_domains(1), l0.get_domains(1))
+            self.assertEqual(l0c.num_unreachable(1), l0.num_unreachable(1))
+            self.assertEqual(l0c.get_best_split(), l0.get_best_split())
+
+            s = pickle.dumps(l0)
+        finally:
+            AddTree.unregister(model_id)
+        self.assertRaises(RuntimeError, pickle.loads, s)
+        self.assertEqual(len(pickle.dumps(l0)), nbytes1)
+
     def test_get_domains1(self):
         at = AddTree()
         at.base_score = 10
@@ -272,11 +296,76 @@ class TestDomTree(unittest.TestCase):
         self.assertFalse(l0_1.is_reachable(1, 0, 1))
         self.assertTrue( l0_1.is_reachable(1, 0, 2))
 
+        l0_2 = dt.get_leaf(0) # copies in l0_0 and l0_1 do not leak back
+        self.assertEqual(l0_2.num_unreachable(0), 0)
+        self.assertEqual(l0_2.num_unreachable(1), 0)
+
         l0_m = DomTreeLeaf.merge([l0_0, l0_1]);
         self.assertFalse(l0_m.is_reachable(0, 0, 2))
         self.assertFalse(l0_m.is_reachable(0, 0, 1))
         self.assertFalse(l0_m.is_reachable(1, 0, 2))
         self.assertFalse(l0_m.is_reachable(1, 0, 1))
+        self.assertEqual(l0_m.num_unreachable(0), 2)
+        self.assertEqual(l0_m.num_unreachable(1), 2)
+
+        l0_m.mark_unreachable(0, 0, 1) # already unreachable
+        l0_m.mark_unreachable(0, 0, 200)
+        self.assertEqual(l0_m.num_unreachable(0), 3)
+        self.assertFalse(l0_m.is_reachable(0, 0, 200))
+        self.assertTrue(l0_m.is_reachable(0, 0, 199))
+        self.assertTrue(l0_m.is_reachable(0, 5, 1))
+
+    def test_best_split_score(self):
+        # find_best_split's score must match count_unreachable_leafs
+        rng = np.random.RandomState(3)
+        at = AddTree()
+        for _ in range(6):
+            t = at.add_tree()
+            stack = [(t.root(), 5)]
+            while len(stack) > 0:
+                n, depth = stack.pop()
+                if depth == 0 or rng.rand() < 0.2:
+                    t.set_leaf_value(n, float(rng.randn()))
+                    continue
+                feat_id = rng.randint(4)
+                if feat_id == 3: t.split(n, feat_id)
+                else:            t.split(n, feat_id, float(rng.randint(5)))
+                stack += [(t.left(n), depth-1), (t.right(n), depth-1)]
+
+        dt = DomTree(at, {})
+        l0 = dt.get_leaf(0)
+        for tree_index in range(len(at)):
+            for n in range(1, at[tree_index].num_nodes()):
+                if rng.rand() < 0.1: l0.mark_unreachable(0, tree_index, n)
+
+        max_score = 0
+        for tree_index in range(len(at)):
+            t = at[tree_index]
+            for n in range(t.num_nodes()):
+                if not t.is_internal(n) or not l0.is_reachable(0, tree_index, t.left(n)) \
+                        or not l0.is_reachable(0, tree_index, t.right(n)):
+                    continue
+                split = t.get_split(n)
+                if isinstance(split, LtSplit):
+                    doms = [RealDomain(-math.inf, split.split_value),
+                            RealDomain(split.split_value, math.inf)]
+                else:
+                    doms = [BoolDomain(False), BoolDomain(True)]
+                score = sum(l0.count_unreachable_leafs(0, split.feat_id, d) for d in doms)
+                max_score = max(max_score, score)
+
+        l0.find_best_split()
+        self.assertEqual(l0.score, max_score)
+
+        l1 = dt.get_leaf(0)
+        for tree_index in range(len(at)):
+            for n in range(at[tree_index].num_nodes()):
+                if not l0.is_reachable(0, tree_index, n):
+                    l1.mark_unreachable(0, tree_index, n)
+        for nthreads in [2, 4, 0]:
+            l1.find_best_split(nthreads)
+            self.assertEqual(l1.get_best_split(), l0.get_best_split())
+            self.assertEqual((l1.score, l1.balance), (l0.score, l0.balance))
 
     def test_multi_instance(self):
         at = AddTree()
@@ -309,6 +398,40 @@ class TestDomTree(unittest.TestCase):
         self.assertEqual(l3.get_domains(1), {0: RealDomain(-math.inf, 2)})
         self.assertEqual(l4.get_domains(1), {0: RealDomain(-math.inf, 2)})
 
+    def test_nary_split(self):
+        at = AddTree()
+        t = at.add_tree();
+        t.split(t.root(), 0, 2)
+        t.split( t.left(t.root()), 0, 1)
+        t.split(t.right(t.root()), 1)
+        t.set_leaf_value( t.left( t.left(t.root())), 0.1)
+        t.set_leaf_value(t.right( t.left(t.root())), 0.2)
+        t.set_leaf_value( t.left(t.right(t.root())), 0.3)
+        t.set_leaf_value(t.right(t.right(t.root())), 0.4)
+
+        # several split values of one feature
+        dt = DomTree(at, {})
+        parts = dt.apply_leaf(dt.get_leaf(0),
+                [(0, LtSplit(0, 2)), (0, LtSplit(0, 1)), (0, LtSplit(0, 1.5))])
+        self.assertEqual(len(parts), 4)
+        self.assertEqual([dt.get_leaf(p).get_domains(0) for p in parts], [
+            {0: RealDomain(-math.inf, 1)}, {0: RealDomain(1, 1.5)},
+            {0: RealDomain(1.5, 2)}, {0: RealDomain(2, math.inf)}])
+        self.assertEqual([dt.get_leaf(p).num_unreachable(0) for p in parts], [2, 2, 2, 1])
+        self.assertFalse(dt.get_leaf(parts[0]).is_reachable(0, 0, 2))
+        self.assertTrue(dt.get_leaf(parts[3]).is_reachable(0, 0, 2))
+
+        # product of features
+        dt = DomTree(at, {})
+        parts = dt.apply_leaf(dt.get_leaf(0), [(0, LtSplit(0, 2)), (0, BoolSplit(1))])
+        self.assertEqual(len(parts), 4)
+        self.assertEqual(dt.get_leaf(parts[0]).get_domains(0),
+                {0: RealDomain(-math.inf, 2), 1: BoolDomain(True)})
+        self.assertEqual(dt.get_leaf(parts[3]).get_domains(0),
+                {0: RealDomain(2, math.inf), 1: BoolDomain(False)})
+        self.assertFalse(dt.get_leaf(parts[3]).is_reachable(0, 0, 5))
+        self.assertTrue(dt.get_leaf(parts[3]).is_reachable(0, 0, 6))
+
 
     #def _test_calhouse(self): # Prune removed
     #    at = AddTree.read("tests/models/xgb-calhouse-hard.json")
@@ -1,4 +1,5 @@
-import unittest
+import unittest, math
+import numpy as np
 
 from treeck import *
 
@@ -61,6 +62,165 @@ class TestGraph(unittest.TestCase):
         min_solutions = find.solutions()
         print(len(min_solutions))
 
+    def test_domtree_leaf(self):
+        at = AddTree()
+        at.base_score = 10
+        t = at.add_tree();
+        t.split(t.root(), 0, 2)
+        t.split( t.left(t.root()), 0, 1)
+        t.split(t.right(t.root()), 0, 3)
+        t.set_leaf_value( t.left( t.left(t.root())), 1.0)
+        t.set_leaf_value(t.right( t.left(t.root())), 2.0)
+        t.set_leaf_value( t.left(t.right(t.root())), 4.0)
+        t.set_leaf_value(t.right(t.right(t.root())), 8.0)
+        t = at.add_tree();
+        t.split(t.root(), 1)
+        t.set_leaf_value(t.left(t.root()), -1.0)
+        t.set_leaf_value(t.right(t.root()), 1.0)
+
+        graph = KPartiteGraph(at)
+        self.assertEqual(graph.num_vertices(), 6)
+        self.assertEqual(graph.propagate_outputs(), (0.0, 9.0))
+
+        dt = DomTree(at, {0: RealDomain(0.5, 2.5)})
+        l0 = dt.get_leaf(0)
+        l0.mark_unreachable(0, 1, 2) # x1 is true
+        graph = KPartiteGraph(l0, 0)
+        self.assertEqual(len(graph), 2)
+        self.assertEqual(graph.num_vertices(), 4) # leafs 1.0, 2.0, 4.0 | -1.0
+        self.assertEqual(graph.propagate_outputs(), (0.0, 3.0))
+
+        find = MaxKPartiteGraphFind(graph)
+        self.assertFalse(find.steps(100))
+        output, box = find.solutions()[0]
+        self.assertEqual(output, 3.0)
+        self.assertEqual(dict(box), {0: RealDomain(2, 2.5), 1: BoolDomain(True)})
+
+    def _random_addtree(self, seed, ntrees=6):
+        rng = np.random.RandomState(seed)
+        def grow(t, node, depth, doms):
+            feat_id = rng.randint(4)
+            lo, hi = doms[feat_id]
+            if depth == 0 or rng.rand() < 0.2 or hi - lo < 2:
+                t.set_leaf_value(node, float(rng.randint(-20, 20)))
+                return
+            value = rng.randint(lo + 1, hi) # keeps both children feasible
+            if feat_id == 3: t.split(node, 3)
+            else: t.split(node, feat_id, float(value))
+            grow(t, t.left(node), depth - 1, {**doms, feat_id: (lo, value)})
+            grow(t, t.right(node), depth - 1, {**doms, feat_id: (value, hi)})
+
+        at = AddTree()
+        for _ in range(ntrees):
+            t = at.add_tree()
+            grow(t, t.root(), 4, {0: (0, 5), 1: (0, 5), 2: (0, 5), 3: (0, 2)})
+
+        # one point per cell of the split values
+        g = np.arange(0.5, 5.0)
+        X = np.array([[x0, x1, x2, b] for x0 in g for x1 in g for x2 in g for b in [0, 1]])
+        return at, at.predict(X.astype(np.float32))
+
+    def test_random_trees(self):
+        at, outputs = self._random_addtree(1)
+
+        graph = KPartiteGraph(at)
+        lo, hi = graph.propagate_outputs()
+        self.assertLessEqual(lo, outputs.min())
+        self.assertGreaterEqual(hi, outputs.max())
+
+        find = MaxKPartiteGraphFind(graph)
+        while len(find.solutions()) == 0 and find.step(): pass
+        self.assertEqual(find.solutions()[0][0], outputs.max())
+        find = MinKPartiteGraphFind(graph)
+        while len(find.solutions()) == 0 and find.step(): pass
+        self.assertEqual(find.solutions()[0][0], outputs.min())
+
+        graph.merge(len(at))
+        self.assertEqual(graph.propagate_outputs(), (outputs.min(), outputs.max()))
+
+    def test_large_box(self):
+        at = AddTree()
+        t = at.add_tree();
+        node = t.root()
+        for feat_id in range(12, 0, -1): # more features than stored inline
+            t.split(node, feat_id, float(feat_id))
+            t.set_leaf_value(t.right(node), -1.0)
+            node = t.left(node)
+        t.set_leaf_value(node, 1.0)
+        t = at.add_tree();
+        t.split(t.root(), 0)
+        t.set_leaf_value(t.left(t.root()), 2.0)
+        t.set_leaf_value(t.right(t.root()), 3.0)
+
+        graph = KPartiteGraph(at)
+        find = MaxKPartiteGraphFind(graph)
+        self.assertFalse(find.steps(100))
+        output, box = find.solutions()[0]
+        self.assertEqual(output, 4.0)
+        self.assertEqual(box, [(0, BoolDomain(False))] +
+                [(f, RealDomain(-math.inf, f)) for f in range(1, 13)])
+
+    def test_find_stats(self):
+        at = AddTree()
+        for k in range(4):
+            t = at.add_tree();
+            t.split(t.root(), 0, 2 + k)
+            t.split( t.left(t.root()), 1, 1 + k)
+            t.set_leaf_value( t.left(t.left(t.root())), 1.0 * k)
+            t.set_leaf_value(t.right(t.left(t.root())), 2.0 - k)
+            t.set_leaf_value(t.right(t.root()), 0.5)
+
+        graph = KPartiteGraph(at)
+        find = MaxKPartiteGraphFind(graph)
+        calls = []
+        find.set_callback(lambda: calls.append(find.pq_size()), every=2)
+        self.assertFalse(find.steps(1000))
+
+        self.assertEqual(find.npops(), find.nsteps())
+        self.assertEqual(find.npushes(), find.npops()) # queue is empty
+        self.assertEqual(find.pq_size(), 0)
+        self.assertGreater(find.max_pq_size(), 1)
+        self.assertEqual(find.num_solutions(), len(find.solutions()))
+        self.assertEqual(len(calls), find.nsteps() // 2)
+        self.assertLessEqual(max(calls), find.max_pq_size())
+
+        find.set_callback(None)
+        find = MinKPartiteGraphFind(graph)
+        self.assertTrue(find.steps(2))
+        self.assertEqual(find.nsteps(), 2)
+
+    def test_find_budget(self):
+        at, outputs = self._random_addtree(2, ntrees=10)
+
+        graph = KPartiteGraph(at)
+        find = MaxKPartiteGraphFind(graph)
+        lo, hi = find.bounds()
+        self.assertEqual(lo, -math.inf)
+        self.assertGreaterEqual(hi, outputs.max())
+        while find.num_solutions() == 0:
+            self.assertTrue(find.steps(10)) # time slices
+            lo, hi = find.bounds()
+            self.assertGreaterEqual(hi, outputs.max())
+        self.assertEqual(find.bounds(), (outputs.max(), outputs.max()))
+        max_pq_size = find.max_pq_size()
+
+        self.assertGreater(max_pq_size, 20)
+
+        for budget in [2, 5, 20]:
+            # a find sorts the graph it refers to: construct right before use
+            for Find, best in [(MaxKPartiteGraphFind, outputs.max()),
+                               (MinKPartiteGraphFind, outputs.min())]:
+                find = Find(graph)
+                find.set_pq_budget(budget)
+                while find.steps(10):
+                    lo, hi = find.bounds()
+                    self.assertTrue(lo <= best <= hi)
+                lo, hi = find.bounds()
+                self.assertTrue(lo <= best <= hi)
+                self.assertLessEqual(find.max_pq_size(), budget)
+                self.assertGreater(find.npruned(), 0)
+                self.assertGreater(find.num_solutions(), 0)
+
     def test_calhouse(self):
         at = AddTree.read("tests/models/xgb-calhouse-easy.json")
 
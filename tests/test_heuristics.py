@@ -0,0 +1,108 @@
+import unittest, math
+
+from treeck import *
+from treeck.heuristics import UnreachableLeafsHeuristic, TreeBoundsHeuristic
+from treeck.heuristics import FeatureFrequencyHeuristic, LearnedHeuristic
+
+class TestHeuristics(unittest.TestCase):
+    def _addtree(self):
+        at = AddTree()
+        t = at.add_tree();
+        t.split(t.root(), 0, 2)
+        t.split( t.left(t.root()), 1, 1)
+        t.split(t.right(t.root()), 1, 1)
+        t.set_leaf_value( t.left( t.left(t.root())), 0.0)
+        t.set_leaf_value(t.right( t.left(t.root())), 1.0)
+        t.set_leaf_value( t.left(t.right(t.root())), 2.0)
+        t.set_leaf_value(t.right(t.right(t.root())), 10.0)
+        t = at.add_tree();
+        t.split(t.root(), 1, 1)
+        t.split(t.right(t.root()), 2)
+        t.set_leaf_value( t.left(t.root()), 0.0)
+        t.set_leaf_value( t.left(t.right(t.root())), 0.5)
+        t.set_leaf_value(t.right(t.right(t.root())), 0.7)
+        return at
+
+    def test_candidates(self):
+        at = self._addtree()
+        l0 = DomTree(at, {}).get_leaf(0)
+        candidates = l0.get_split_candidates()
+        self.assertEqual(candidates, [
+            (0, LtSplit(0, 2), 1), (0, LtSplit(1, 1), 3), (0, BoolSplit(2), 1)])
+
+        splits = [(i, s) for i, s, _ in candidates]
+        for (i, s), (ul, ur) in zip(splits, l0.count_unreachable_leafs(splits)):
+            if isinstance(s, LtSplit):
+                dl, dr = RealDomain(-math.inf, s.split_value), RealDomain(s.split_value, math.inf)
+            else:
+                dl, dr = BoolDomain(False), BoolDomain(True)
+            self.assertEqual(ul + ur, l0.count_unreachable_leafs(i, s.feat_id, dl)
+                    + l0.count_unreachable_leafs(i, s.feat_id, dr))
+
+        self.assertAlmostEqual(l0.sum_tree_bounds_width(0), 10.0 + 0.7, places=5)
+        wl, wr = l0.sum_tree_bounds_width([(0, LtSplit(1, 1))])[0]
+        self.assertAlmostEqual(wl, 2.0, places=5) # leafs 0.0, 2.0 | 0.0
+        self.assertAlmostEqual(wr, 9.0 + 0.2, places=5) # leafs 1.0, 10.0 | 0.5, 0.7
+
+        # only the trees splitting on the feature are walked again
+        for (i, s), (wl, wr) in zip(splits, l0.sum_tree_bounds_width(splits)):
+            dl, dr = ((RealDomain(-math.inf, s.split_value), RealDomain(s.split_value, math.inf))
+                    if isinstance(s, LtSplit) else (BoolDomain(True), BoolDomain(False)))
+            self.assertAlmostEqual(wl, l0.sum_tree_bounds_width(i, s.feat_id, dl), places=5)
+            self.assertAlmostEqual(wr, l0.sum_tree_bounds_width(i, s.feat_id, dr), places=5)
+
+    def test_heuristics(self):
+        at = self._addtree()
+        dt = DomTree(at, {})
+
+        h = UnreachableLeafsHeuristic()
+        l0 = dt.get_leaf(0)
+        self.assertEqual(h(l0), 7)
+        self.assertEqual(l0.get_best_split(), (0, LtSplit(1, 1)))
+        self.assertGreaterEqual(h.score_time, 0.0)
+
+        h = TreeBoundsHeuristic(nthreads=2)
+        l0 = dt.get_leaf(0)
+        self.assertAlmostEqual(h(l0), 2 * 10.7 - 1.7 - 8.7, places=5)
+        self.assertEqual(l0.get_best_split(), (0, LtSplit(0, 2)))
+
+        h = FeatureFrequencyHeuristic()
+        l0 = dt.get_leaf(0)
+        self.assertEqual(h(l0), 3)
+        self.assertEqual(l0.get_best_split(), (0, LtSplit(1, 1)))
+
+        h = LearnedHeuristic()
+        for _ in range(10):
+            h.feedback((0, LtSplit(1, 1)), False)
+            h.feedback((0, LtSplit(0, 2)), True)
+        l0 = dt.get_leaf(0)
+        h(l0)
+        self.assertEqual(l0.get_best_split(), (0, LtSplit(0, 2)))
+
+        dt.apply_leaf(l0)
+        self.assertEqual(dt.tree().get_split(0), (0, LtSplit(0, 2)))
+
+    def test_find_best_splits(self):
+        at = self._addtree()
+        dt = DomTree(at, {})
+        h = UnreachableLeafsHeuristic()
+        l0 = dt.get_leaf(0)
+        h(l0)
+        splits = h.find_best_splits(l0, 4)
+        self.assertEqual(splits, [(0, LtSplit(1, 1)), (0, LtSplit(0, 2))])
+        self.assertEqual(h.find_best_splits(l0, 3), [(0, LtSplit(1, 1))])
+        self.assertEqual(dt.apply_leaf(l0, splits), [3, 4, 5, 6])
+
+        t = at.add_tree()
+        t.split(t.root(), 0, 1)
+        t.split(t.right(t.root()), 0, 3)
+        dt = DomTree(at, {})
+        l0 = dt.get_leaf(0)
+        l0.set_best_split((0, LtSplit(0, 2)))
+        splits = h.find_best_splits(l0, 3, same_feature=True)
+        self.assertEqual(splits[0], (0, LtSplit(0, 2)))
+        self.assertEqual(len(splits), 2)
+        self.assertEqual(len(dt.apply_leaf(l0, splits)), 3)
+
+if __name__ == "__main__":
+    unittest.main()
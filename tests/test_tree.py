@@ -1,4 +1,5 @@
-import unittest, pickle, math
+import unittest, pickle, math, os, struct, tempfile, threading
+import numpy as np
 from treeck import *
 
 class TestTree(unittest.TestCase):
@@ -82,7 +83,7 @@ class TestTree(unittest.TestCase):
             [0.0, 0.5, True], [0.0, 1.5, True],
             [2.5, 0.5, True], [2.5, 0.5, False]])
 
-        self.assertEqual(y, [1.0, 2.0, 4.0, 8.0])
+        self.assertEqual(list(y), [1.0, 2.0, 4.0, 8.0])
 
         types = AddTreeFeatureTypes(at)
         self.assertEqual(types[0], LtSplit)
@@ -96,6 +97,115 @@ class TestTree(unittest.TestCase):
         self.assertEqual(t.get_split( t.left(t.root())), LtSplit(1, 1.0))
         self.assertEqual(t.get_split(t.right(t.root())), BoolSplit(2))
 
+    def test_predict_numpy(self):
+        at = AddTree()
+        at.base_score = 0.5
+        t = at.add_tree()
+        t.split(t.root(), 0, 2.0)
+        t.split(t.right(t.root()), 1)
+        t.set_leaf_value(t.left(t.root()), 1.0)
+        t.set_leaf_value(t.left(t.right(t.root())), 2.0)
+        t.set_leaf_value(t.right(t.right(t.root())), 4.0)
+        t = at.add_tree()
+        t.split(t.root(), 2, -1.0)
+        t.set_leaf_value(t.left(t.root()), 8.0)
+        t.set_leaf_value(t.right(t.root()), 16.0)
+
+        X = np.array([[1.0, 0.0, -2.0], [3.0, 1.0, 0.0], [3.0, 0.0, -1.0]])
+        expected = [at.predict_single(x) for x in X]
+        for dtype in [np.float64, np.float32]:
+            y = at.predict(X.astype(dtype))
+            self.assertIsInstance(y, np.ndarray)
+            self.assertEqual(y.shape, (3,))
+            self.myAssertAlmostEqual(list(map(float, y)), expected)
+
+        self.assertEqual(list(at.predict(np.zeros((0, 3)))), [])
+
+        # threaded: split over rows, and over trees when rows < nthreads
+        Xr = np.random.uniform(-3.0, 3.0, size=(101, 3))
+        yr = at.predict(Xr)
+        self.assertTrue(np.allclose(at.predict(Xr, nthreads=4), yr))
+        self.assertTrue(np.allclose(at.predict(Xr[:1], nthreads=4), yr[:1]))
+        self.assertTrue(np.allclose(at.predict(Xr, nthreads=0), yr))
+        self.assertRaises(RuntimeError, at.predict, Xr[:, 0:2], nthreads=4)
+        self.assertRaises(RuntimeError, at.predict, X[:, 0:2]) # feat_id 2 out of bounds
+        self.assertRaises(RuntimeError, at.predict, X[0])      # not 2-D
+
+        # the compiled trees are cached: mutations must be seen
+        at.base_score = 1.5
+        t.set_leaf_value(t.right(t.root()), 32.0)
+        self.myAssertAlmostEqual(list(map(float, at.predict(X))),
+                [e + 1.0 + 16.0 * float(x[2] >= -1.0) for e, x in zip(expected, X)])
+
+        # concurrent predictions share the cached compiled trees
+        ys = [None] * 4
+        def predict(k):
+            for _ in range(50): ys[k] = at.predict(Xr, nthreads=2)
+        threads = [threading.Thread(target=predict, args=(k,)) for k in range(4)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        for y in ys:
+            self.assertTrue(np.allclose(y, at.predict(Xr)))
+
+    def test_predict_leafs(self):
+        at = AddTree()
+        t = at.add_tree()
+        t.split(t.root(), 0, 2.0)
+        t.split(t.right(t.root()), 1)
+        t.set_leaf_value(t.left(t.root()), 1.0)
+        t.set_leaf_value(t.left(t.right(t.root())), 2.0)
+        t.set_leaf_value(t.right(t.right(t.root())), 4.0)
+        t = at.add_tree()
+        t.split(t.root(), 0, 1.0)
+        t.set_leaf_value(t.left(t.root()), 8.0)
+        t.set_leaf_value(t.right(t.root()), 16.0)
+
+        X = np.array([[0.0, 0.0], [3.0, 1.0], [3.0, 0.0]])
+        leafs = at.predict_leafs(X)
+        self.assertEqual(leafs.dtype, np.int32)
+        self.assertEqual(leafs.shape, (3, 2))
+        self.assertEqual(leafs.tolist(), [[1, 1], [3, 2], [4, 2]])
+        self.assertEqual(at.predict_leafs(X, nthreads=2).tolist(), leafs.tolist())
+        for x, l in zip(X, leafs):
+            self.assertEqual([tree.predict_leaf(x) for tree in at], list(l))
+
+        families = at.get_domains(leafs)
+        self.assertEqual(len(families), 3)
+        self.assertEqual(families[0], {0: RealDomain(-math.inf, 1.0)})
+        self.assertEqual(families[1], {0: RealDomain(2.0, math.inf), 1: BoolDomain(True)})
+        self.assertEqual(families[2], {0: RealDomain(2.0, math.inf), 1: BoolDomain(False)})
+        self.assertEqual(families[1], at.get_domains(list(leafs[1])))
+        self.assertRaises(RuntimeError, at.get_domains, leafs[:, 0:1])
+
+    def test_compiled_addtree(self):
+        at = AddTree()
+        at.base_score = -1.0
+        t = at.add_tree()
+        t.split(t.root(), 0, 2.0)
+        t.split(t.left(t.root()), 1, 1.0)
+        t.split(t.right(t.root()), 2)
+        t.set_leaf_value(t.left(t.left(t.root())), 1.0)
+        t.set_leaf_value(t.right(t.left(t.root())), 2.0)
+        t.set_leaf_value(t.left(t.right(t.root())), 4.0)
+        t.set_leaf_value(t.right(t.right(t.root())), 8.0)
+        t = at.add_tree()
+        t.split(t.root(), 1, 0.5)
+        t.set_leaf_value(t.left(t.root()), 0.25)
+        t.set_leaf_value(t.right(t.root()), 0.5)
+
+        cat = at.compile()
+        self.assertEqual(len(cat), 2)
+        self.assertEqual(cat.num_nodes(), at.num_nodes())
+        self.assertEqual(cat.base_score, at.base_score)
+
+        X = np.array([[0.0, 0.5, 1.0], [0.0, 1.5, 1.0],
+                      [2.5, 0.5, 1.0], [2.5, 0.0, 0.0]], dtype=np.float32)
+        self.assertEqual(list(cat.predict(X)), [0.5, 1.5, 3.5, 7.25])
+        self.assertEqual(list(cat.predict(X)), list(at.predict(X)))
+        self.assertEqual(cat.predict_leafs(X).tolist(), at.predict_leafs(X).tolist())
+        self.assertEqual(cat.predict_leafs(X).tolist(), [[3, 2], [4, 2], [5, 2], [6, 1]])
+        self.assertRaises(RuntimeError, cat.predict, X[:, 0:2])
+
     def test_at_feature_types(self):
         at = AddTree()
         t = at.add_tree()
@@ -103,6 +213,52 @@ class TestTree(unittest.TestCase):
         t.split(t.left(t.root()), 0) # bool split
         self.assertRaises(Exception, AddTreeFeatureTypes, at)
 
+    def test_addtree_meta(self):
+        at = AddTree()
+        t = at.add_tree()
+        t.split(t.root(), 3, 1.5)
+        t.split(t.left(t.root()), 1)
+        t.set_leaf_value(t.left(t.left(t.root())), -1.0)
+        t.set_leaf_value(t.right(t.left(t.root())), 2.0)
+        t.set_leaf_value(t.right(t.root()), 0.5)
+        t = at.add_tree()
+        t.set_leaf_value(t.root(), 4.0)
+
+        self.assertEqual(at.feat_types, {1: BoolSplit, 3: LtSplit})
+        self.assertEqual(at.feat_ids, [1, 3])
+        self.assertEqual(at.leaf_counts, [3, 1])
+        self.assertEqual(at.min_leaf_values, [-1.0, 4.0])
+        self.assertEqual(at.max_leaf_values, [2.0, 4.0])
+        self.assertEqual(list(AddTreeFeatureTypes(at)), [(1, BoolSplit), (3, LtSplit)])
+
+        t.split(t.root(), 0, 2.0) # mutation invalidates the cache
+        t.set_leaf_value(t.left(t.root()), -3.0)
+        self.assertEqual(at.feat_ids, [0, 1, 3])
+        self.assertEqual(at.leaf_counts, [3, 2])
+        self.assertEqual(at.min_leaf_values, [-1.0, -3.0])
+        self.assertRaises(AttributeError, setattr, at, "feat_ids", [])
+
+    def test_model_id(self):
+        def make(value):
+            at = AddTree()
+            t = at.add_tree()
+            t.split(t.root(), 0, 1.5)
+            t.set_leaf_value(t.left(t.root()), value)
+            t.set_leaf_value(t.right(t.root()), 2.0)
+            return at
+        at1, at2 = make(1.0), make(1.0)
+        self.assertEqual(at1.model_id, at2.model_id)
+        self.assertNotEqual(at1.model_id, make(1.5).model_id)
+        at2.base_score = 1.0
+        self.assertNotEqual(at1.model_id, at2.model_id)
+
+        model_id = at1.register()
+        self.assertEqual(model_id, at1.model_id)
+        self.assertEqual(AddTree.registered(model_id).model_id, model_id)
+        self.assertTrue(AddTree.unregister(model_id))
+        self.assertFalse(AddTree.unregister(model_id))
+        self.assertIsNone(AddTree.registered(model_id))
+
     def test_addtree_get_splits(self):
         at = AddTree()
         t = at.add_tree()
@@ -186,6 +342,69 @@ class TestTree(unittest.TestCase):
         self.assertAlmostEqual(t.get_leaf_value(t.left(t.root())), 0.45)
         self.assertAlmostEqual(t.get_leaf_value(t.right(t.root())), 2.2)
 
+    def test_binary(self):
+        at = AddTree()
+        at.base_score = 0.5
+        t = at.add_tree()
+        t.split(t.root(), 1, 1.5)
+        t.split(t.left(t.root()), 2, 0.12)
+        t.split(t.right(t.root()), 0)
+        t.set_leaf_value(t.left(t.left(t.root())), 0.25)
+        t.set_leaf_value(t.right(t.left(t.root())), 0.45)
+        t.set_leaf_value(t.left(t.right(t.root())), 2.2)
+        t.set_leaf_value(t.right(t.right(t.root())), 3.3)
+        t.skip_branch(t.left(t.left(t.root()))) # leaves unused nodes behind
+        t = at.add_tree()
+        t.set_leaf_value(t.root(), -1.0)
+
+        X = np.array([[0, 1, 0], [0, 2, 0], [1, 2, 0]], dtype=np.float32)
+        with tempfile.TemporaryDirectory() as d:
+            f = os.path.join(d, "model.bin")
+            at.save_binary(f)
+            for mmap in [True, False]:
+                att = AddTree.load_binary(f, mmap=mmap)
+                self.assertEqual(len(att), len(at))
+                self.assertEqual(att.num_nodes(), at.num_nodes())
+                self.assertEqual(att.base_score, at.base_score)
+                self.assertEqual(str(att), str(at))
+                self.assertEqual(list(att.predict(X)), list(at.predict(X)))
+
+            # modifying a mapped tree copies its nodes, the file is unchanged
+            att = AddTree.load_binary(f, mmap=True)
+            t = att[1]
+            t.split(t.root(), 0, 0.5)
+            t.set_leaf_value(t.left(t.root()), 1.0)
+            self.assertEqual(list(att.predict(X)), list(at.predict(X) + np.array([2.0, 2.0, 1.0], dtype=np.float32)))
+            self.assertEqual(str(AddTree.load_binary(f)), str(at))
+
+            # corrupt node records: 32-byte header, 3 probe nodes, 2 node
+            # counts, then the nodes (id, parent, tree_size, left, ...)
+            with open(f, "rb") as fh:
+                data = fh.read()
+            node_size = struct.unpack("=I", data[20:24])[0]
+            pad = lambda n: (n + 7) // 8 * 8
+            root = 32 + pad(3 * node_size) + 8
+            for offset, value in [(root + 12, 100),          # left out of bounds
+                                  (root + 8, 99),            # root tree_size
+                                  (root + node_size + 4, 5), # parent of node 1
+                                  (root + node_size, 7),     # id of node 1
+                                  (32 + 4, 3)]:              # probe node parent
+                with open(f, "wb") as fh:
+                    fh.write(data[:offset] + struct.pack("=i", value) + data[offset+4:])
+                for mmap in [True, False]:
+                    self.assertRaises(RuntimeError, AddTree.load_binary, f, mmap)
+            with open(f, "wb") as fh:
+                fh.write(data[:-node_size]) # truncated
+            self.assertRaises(RuntimeError, AddTree.load_binary, f)
+
+            with open(f, "r+b") as fh:
+                fh.write(b"X")
+            self.assertRaises(RuntimeError, AddTree.load_binary, f)
+            with open(f, "wb") as fh:
+                pass
+            self.assertRaises(RuntimeError, AddTree.load_binary, f, True)
+            self.assertRaises(RuntimeError, AddTree.load_binary, f, False)
+
     def test_pickle(self):
         at = AddTree.read("tests/models/xgb-covtype-easy.json")
         att = pickle.loads(pickle.dumps(at))
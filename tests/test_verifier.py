@@ -6,6 +6,7 @@ import z3
 
 from treeck import *
 from treeck.verifier import Verifier, not_in_domain_constraint, in_domain_constraint
+from treeck.verifier import VerifierBackend
 from treeck.z3backend import Z3Backend as Backend
 
 class TestVerifier(unittest.TestCase):
@@ -60,6 +61,170 @@ class TestVerifier(unittest.TestCase):
         self.assertEqual(v.check(v.fvar() < 0.41), Verifier.Result.SAT)
         self.assertEqual(v.check(v.fvar() > 0.41), Verifier.Result.UNSAT)
 
+        self.assertEqual(v.model_family({"xs": {0: 2.5, 3: 1.0}}), {0: RealDomain(2, 3)})
+        self.assertRaises(RuntimeError, v.model_family, {"xs": {3: 1.0}})
+        self.assertRaises(RuntimeError, v.model_family, {"xs": {0: None}})
+
+    def test_reset(self):
+        at = AddTree()
+        t = at.add_tree();
+        t.split(t.root(), 0, 2)
+        t.set_leaf_value( t.left(t.root()), 0.1)
+        t.set_leaf_value(t.right(t.root()), 0.4)
+
+        dt = DomTree(at, {})
+        l0 = dt.get_leaf(dt.tree().root())
+        v = Verifier(l0, Backend())
+        v.add_rvar("r")
+        v.add_constraint(v.rvar("r") == v.xvar(0))
+        v.add_all_trees()
+        self.assertEqual(v.check(v.fvar() > 0.3), Verifier.Result.SAT)
+        xvar, rvar = v.xvar(0).get(), v.rvar("r").get()
+
+        l0.find_best_split()
+        dt.apply_leaf(l0)
+        v.reset(dt.get_leaf(1)) # x0 < 2
+        self.assertEqual(v.nchecks, 0)
+        self.assertIs(v.xvar(0).get(), xvar)
+        self.assertIs(v.rvar("r").get(), rvar)
+        v.add_constraint(in_domain_constraint(v, v._lk.get_domains(0), 0))
+        v.add_all_trees()
+        self.assertEqual(v.check(v.fvar() > 0.3), Verifier.Result.UNSAT)
+        self.assertEqual(v.check(v.fvar() < 0.3), Verifier.Result.SAT)
+
+        at2 = AddTree()
+        at2.add_tree().set_leaf_value(0, 1.0)
+        self.assertRaises(RuntimeError, v.reset, DomTree(at2, {}).get_leaf(0))
+
+    def test_interval_prefilter(self):
+        at = AddTree()
+        t = at.add_tree();
+        t.split(t.root(), 0, 2)
+        t.split( t.left(t.root()), 0, 1)
+        t.split(t.right(t.root()), 1)
+        t.split(t.left(t.right(t.root())), 0, 3)
+        for n, value in zip([3, 4, 6, 7, 8], [0.1, 0.2, 0.3, 0.4, 0.5]):
+            t.set_leaf_value(n, value)
+
+        def run(bounds_as_verifier_exprs):
+            dt = DomTree(at, {})
+            l0 = dt.get_leaf(dt.tree().root())
+            v = Verifier(l0, Backend())
+            x0, x1 = v.xvar(0), v.xvar(1)
+            if bounds_as_verifier_exprs: # collected as bounds
+                v.add_constraint((x0 > 1.5) & (x0 <= 2.9) & x1)
+            else: # raw z3: only the solver knows
+                v.add_constraint(z3.And(x0.get() > 1.5, x0.get() <= 2.9, x1.get()))
+            v.instance(0).mark_unreachable_paths(0)
+            return v.nchecks, [l0.is_reachable(0, 0, n) for n in range(9)]
+
+        nchecks0, reachable0 = run(False)
+        nchecks1, reachable1 = run(True)
+        self.assertEqual(reachable0, reachable1)
+        self.assertEqual(reachable1, [True, True, True, False, True, True, False, True, False])
+        self.assertLess(nchecks1, nchecks0)
+
+    def test_real_bounds(self):
+        from treeck.verifier import _real_bound, VerifierLtExpr, VerifierLeExpr, VerifierEqExpr
+        lo, hi = _real_bound(VerifierLtExpr, 0.1)
+        self.assertGreaterEqual(hi, 0.1)
+        self.assertEqual(np.float32(hi), hi)
+        lo, hi = _real_bound(VerifierLeExpr, 2.0)
+        self.assertGreater(hi, 2.0)
+        lo, hi = _real_bound(VerifierEqExpr, 0.1)
+        self.assertLessEqual(lo, 0.1)
+        self.assertGreater(hi, 0.1)
+
+    def test_native_encoding(self):
+        at = AddTree()
+        at.base_score = 0.5
+        t = at.add_tree();
+        t.split(t.root(), 0, 0.1)
+        t.split( t.left(t.root()), 1)
+        t.split(t.right(t.root()), 0, 3)
+        t.split(t.right(t.right(t.root())), 2, -2.5)
+        for n, value in zip([3, 4, 5, 7, 8], [-0.3, 1e-7, 3.0, -1e20, 0.7]):
+            t.set_leaf_value(n, value)
+        t = at.add_tree();
+        t.split(t.root(), 2, 4)
+        t.set_leaf_value(1, 1.0)
+        t.set_leaf_value(2, -1.0)
+
+        dt = DomTree(at, {})
+        l0 = dt.get_leaf(0)
+        l0.mark_unreachable(0, 0, 3)
+        l0.mark_unreachable(0, 0, 8)
+
+        v = Verifier(l0, Backend())
+        v.add_all_trees() # native encoding
+        self.assertEqual(v.instance(0).leaf_count, 5)
+
+        class PythonBackend(Backend): # node by node encoding
+            add_smtlib = VerifierBackend.add_smtlib
+        v2 = Verifier(l0, PythonBackend())
+        v2.add_all_trees()
+        self.assertEqual(v2.instance(0).leaf_count, 5)
+
+        # same variable names in both, the encodings must be equivalent
+        enc1 = z3.And(*v._backend._solver.assertions())
+        enc2 = z3.And(*v2._backend._solver.assertions()).translate(v._backend._ctx)
+        s = z3.Solver(ctx=v._backend._ctx)
+        s.add(enc1 != enc2)
+        self.assertEqual(s.check(), z3.unsat)
+
+        self.assertEqual(v.check(v.fvar() < -1e19), Verifier.Result.SAT)
+        self.assertEqual(v.check(v.xvar(1)), Verifier.Result.SAT)
+        self.assertEqual(v.check(v.xvar(1), v.xvar(0) < 0.1), Verifier.Result.UNSAT) # leaf 3
+        self.assertEqual(v.check(v.wvar(0) == -0.3), Verifier.Result.UNSAT)
+
+    def test_alternative_encodings(self):
+        at = AddTree()
+        t = at.add_tree();
+        t.split(t.root(), 0, 2)
+        t.split( t.left(t.root()), 1)
+        t.split(t.right(t.root()), 0, 3)
+        for n, value in zip([3, 4, 5, 6], [0.1, 0.2, 0.3, 0.4]):
+            t.set_leaf_value(n, value)
+        t = at.add_tree();
+        t.split(t.root(), 0, 3)
+        t.split(t.left(t.root()), 0, 2)
+        for n, value in zip([2, 3, 4], [-1.0, 1.0, 2.0]):
+            t.set_leaf_value(n, value)
+
+        dt = DomTree(at, {})
+        l0 = dt.get_leaf(0)
+        l0.mark_unreachable(0, 0, 6)
+
+        v1 = Verifier(l0, Backend())
+        v1.add_all_trees()
+        v2 = Verifier(l0, Backend(leaf_indicators=True))
+        v2.add_all_trees()
+        self.assertEqual(v2.instance(0).leaf_count, 6)
+        v3 = Verifier(l0, Backend(shared_splits=True))
+        v3.add_all_trees()
+
+        smtlib, _ = l0.to_smtlib(0, [0, 1], leaf_indicators=True)
+        self.assertEqual(smtlib.count("(declare-const s0_"), 2) # x0<2, x0<3 shared
+        smtlib, _ = l0.to_smtlib(0, [0, 1], shared_splits=True)
+        self.assertEqual(smtlib.count("(declare-const s0_"), 2)
+        self.assertEqual(smtlib.count("(< x0 "), 2)
+        self.assertEqual(smtlib.count("(assert (=> s0_40000000_0 s0_40400000_0))"), 1)
+
+        # both encodings imply the if-then-else encoding
+        for v in [v2, v3]:
+            enc1 = z3.And(*v1._backend._solver.assertions()).translate(v._backend._ctx)
+            self.assertEqual(v._backend._solver.check(z3.Not(enc1)), z3.unsat)
+
+        for v in [v1, v2, v3]:
+            self.assertEqual(v.check(v.fvar() > 2.35), Verifier.Result.UNSAT) # leaf 6
+            self.assertEqual(v.check(v.fvar() > 2.25), Verifier.Result.SAT)
+            model = v.model()
+            self.assertAlmostEqual(model["f"], 2.3, places=5)
+            self.assertEqual(v.check(v.xvar(0) < 2, v.wvar(1) == 2.0), Verifier.Result.UNSAT)
+            self.assertEqual(v.check(v.fvar() < 1.0), Verifier.Result.UNSAT) # x0 >= 3
+            self.assertEqual(v.check(v.xvar(1), v.fvar() < 1.15), Verifier.Result.SAT)
+            self.assertEqual(v.check(v.xvar(1), v.xvar(0) < 2, v.fvar() > 1.15), Verifier.Result.UNSAT)
+
     #def test_family(self):
     #    at = AddTree()
     #    t = at.add_tree();
@@ -106,7 +271,11 @@ class TestVerifier(unittest.TestCase):
         self.assertFalse(l0.is_reachable(0, 0, 2))
         self.assertTrue( l0.is_reachable(1, 0, 2))
 
+        nassertions = len(v._backend._solver.assertions())
         v.instance(1).mark_unreachable_paths(0)
+        self.assertEqual(v._backend._solver.num_scopes(), 0) # all pushes popped
+        self.assertEqual(len(v._backend._solver.assertions()), nassertions)
+        self.assertEqual(v.nchecks, 4) # both children of root and of its left child
 
         v.add_constraint(v.xvar(0, instance=1) < 1.0)
 
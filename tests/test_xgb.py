@@ -0,0 +1,79 @@
+import unittest, json
+import numpy as np
+import xgboost as xgb
+
+from treeck import *
+from treeck.xgb import addtree_from_xgb_json
+
+class TestXgb(unittest.TestCase):
+
+    def _data(self):
+        np.random.seed(5)
+        X = np.random.rand(200, 4).astype(np.float32)
+        X[:, 3] = X[:, 3] > 0.5
+        y = X[:, 0] + X[:, 3] + X[:, 1] * X[:, 2]
+        return X, y
+
+    def test_regression(self):
+        X, y = self._data()
+        dm = xgb.DMatrix(X, y, feature_types=["q", "q", "q", "i"])
+        booster = xgb.train({"max_depth": 3}, dm, 10)
+        margin = booster.predict(dm, output_margin=True)
+
+        for model in [booster, booster.save_raw("json"), booster.save_raw("ubj"),
+                json.loads(booster.save_raw("json"))]:
+            at = addtree_from_xgb_json(model)
+            self.assertEqual(len(at), 10)
+            self.assertTrue(np.allclose(at.predict(X), margin, atol=1e-5))
+
+        at = addtree_from_xgb_json(booster, feat2id_map=lambda n: 10 + int(n[1:]))
+        self.assertEqual(set(at.get_splits().keys()) - {10, 11, 12, 13}, set())
+
+    def test_objectives(self):
+        X, y = self._data()
+        dm = xgb.DMatrix(X, y)
+        for objective in ["count:poisson", "reg:gamma", "binary:logistic"]:
+            label = y > y.mean() if objective == "binary:logistic" else y
+            dm.set_label(label.astype(np.float32))
+            booster = xgb.train({"max_depth": 3, "objective": objective}, dm, 10)
+            margin = booster.predict(dm, output_margin=True)
+            at = addtree_from_xgb_json(booster)
+            self.assertTrue(np.allclose(at.predict(X), margin, atol=1e-5))
+
+        model = json.loads(booster.save_raw("json"))
+        model["learner"]["objective"]["name"] = "reg:unknown"
+        self.assertRaises(RuntimeError, addtree_from_xgb_json, model)
+
+    def test_indicator_threshold(self):
+        X, y = self._data()
+        dm = xgb.DMatrix(X, y, feature_types=["q", "q", "q", "i"])
+        booster = xgb.train({"max_depth": 3}, dm, 10)
+        self.assertEqual(addtree_from_xgb_json(booster).get_splits()[3], []) # BoolSplit
+
+        # a split of the indicator that does not separate 0 from 1: LtSplits
+        model = json.loads(booster.save_raw("json"))
+        tree = model["learner"]["gradient_booster"]["model"]["trees"][0]
+        node = next(i for i, (f, l) in enumerate(zip(tree["split_indices"],
+            tree["left_children"])) if f == 3 and l != -1)
+        tree["split_conditions"][node] = 1.5
+        booster = xgb.Booster(model_file=bytearray(json.dumps(model).encode()))
+        margin = booster.predict(dm, output_margin=True)
+
+        at = addtree_from_xgb_json(model)
+        self.assertIn(1.5, at.get_splits()[3])
+        self.assertTrue(np.allclose(at.predict(X), margin, atol=1e-5))
+
+    def test_multiclass(self):
+        X, y = self._data()
+        dm = xgb.DMatrix(X, (y * 3).astype(int) % 3)
+        booster = xgb.train({"max_depth": 3, "objective": "multi:softprob",
+            "num_class": 3}, dm, 5)
+        margin = booster.predict(dm, output_margin=True)
+
+        for c in range(3):
+            at = addtree_from_xgb_json(booster.save_raw("ubj"), multiclass=(c, 3))
+            self.assertEqual(len(at), 5)
+            self.assertTrue(np.allclose(at.predict(X), margin[:, c], atol=1e-5))
+
+if __name__ == "__main__":
+    unittest.main()